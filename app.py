@@ -1,18 +1,33 @@
+import abc
 import asyncio
-import threading
-from queue import Queue
-from typing import List, Optional
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 import sys
 import psutil
 import math
 
 from database import *
-from modules.pinterest import PinterestCrawler
+from modules.pinterest import FAILURE_ERROR, PinterestCrawler, crawl_stats
+from modules.browser_pool import BrowserPool
+from modules.profile_fetcher import ProfileHttpFetcher
+from modules.search_fetcher import SearchHttpFetcher
+from modules.avatar_pipeline import AvatarPipeline
+from modules.rate_control import AdaptiveLimiter, share_rate
+from modules.retry_queue import RetryQueue
+from modules.supervisor import Supervisor, run_child
+from modules.index_manager import explain_indexes
+from modules.metrics import MetricsExporter, add_progress, metrics
+from modules.scheduler import RefreshLease
+from modules.work_lease import WorkLease
+from modules.write_buffer import WriteBuffer
+from modules.write_journal import WriteJournal
 from modules.keyword_manager import *
+from modules.keyword_planner import FrontierLease, keyword_planner
 from models.keyword_entity import KeywordEntity
 from utils.logger import setup_logger
 from utils.config import Config
 import argparse
+import signal
 
 
 # Cấu hình logger
@@ -33,7 +48,9 @@ def calculate_optimal_workers() -> int:
         memory_limit = math.floor(memory.total * 0.9)
         
         # Ước tính mỗi worker sử dụng khoảng 250MB memory
-        memory_based_workers = math.floor(memory_limit / (250 * 1024 * 1024))
+        memory_based_workers = math.floor(
+            memory_limit / (Config.PROCESS_CONFIG["worker_memory_mb"] * 1024 * 1024)
+        )
         
         # Lấy giá trị nhỏ hơn giữa CPU và Memory
         optimal_workers = min(cpu_limit, memory_based_workers)
@@ -49,73 +66,310 @@ def calculate_optimal_workers() -> int:
         logger.error(f"Error calculating optimal workers: {e}")
         return 1  # Fallback to 1 worker if calculation fails
 
-class BaseQueue:
-    """Lớp cơ sở cho các queue"""
-    def __init__(self):
-        self.queue = Queue()
-        self.lock = threading.Lock()
+def plan_processes(processes: int = 0) -> Tuple[int, int]:
+    """Tính số process và số worker async trong mỗi process
 
-    def is_empty(self) -> bool:
-        """Kiểm tra queue có rỗng không"""
-        with self.lock:
-            return self.queue.empty()
+    Mỗi process chạy một event loop trên một core nên số process bị giới hạn
+    bởi CPU, còn RAM được chia đều cho các process để tính số worker.
+    `processes` > 0 thì giữ nguyên số process, chỉ tính số worker.
+    """
+    try:
+        cpu_count = psutil.cpu_count(logical=True)
+        memory = psutil.virtual_memory()
 
-    def get(self):
-        """Lấy một phần tử từ queue"""
-        with self.lock:
-            if self.queue.empty():
-                return None
-            return self.queue.get()
+        cpu_limit = max(1, math.floor(cpu_count * 0.9))
+        memory_based_workers = max(1, math.floor(
+            memory.total * 0.9 / (Config.PROCESS_CONFIG["worker_memory_mb"] * 1024 * 1024)
+        ))
 
+        if processes <= 0:
+            processes = min(cpu_limit, memory_based_workers)
+        workers = max(1, min(
+            memory_based_workers // processes,
+            Config.PROCESS_CONFIG["max_workers_per_process"],
+        ))
 
-class KeywordQueue(BaseQueue):
-    """Queue quản lý các keyword cần crawl"""
-    def __init__(self):
-        super().__init__()
-        self._load_keywords()
+        logger.info(f"CPU cores: {cpu_count}, Memory: {memory.total / (1024*1024*1024):.2f}GB")
+        logger.info(f"Kế hoạch: {processes} process x {workers} worker")
+        return processes, workers
+    except Exception as e:
+        logger.error(f"Error planning processes: {e}")
+        return max(1, processes), 1
+
+class BaseQueue(abc.ABC):
+    """Lớp cơ sở cho các queue
+
+    Một producer chạy trên event loop claim việc từ database (qua `_claim`,
+    chạy trong thread) và đẩy vào `asyncio.Queue` có giới hạn (backpressure).
+    Khi hết việc, producer gửi một sentinel `None` cho mỗi worker. Ở chế độ
+    `follow`, producer không dừng khi hết việc mà chờ `notify()` hoặc
+    `poll_interval` rồi claim tiếp, cho tới khi `stop()` được gọi.
+    """
+    def __init__(self, maxsize: int, follow: bool = False):
+        self.maxsize = maxsize
+        self.follow = follow
+        self.queue: Optional[asyncio.Queue] = None
+        self.in_flight = 0
+        self.exhausted = False
+        self._stopping = False
+        self._wakeup: Optional[asyncio.Event] = None
+        self._producer: Optional[asyncio.Task] = None
+        # Lượt claim đang chạy trong thread (vẫn chạy tiếp khi producer bị hủy)
+        self._claiming: Optional[asyncio.Future] = None
+
+    async def start(self, num_consumers: int) -> None:
+        """Khởi động producer cho `num_consumers` worker"""
+        self.queue = asyncio.Queue(maxsize=self.maxsize)
+        self._wakeup = asyncio.Event()
+        self._producer = asyncio.create_task(self._produce(num_consumers))
+
+    async def get(self):
+        """Lấy một phần tử từ queue (None khi đã hết việc)"""
+        return await self.queue.get()
+
+    async def done(self, item) -> None:
+        """Báo worker đã xử lý xong một phần tử"""
+        self.in_flight -= 1
+
+    async def release(self, item) -> None:
+        """Báo worker bị hủy khi đang xử lý một phần tử"""
+        self.in_flight -= 1
+
+    def notify(self) -> None:
+        """Báo có việc mới trong database để producer claim ngay"""
+        self.exhausted = False
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def stop(self) -> None:
+        """Dừng producer, worker thoát sau khi xử lý hết phần tử đã claim"""
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def close(self) -> None:
+        """Dừng producer và chờ lượt claim đang chạy trong thread xong
+
+        Gọi trước khi trả lease (`release_all`): item được claim sau lúc đó
+        sẽ bị giữ lease tới khi hết hạn.
+        """
+        self.stop()
+        if self._producer is not None:
+            self._producer.cancel()
+            await asyncio.gather(self._producer, return_exceptions=True)
+        if self._claiming is not None:
+            await asyncio.gather(self._claiming, return_exceptions=True)
+
+    def is_idle(self) -> bool:
+        """Không còn việc để claim và không còn phần tử nào đang xử lý"""
+        return self.exhausted and self.in_flight == 0
+
+    @abc.abstractmethod
+    def _claim(self) -> list:
+        """Claim một lượt việc từ database (chạy trong thread)"""
+
+    async def _claim_in_thread(self, *args) -> list:
+        """Chạy `_claim` trong thread để không chặn event loop, `close()` chờ được cả khi producer bị hủy"""
+        self._claiming = asyncio.ensure_future(asyncio.to_thread(self._claim, *args))
+        return await asyncio.shield(self._claiming)
+
+    async def _next_items(self) -> list:
+        """Lượt việc tiếp theo của producer"""
+        return await self._claim_in_thread()
+
+    def _retry_delay(self) -> Optional[float]:
+        """Số giây chờ việc thử lại khi database đã hết việc (None: không còn gì để chờ)"""
+        return None
+
+    async def _produce(self, num_consumers: int) -> None:
+        """Claim việc và đưa vào queue cho tới khi hết (hoặc bị stop)"""
+        total = 0
+        cancelled = False
+        try:
+            while not self._stopping:
+                self._wakeup.clear()
+                items = await self._next_items()
+                if not items:
+                    delay = self._retry_delay()
+                    if delay is None:
+                        self.exhausted = True
+                        if not self.follow:
+                            break
+                        delay = Config.CRAWLER_CONFIG["queue_poll_interval"]
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                self.exhausted = False
+                for item in items:
+                    self.in_flight += 1
+                    total += 1
+                    await self.queue.put(item)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        except Exception as e:
+            logger.error(f"Lỗi khi lấy việc từ database cho {type(self).__name__}: {e}")
+        finally:
+            # Khi bị huỷ, consumer có thể đã dừng: put vào queue đầy sẽ chờ mãi
+            if not cancelled:
+                for _ in range(num_consumers):
+                    await self.queue.put(None)
+
+        if total == 0:
+            logger.warning(f"{type(self).__name__}: không có việc nào cần crawl")
+        else:
+            logger.info(f"{type(self).__name__}: đã đưa {total} phần tử vào queue")
 
-    def _load_keywords(self) -> bool:
-        """Load keywords từ database vào queue"""
-        count = keywords_collection.count_documents({"isCrawl": False})
-        if count == 0:
-            logger.warning("Không tìm thấy keywords nào cần crawl")
-            return False
 
-        keywords = keywords_collection.find({"isCrawl": False})
-        for keyword in keywords:
-            self.queue.put(keyword.get("keyword"))
-        logger.info(f"Đã load {self.queue.qsize()} keywords vào queue")
-        return True
+class KeywordQueue(BaseQueue):
+    """Queue quản lý các keyword cần crawl
+
+    Keyword được claim trong database theo lease, nên nhiều container chạy
+    cùng lúc không crawl trùng keyword, keyword có tỉ lệ username mới ước
+    lượng (`expectedYield`) cao trước. Ở chế độ `refresh`, claim keyword đã
+    crawl đến hạn crawl lại, keyword mang về nhiều username mới trước.
+    """
+    def __init__(self, follow: bool = False, refresh: bool = False):
+        super().__init__(Config.CRAWLER_CONFIG["keyword_queue_size"], follow)
+        self.lease = (
+            RefreshLease(keywords_collection, "keyword", "yieldScore") if refresh
+            else FrontierLease(keywords_collection, "keyword")
+        )
+
+    def _claim(self) -> List[str]:
+        doc = self.lease.claim_one({"keyword": 1})
+        return [doc.get("keyword")] if doc else []
+
+    async def done(self, keyword: str) -> None:
+        await asyncio.to_thread(self.lease.finish, [keyword])
+        await super().done(keyword)
+
+    async def release(self, keyword: str) -> None:
+        """Keyword chưa crawl xong được trả lease ngay"""
+        await asyncio.to_thread(self.lease.release, [keyword])
+        await super().release(keyword)
 
 
 class UsernameQueue(BaseQueue):
-    """Queue quản lý các username cần crawl"""
-    def __init__(self, batch_size: int = Config.CRAWLER_CONFIG["default_batch_size"]):
-        super().__init__()
+    """Queue các batch username cần crawl
+
+    Producer claim từng batch theo lease (sắp theo `_id`, chỉ lấy field
+    `username`), nên bộ nhớ không phụ thuộc vào số username tồn đọng, worker
+    bắt đầu ngay và nhiều container có thể chia nhau cùng một backlog. Ở chế
+    độ `refresh`, claim profile đã crawl đến hạn crawl lại, độ ưu tiên cao
+    (nhiều follower, hay thay đổi) trước.
+
+    Username crawl lỗi vẫn giữ lease và được hẹn thử lại với backoff, rồi
+    được trộn vào các batch sau cùng với username mới. Quá số lần thử theo
+    loại lỗi thì chuyển vào collection `dead_letters`.
+    """
+    # Field lịch crawl lần trước (phát hiện profile thay đổi) và số lần đã thử lại
+    PROJECTION = {"username": 1, "signature": 1, "crawlCount": 1, "changeCount": 1, "retryCount": 1}
+
+    def __init__(self, batch_size: int = Config.CRAWLER_CONFIG["default_batch_size"],
+                 follow: bool = False, refresh: bool = False):
+        super().__init__(Config.CRAWLER_CONFIG["queue_max_batches"], follow)
         self.batch_size = batch_size
-        self._load_usernames()
-
-    def _load_usernames(self) -> bool:
-        """Load usernames từ database vào queue theo batch"""
-        count = usernames_collection.count_documents({"isCrawl": False})
-        if count == 0:
-            logger.warning("Không tìm thấy usernames nào cần crawl")
-            return False
-
-        usernames = list(usernames_collection.find({"isCrawl": False}))
-        for i in range(0, len(usernames), self.batch_size):
-            batch = usernames[i : i + self.batch_size]
-            self.queue.put(batch)
-
-        logger.info(f"Đã load {self.queue.qsize()} batches usernames vào queue")
-        return True
+        self.retries = RetryQueue()
+        self.writes: Optional[WriteBuffer] = None
+        self.lease = (
+            RefreshLease(usernames_collection, "username", "refreshPriority") if refresh
+            else WorkLease(usernames_collection, "username")
+        )
+
+    def _claim(self, limit: Optional[int] = None) -> List[List[dict]]:
+        """Claim một batch username mới (tối đa `limit`, mặc định `batch_size`)"""
+        limit = self.batch_size if limit is None else limit
+        batch = self.lease.claim(limit, self.PROJECTION) if limit > 0 else []
+        return [batch] if batch else []
+
+    async def _next_items(self) -> List[List[dict]]:
+        """Batch gồm username đến hạn thử lại và username mới
+
+        Heap thử lại chỉ được đọc/ghi trên event loop (`done` cũng chạy ở
+        đây), chỉ phần claim trong database chạy trong thread. Username đến
+        hạn thử lại chiếm tối đa `retry_share` của batch, trừ khi hết việc mới.
+        """
+        retry_limit = max(1, int(self.batch_size * Config.RETRY_CONFIG["retry_share"]))
+        batch = self.retries.pop_due(retry_limit)
+        for claimed in await self._claim_in_thread(self.batch_size - len(batch)):
+            batch += claimed
+        if len(batch) < self.batch_size:
+            batch += self.retries.pop_due(self.batch_size - len(batch))
+        return [batch] if batch else []
+
+    def _retry_delay(self) -> Optional[float]:
+        delay = self.retries.next_delay()
+        if delay is None and self.in_flight:
+            # Batch đang xử lý có thể còn username lỗi cần thử lại
+            return Config.CRAWLER_CONFIG["queue_poll_interval"]
+        return delay
+
+    async def done(self, batch: List[dict], failures: Optional[Dict[str, str]] = None) -> None:
+        """Trả lease username đã xong, hẹn thử lại hoặc chuyển dead letter username lỗi
+
+        Heap thử lại được cập nhật trên event loop, lệnh trả lease chạy trong thread.
+        """
+        failures = failures or {}
+        finished = []
+        for item in batch:
+            username = item.get("username")
+            category = failures.get(username)
+            if category is None or self.writes is None:
+                finished.append(username)
+                continue
+            item["retryCount"] = item.get("retryCount", 0) + 1
+            if self.retries.schedule(item, category, item["retryCount"]):
+                crawl_stats["retries"] += 1
+                self.writes.record_failure(username, category, item["retryCount"])
+                logger.info(f"Hẹn thử lại {username} ({category}) lần {item['retryCount']}")
+            else:
+                crawl_stats["dead_letters"] += 1
+                self.writes.dead_letter(username, category, item["retryCount"] - 1)
+                finished.append(username)
+                logger.warning(f"{username} lỗi {category} quá số lần thử lại, chuyển vào dead letter")
+        # Username đang chờ thử lại vẫn giữ lease (heartbeat tiếp tục gia hạn)
+        await asyncio.to_thread(self.lease.finish, finished)
+        await super().done(batch)
+        # Producer đang chờ batch lỗi: claim ngay việc thử lại hoặc kết thúc khi hết việc
+        if (failures or not self.in_flight) and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def release(self, batch: List[dict], unfinished: Iterable[str] = ()) -> None:
+        """Batch bị hủy giữa chừng: trả lease ngay cho username chưa crawl (`unfinished`)
+
+        Username đã đưa vào write buffer được coi là xong (giữ lease tới khi
+        ghi xong như `done`), không tính là lỗi.
+        """
+        unfinished = set(unfinished)
+        finished = [item.get("username") for item in batch if item.get("username") not in unfinished]
+        await asyncio.to_thread(self.lease.finish, finished)
+        await asyncio.to_thread(self.lease.release, unfinished)
+        await super().release(batch)
 
 
 class CrawlerWorker:
     """Lớp cơ sở cho các worker"""
-    def __init__(self, worker_id: int):
+    # Tiền tố label worker trong metrics
+    kind = "worker"
+
+    def __init__(
+        self,
+        worker_id: int,
+        pool: BrowserPool,
+        writes: WriteBuffer,
+        page_concurrency: int = Config.CRAWLER_CONFIG["default_page_concurrency"],
+        fetcher: Optional[ProfileHttpFetcher] = None,
+        avatars: Optional[AvatarPipeline] = None,
+        search_fetcher: Optional[SearchHttpFetcher] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+    ):
         self.worker_id = worker_id
-        self.crawler = PinterestCrawler()
+        self.crawler = PinterestCrawler(pool, writes, page_concurrency, fetcher, avatars, search_fetcher,
+                                        limiter, f"{self.kind}-{worker_id}")
 
     async def start(self):
         """Bắt đầu worker"""
@@ -124,48 +378,240 @@ class CrawlerWorker:
 
 class KeywordWorker(CrawlerWorker):
     """Worker xử lý crawl username từ keyword"""
+    kind = "keyword"
+
     async def process(self, queue: KeywordQueue):
         """Xử lý crawl username từ keyword"""
         while True:
-            keyword = queue.get()
+            keyword = await queue.get()
             if keyword is None:
                 logger.info(f"Worker {self.worker_id} đã hoàn thành")
                 break
 
             logger.info(f"Worker {self.worker_id} đang crawl keyword: {keyword}")
-            await self.crawler.crawl_usernames(keyword)
+            try:
+                await self.crawler.crawl_usernames(keyword)
+            except asyncio.CancelledError:
+                # Bị dừng giữa chừng (SIGTERM): container khác claim lại keyword ngay
+                await queue.release(keyword)
+                raise
+            except Exception as e:
+                # Keyword giữ lease, được claim lại khi lease hết hạn
+                logger.error(f"Worker {self.worker_id} lỗi khi crawl keyword {keyword}: {e}")
+            await queue.done(keyword)
 
 
 class ProfileWorker(CrawlerWorker):
     """Worker xử lý crawl profile từ username"""
+    kind = "profile"
+
     async def process(self, queue: UsernameQueue):
         """Xử lý crawl profile từ username"""
         while True:
-            batch = queue.get()
+            batch = await queue.get()
             if batch is None:
                 logger.info(f"Worker {self.worker_id} đã hoàn thành")
                 break
 
             logger.info(f"Worker {self.worker_id} đang crawl batch với {len(batch)} usernames")
-            await self.crawler.crawl_user_profile(batch)
+            try:
+                failures = await self.crawler.crawl_user_profile(batch)
+            except asyncio.CancelledError:
+                # Bị dừng giữa batch (SIGTERM): username chưa crawl được trả lease ngay
+                await queue.release(batch, self.crawler.unfinished)
+                raise
+            except Exception as e:
+                logger.error(f"Worker {self.worker_id} lỗi khi crawl batch: {e}")
+                failures = {item.get("username"): FAILURE_ERROR for item in batch}
+            await queue.done(batch, failures)
 
 
 class CrawlerManager:
     """Quản lý việc crawl dữ liệu"""
     @staticmethod
-    async def crawl_usernames(num_workers: int = Config.CRAWLER_CONFIG["default_workers"]):
-        """Chạy crawl username với số lượng worker cho trước"""
-        queue = KeywordQueue()
-        workers = [KeywordWorker(i) for i in range(num_workers)]
-        await asyncio.gather(*[worker.process(queue) for worker in workers])
+    def _new_write_buffer() -> WriteBuffer:
+        """Write buffer dùng chung cho các worker trong process"""
+        journal = WriteJournal.for_process() if Config.JOURNAL_CONFIG["enabled"] else None
+        writes = WriteBuffer(journal=journal)
+        writes.on_flush.append(lambda upserted: crawl_stats.update(usernames=upserted["usernames"]))
+        if keyword_planner.enabled:
+            keyword_planner.load()
+            writes.on_keywords.append(keyword_planner.observe)
+        return writes
+
+    @staticmethod
+    @asynccontextmanager
+    async def _browser_pool(pool: Optional[BrowserPool], size: int):
+        """Dùng pool được truyền vào (không đóng), hoặc tạo pool riêng với `size` context"""
+        if pool is not None:
+            yield pool
+            return
+        async with BrowserPool(size=size) as own_pool:
+            yield own_pool
+
+    @staticmethod
+    def _keyword_pool_size(num_workers: int, engine: str) -> int:
+        """Số context browser cần cho crawl username
+
+        Search API: các worker dùng chung một HTTP session, browser chỉ được
+        mở khi search API lỗi nên pool chỉ cần một context.
+        """
+        return 1 if engine == "http" else num_workers
+
+    @staticmethod
+    async def _run_keyword_workers(queue: KeywordQueue, num_workers: int, writes: WriteBuffer,
+                                   engine: str = Config.CRAWLER_CONFIG["search_engine"],
+                                   limiter: Optional[AdaptiveLimiter] = None,
+                                   pool: Optional[BrowserPool] = None):
+        """Chạy các KeywordWorker trên queue cho tới khi nhận sentinel"""
+        limiter = limiter or AdaptiveLimiter()
+        queue.writes = writes
+        await queue.start(num_workers)
+        heartbeat = asyncio.create_task(queue.lease.heartbeat())
+        use_search_api = engine == "http"
+        pool_size = CrawlerManager._keyword_pool_size(num_workers, engine)
+        try:
+            async with CrawlerManager._browser_pool(pool, pool_size) as pool, \
+                    SearchHttpFetcher() as search_fetcher:
+                workers = [
+                    KeywordWorker(i, pool, writes, search_fetcher=search_fetcher if use_search_api else None,
+                                  limiter=limiter)
+                    for i in range(num_workers)
+                ]
+                await asyncio.gather(*[worker.process(queue) for worker in workers])
+        finally:
+            heartbeat.cancel()
+            await queue.close()
+            await asyncio.to_thread(queue.lease.release_all)
+
+    @staticmethod
+    async def _run_profile_workers(queue: UsernameQueue, num_workers: int, page_concurrency: int,
+                                   writes: WriteBuffer,
+                                   on_new_keywords: Optional[Callable[[], None]] = None,
+                                   limiter: Optional[AdaptiveLimiter] = None,
+                                   pool: Optional[BrowserPool] = None):
+        """Chạy các ProfileWorker trên queue cho tới khi nhận sentinel"""
+        limiter = limiter or AdaptiveLimiter()
+        queue.writes = writes
+        await queue.start(num_workers)
+        heartbeat = asyncio.create_task(queue.lease.heartbeat())
+        # Fast path HTTP dùng chung một session, browser chỉ dùng khi fallback
+        use_fast_path = Config.CRAWLER_CONFIG["profile_engine"] == "http"
+        try:
+            async with CrawlerManager._browser_pool(pool, num_workers) as pool, ProfileHttpFetcher() as fetcher, \
+                    AvatarPipeline(writes=writes) as avatars:
+                workers = [
+                    ProfileWorker(i, pool, writes, page_concurrency, fetcher if use_fast_path else None, avatars,
+                                  limiter=limiter)
+                    for i in range(num_workers)
+                ]
+                for worker in workers:
+                    worker.crawler.on_new_keywords = on_new_keywords
+                await asyncio.gather(*[worker.process(queue) for worker in workers])
+        finally:
+            heartbeat.cancel()
+            await queue.close()
+            await asyncio.to_thread(queue.lease.release_all)
+
+    @staticmethod
+    async def _stop_when_idle(writes: WriteBuffer, *queues: BaseQueue):
+        """Dừng các queue ở chế độ follow khi tất cả cùng hết việc và đã ghi xong"""
+        while True:
+            await asyncio.sleep(Config.CRAWLER_CONFIG["queue_poll_interval"])
+            if writes.is_empty() and all(queue.is_idle() for queue in queues):
+                logger.info("Không còn keyword/username nào cần crawl, dừng crawler")
+                for queue in queues:
+                    queue.stop()
+                return
+
+    @staticmethod
+    async def crawl_usernames(num_workers: int = Config.CRAWLER_CONFIG["default_workers"],
+                              follow: bool = False,
+                              engine: str = Config.CRAWLER_CONFIG["search_engine"],
+                              refresh: bool = False):
+        """Chạy crawl username với số lượng worker và engine (http/browser) cho trước"""
+        async with CrawlerManager._new_write_buffer() as writes:
+            await CrawlerManager._run_keyword_workers(KeywordQueue(follow, refresh), num_workers, writes, engine)
 
     @staticmethod
     async def crawl_profiles(num_workers: int = Config.CRAWLER_CONFIG["default_workers"], 
-                           batch_size: int = Config.CRAWLER_CONFIG["default_batch_size"]):
-        """Chạy crawl profile với số lượng worker và batch size cho trước"""
-        queue = UsernameQueue(batch_size)
-        workers = [ProfileWorker(i) for i in range(num_workers)]
-        await asyncio.gather(*[worker.process(queue) for worker in workers])
+                           batch_size: int = Config.CRAWLER_CONFIG["default_batch_size"],
+                           page_concurrency: int = Config.CRAWLER_CONFIG["default_page_concurrency"],
+                           follow: bool = False, refresh: bool = False):
+        """Chạy crawl profile với số lượng worker, batch size và số page song song cho trước"""
+        async with CrawlerManager._new_write_buffer() as writes:
+            await CrawlerManager._run_profile_workers(UsernameQueue(batch_size, follow, refresh), num_workers,
+                                                      page_concurrency, writes)
+
+    @staticmethod
+    async def crawl_all(num_workers: int = Config.CRAWLER_CONFIG["default_workers"],
+                        batch_size: int = Config.CRAWLER_CONFIG["default_batch_size"],
+                        page_concurrency: int = Config.CRAWLER_CONFIG["default_page_concurrency"],
+                        engine: str = Config.CRAWLER_CONFIG["search_engine"]):
+        """Chạy đồng thời crawl username và crawl profile trong cùng event loop
+
+        Keyword mới sinh ra từ profile được đưa ngay vào crawl username, và
+        username mới (sau khi được ghi vào MongoDB) được đưa ngay vào crawl
+        profile, không cần chạy lại.
+        """
+        keyword_queue = KeywordQueue(follow=True)
+        username_queue = UsernameQueue(batch_size, follow=True)
+        # Hai nhóm worker cùng gửi request tới Pinterest nên dùng chung giới hạn,
+        # và dùng chung một browser đủ context cho cả hai nhóm
+        limiter = AdaptiveLimiter()
+        pool_size = CrawlerManager._keyword_pool_size(num_workers, engine) + num_workers
+        async with CrawlerManager._new_write_buffer() as writes, BrowserPool(size=pool_size) as pool:
+            writes.on_flush.append(lambda upserted: upserted["usernames"] and username_queue.notify())
+            monitor = asyncio.create_task(
+                CrawlerManager._stop_when_idle(writes, keyword_queue, username_queue)
+            )
+            try:
+                await asyncio.gather(
+                    CrawlerManager._run_keyword_workers(keyword_queue, num_workers, writes, engine, limiter, pool),
+                    CrawlerManager._run_profile_workers(username_queue, num_workers, page_concurrency,
+                                                        writes, keyword_queue.notify, limiter, pool),
+                )
+            finally:
+                monitor.cancel()
+
+
+def run_worker_process(command: str, num_workers: int, batch_size: int, page_concurrency: int,
+                       follow: bool, engine: str, refresh: bool, processes: int, progress) -> None:
+    """Điểm vào của process con do Supervisor khởi động
+
+    `RATE_LIMIT_RPS` là giới hạn của cả container, nên mỗi process trong
+    `processes` process chỉ nhận một phần tốc độ và burst của token bucket.
+    """
+    share_rate(processes)
+    if command == "crawl_usernames":
+        main_coro = lambda: CrawlerManager.crawl_usernames(num_workers, follow, engine, refresh)
+    elif command == "crawl_profiles":
+        main_coro = lambda: CrawlerManager.crawl_profiles(num_workers, batch_size, page_concurrency, follow,
+                                                          refresh)
+    else:
+        main_coro = lambda: CrawlerManager.crawl_all(num_workers, batch_size, page_concurrency, engine)
+    asyncio.run(run_child(main_coro, crawl_stats, progress))
+
+
+async def _run_until_sigterm(main_coro) -> None:
+    """Chạy coroutine chính, SIGTERM hủy task thay vì kill process
+
+    Profile đã crawl đều nằm trong write buffer, nên khi task bị hủy các khối
+    `finally` ghi nốt buffer vào MongoDB, tải nốt avatar đã nhận và trả lease
+    của việc chưa xong trước khi thoát (như process con của Supervisor).
+    """
+    task = asyncio.ensure_future(main_coro)
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+    try:
+        await task
+    except asyncio.CancelledError:
+        logger.info("Đã nhận SIGTERM, crawler đã ghi xong dữ liệu và dừng")
+
+
+def run_crawler(main_coro) -> None:
+    """Chạy crawler trong process hiện tại, xuất metrics trong lúc chạy"""
+    with MetricsExporter(lambda: add_progress(metrics.snapshot(), dict(crawl_stats))):
+        asyncio.run(_run_until_sigterm(main_coro))
 
 
 def main():
@@ -175,28 +621,64 @@ def main():
     parser = argparse.ArgumentParser(description="Chương trình crawler cho Pinterest")
     
     # Định nghĩa các lệnh có thể có
-    parser.add_argument('command', help="Lệnh cần thực thi", choices=['crawl_usernames', 'crawl_profiles', 'create_keywords', 'count_keywords'])
+    parser.add_argument('command', help="Lệnh cần thực thi", choices=['crawl_usernames', 'crawl_profiles', 'crawl_all', 'create_keywords', 'count_keywords', 'explain_indexes'])
     
     # Thêm các đối số phụ (nếu cần)
     parser.add_argument('num_workers', type=int, nargs='?', default=None, help="Số lượng workers")
     parser.add_argument('batch_size', type=int, nargs='?', default=None, help="Batch size cho crawl_profiles")
+    parser.add_argument('page_concurrency', type=int, nargs='?', default=None, help="Số page song song mỗi worker cho crawl_profiles")
+    parser.add_argument('--follow', action='store_true', help="Không dừng khi hết việc, chờ keyword/username mới")
+    parser.add_argument('--engine', choices=['http', 'browser'], default=Config.CRAWLER_CONFIG["search_engine"],
+                        help="Cách tìm username của crawl_usernames: search API qua HTTP hoặc cuộn trang bằng browser")
+    parser.add_argument('--refresh', action='store_true',
+                        help="crawl_usernames/crawl_profiles: crawl lại keyword/profile đã đến hạn, ưu tiên cao trước")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="Số process crawler (0: tự tính theo CPU/RAM), num_workers là số worker mỗi process")
     
     # Phân tích các đối số
     args = parser.parse_args()
     
     # Xử lý các lệnh tương ứng
     try:
-        if args.command == "crawl_usernames":
-            num_workers = args.num_workers if args.num_workers else calculate_optimal_workers()
-            asyncio.run(CrawlerManager.crawl_usernames(num_workers))
-        elif args.command == "crawl_profiles":
+        ensure_indexes()
+
+        if args.command in ("crawl_usernames", "crawl_profiles", "crawl_all") and args.processes != 1:
+            processes, num_workers = plan_processes(args.processes)
+            num_workers = args.num_workers if args.num_workers else num_workers
+            batch_size = args.batch_size if args.batch_size else Config.CRAWLER_CONFIG["default_batch_size"]
+            page_concurrency = args.page_concurrency if args.page_concurrency else Config.CRAWLER_CONFIG["default_page_concurrency"]
+            supervisor = Supervisor(
+                run_worker_process,
+                (args.command, num_workers, batch_size, page_concurrency, args.follow, args.engine, args.refresh,
+                 processes),
+                processes,
+            )
+            with MetricsExporter(supervisor.metrics_snapshot):
+                supervisor.run()
+        elif args.command == "crawl_usernames":
+            if args.num_workers:
+                num_workers = args.num_workers
+            elif args.engine == "http":
+                # Search API bị giới hạn bởi mạng chứ không bởi browser
+                num_workers = Config.CRAWLER_CONFIG["search_concurrency"]
+            else:
+                num_workers = calculate_optimal_workers()
+            run_crawler(CrawlerManager.crawl_usernames(num_workers, args.follow, args.engine, args.refresh))
+        elif args.command in ("crawl_profiles", "crawl_all"):
             num_workers = args.num_workers if args.num_workers else calculate_optimal_workers()
             batch_size = args.batch_size if args.batch_size else Config.CRAWLER_CONFIG["default_batch_size"]
-            asyncio.run(CrawlerManager.crawl_profiles(num_workers, batch_size))
+            page_concurrency = args.page_concurrency if args.page_concurrency else Config.CRAWLER_CONFIG["default_page_concurrency"]
+            if args.command == "crawl_all":
+                run_crawler(CrawlerManager.crawl_all(num_workers, batch_size, page_concurrency, args.engine))
+            else:
+                run_crawler(CrawlerManager.crawl_profiles(num_workers, batch_size, page_concurrency,
+                                                          args.follow, args.refresh))
         elif args.command == "create_keywords":
             create_keywords()
         elif args.command == "count_keywords":
             count_keyword_not_crawl()
+        elif args.command == "explain_indexes":
+            explain_indexes()
     except Exception as e:
         logger.error(f"Lỗi khi thực thi lệnh: {e}")
         sys.exit(1)
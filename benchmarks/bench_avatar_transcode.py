@@ -0,0 +1,165 @@
+"""Benchmark encode lại avatar trong process pool với ảnh giả lập (cần Pillow)
+
+Chạy: python -m benchmarks.bench_avatar_transcode [số_ảnh] [cạnh_ảnh_px]
+
+1. Encode lại ảnh JPEG lớn có EXIF qua `AvatarTranscoder`: số ảnh/s, byte
+   trước và sau, đồng thời đo độ trễ lớn nhất của event loop (một task tick
+   mỗi 10ms) để so với encode ngay trong event loop.
+2. `AvatarPipeline` tải ảnh từ server giả lập với transcoder: file lưu phải
+   đúng định dạng, không quá `max_size`, không còn EXIF, có thumbnail, và
+   profile có `avatar_thumb_url`.
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from io import BytesIO
+from typing import List
+
+import benchmarks.harness  # noqa: F401  MongoDB giả lập, import trước các module của crawler
+
+from benchmarks.fake_pinterest import FakePinterestServer, make_avatar_url
+from database import ensure_indexes, profile_collection
+from modules.avatar_index import AvatarIndex
+from modules.avatar_pipeline import AvatarPipeline
+from modules.avatar_storage import AvatarStorage
+from modules.avatar_transcoder import AvatarTranscoder, transcode
+from modules.write_buffer import WriteBuffer
+from utils.config import Config
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def synthetic_images(count: int, size: int, seed: int = 0) -> List[bytes]:
+    """Ảnh JPEG chất lượng cao có nhiễu và EXIF, giống ảnh gốc người dùng tải lên"""
+    rng = random.Random(seed)
+    images = []
+    for i in range(count):
+        base = Image.radial_gradient("L").resize((size, size))
+        noise = Image.effect_noise((size, size), rng.uniform(20, 60))
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        image = Image.merge("RGB", (base, noise, Image.new("L", (size, size), color[i % 3])))
+        exif = Image.Exif()
+        exif[0x010F] = "BenchCamera"  # Make
+        exif[0x0112] = 1  # Orientation
+        with BytesIO() as output:
+            image.save(output, "JPEG", quality=95, exif=exif)
+            images.append(output.getvalue())
+    return images
+
+
+async def max_loop_lag(work) -> float:
+    """Chạy `work()` và trả về độ trễ lớn nhất (giây) của một task tick mỗi 10ms"""
+    lag = 0.0
+    done = False
+
+    async def ticker() -> None:
+        nonlocal lag
+        while not done:
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag = max(lag, time.perf_counter() - started - 0.01)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.05)
+    await work()
+    done = True
+    await task
+    return lag
+
+
+async def bench_pool(images: List[bytes]) -> None:
+    transcoder = AvatarTranscoder()
+    transcoder.start()
+    # Khởi động process trước khi đo
+    await transcoder.transcode_many({"warmup": images[0]})
+    results = {}
+
+    async def pooled() -> None:
+        results.update(await transcoder.transcode_many({str(i): content for i, content in enumerate(images)}))
+
+    started = time.perf_counter()
+    lag = await max_loop_lag(pooled)
+    elapsed = time.perf_counter() - started
+    transcoder.close()
+
+    async def inline() -> None:
+        for content in images[: max(1, len(images) // 4)]:
+            transcode(content, transcoder.fmt, transcoder.quality, transcoder.max_size, transcoder.thumb_size)
+
+    inline_lag = await max_loop_lag(inline)
+    size_in = sum(len(content) for content in images)
+    size_out = sum(len(main) + len(thumb) for main, thumb in results.values())
+    print(
+        f"Process pool ({transcoder.workers} process, {transcoder.fmt}): {len(images)} ảnh trong {elapsed:.2f}s "
+        f"({len(images) / elapsed:.1f} ảnh/s), {size_in / 1024:.0f}KB -> {size_out / 1024:.0f}KB "
+        f"({size_out / size_in:.1%}), event loop trễ tối đa {lag * 1000:.0f}ms "
+        f"(encode trong event loop: {inline_lag * 1000:.0f}ms)"
+    )
+
+
+async def run_pipeline(server: FakePinterestServer, images: List[bytes], root: str) -> AvatarPipeline:
+    urls = {}
+    for i, content in enumerate(images):
+        username = f"transcode_{i:04d}"
+        urls[username] = make_avatar_url(server.base_url, username)
+        server.avatar_overrides[f"{username}.jpg"] = content
+    profile_collection.insert_many([{"username": username} for username in urls])
+
+    async with WriteBuffer(flush_interval=0.1) as writes:
+        pipeline = AvatarPipeline(
+            AvatarStorage(is_docker=False), writes=writes, index=AvatarIndex(os.path.join(root, "index.sqlite3")),
+            transcoder=AvatarTranscoder(),
+        )
+        async with pipeline:
+            for username, url in urls.items():
+                await pipeline.submit(username, url)
+    return pipeline
+
+
+def check_pipeline(server: FakePinterestServer, images: List[bytes]) -> bool:
+    with tempfile.TemporaryDirectory() as root:
+        Config.DIRECTORIES["avatars"] = root
+        pipeline = asyncio.run(run_pipeline(server, images, root))
+        profiles = list(profile_collection.find({}, {"avatar_url": 1, "avatar_thumb_url": 1}))
+        ok = pipeline.downloaded == len(images) and all(doc.get("avatar_thumb_url") for doc in profiles)
+        max_size = Config.AVATAR_CONFIG["transcode"]["max_size"]
+        thumb_size = Config.AVATAR_CONFIG["transcode"]["thumb_size"]
+        fmt = Config.AVATAR_CONFIG["transcode"]["format"].upper()
+        for doc in profiles:
+            for key, limit in (("avatar_url", max_size), ("avatar_thumb_url", thumb_size)):
+                with Image.open(doc[key]) as image:
+                    if image.format != fmt or max(image.size) > limit or image.getexif():
+                        ok = False
+        original, stored = sum(pipeline.original_bytes.values()), sum(pipeline.stored_bytes.values())
+    print(
+        f"Pipeline: {pipeline.downloaded} avatar, tải {original / 1024:.0f}KB, lưu {stored / 1024:.0f}KB "
+        f"(kèm thumbnail) trong {len(pipeline.stored_bytes)} shard"
+    )
+    return ok
+
+
+def main() -> None:
+    if Image is None:
+        print("Cần cài Pillow: pip install Pillow")
+        sys.exit(1)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    images = synthetic_images(count, size)
+    asyncio.run(bench_pool(images))
+
+    ensure_indexes()
+    with FakePinterestServer() as server:
+        Config.PINIMG_BASE_URL = server.base_url
+        ok = check_pipeline(server, images[:16])
+    print("OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Benchmark end-to-end crawler với Pinterest và MongoDB giả lập, không cần mạng
+
+Chạy:
+    python -m benchmarks.bench_crawler                      # cả hai kịch bản
+    python -m benchmarks.bench_crawler --scenario profiles --profiles 2000 --latency 0.05
+    python -m benchmarks.bench_crawler --save baseline.json
+    python -m benchmarks.bench_crawler --compare baseline.json --tolerance 0.2
+
+Kịch bản `profiles` chạy `CrawlerManager.crawl_profiles` (fast path HTTP,
+tải avatar lưu local), kịch bản `usernames` chạy `crawl_usernames` với
+search API. Server giả lập có độ trễ và tỉ lệ lỗi HTTP 500 cấu hình được.
+Mỗi kịch bản báo số item/s, p50/p99 của stage chính (ước lượng từ
+histogram metrics), RSS đỉnh và số thao tác MongoDB trên mỗi item. Thoát
+mã 1 nếu còn item chưa crawl (khi không giả lập lỗi) hoặc, với `--compare`,
+có chỉ số xấu đi quá `--tolerance`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+os.environ.setdefault("DATABASE_NAME", "pinterest_bench")
+os.environ.setdefault("AVATAR_STORAGE", "local")
+
+import benchmarks.harness  # noqa: F401  MongoDB giả lập, import trước các module của crawler
+
+from app import CrawlerManager
+from benchmarks.fake_pinterest import FakePinterestServer, make_avatar_url
+from database import (
+    db, dead_letters_collection, ensure_indexes, keywords_collection, profile_collection, usernames_collection,
+)
+from modules.metrics import STAGE_SECONDS, metrics, quantile
+from modules.pinterest import crawl_stats
+from modules.supervisor import process_rss_mb
+from utils.config import Config
+
+# Chỉ số càng cao càng tốt, các chỉ số còn lại càng thấp càng tốt
+HIGHER_IS_BETTER = {"items_per_s"}
+COMPARED = ("items_per_s", "p50_s", "p99_s", "peak_rss_mb", "mongo_ops_per_item")
+
+
+class RssSampler:
+    """Lấy mẫu RSS của process (gồm process con) trong thread riêng, giữ giá trị đỉnh"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        pid = os.getpid()
+        while True:
+            self.peak_mb = max(self.peak_mb, process_rss_mb(pid))
+            if self._stopped.wait(self.interval):
+                return
+
+
+def _stage_counts(snapshot: Dict[str, Any], stage: str) -> List[int]:
+    """Số đếm theo bucket của một stage, gộp mọi worker"""
+    merged = [0] * (len(Config.METRICS_CONFIG["buckets"]) + 1)
+    for (name, labels), (counts, _, _) in snapshot["histograms"].items():
+        if name == STAGE_SECONDS and dict(labels).get("stage") == stage:
+            merged = [a + b for a, b in zip(merged, counts)]
+    return merged
+
+
+def reset_collections() -> None:
+    """Xóa dữ liệu kịch bản trước, để keyword sinh ra từ profile không lọt vào kịch bản sau"""
+    for collection in (usernames_collection, profile_collection, keywords_collection, dead_letters_collection):
+        collection.delete_many({})
+
+
+def measure(name: str, stage: str, unit: str, run) -> Dict[str, Any]:
+    """Chạy `run()` và tính các chỉ số từ crawl_stats, metrics và số lệnh MongoDB"""
+    stats_before = Counter(crawl_stats)
+    metrics_before = metrics.snapshot()
+    ops_before = db.total_ops()
+    with RssSampler() as rss:
+        started = time.monotonic()
+        asyncio.run(run())
+        elapsed = time.monotonic() - started
+
+    items = crawl_stats[unit] - stats_before[unit]
+    counts = [
+        after - before
+        for after, before in zip(_stage_counts(metrics.snapshot(), stage), _stage_counts(metrics_before, stage))
+    ]
+    ops = db.total_ops()
+    ops.subtract(ops_before)
+    return {
+        "scenario": name,
+        "items": items,
+        "unit": unit,
+        "elapsed_s": round(elapsed, 3),
+        "items_per_s": round(items / elapsed, 2) if elapsed else 0.0,
+        "stage": stage,
+        "p50_s": round(quantile(counts, 0.5), 4),
+        "p99_s": round(quantile(counts, 0.99), 4),
+        "peak_rss_mb": round(rss.peak_mb, 1),
+        "mongo_ops": sum(ops.values()),
+        "mongo_ops_per_item": round(sum(ops.values()) / items, 2) if items else 0.0,
+    }
+
+
+def scenario_profiles(server: FakePinterestServer, args) -> Dict[str, Any]:
+    usernames = [f"bench_{i:06d}" for i in range(args.profiles)]
+    for i, username in enumerate(usernames):
+        server.add_profile({
+            "id": str(i), "username": username, "full_name": f"Bench {i}",
+            "about": "benchmark", "follower_count": i % 5000, "following_count": i % 300,
+            "image_xlarge_url": make_avatar_url(server.base_url, username),
+        })
+    usernames_collection.insert_many([{"username": username, "isCrawl": False} for username in usernames])
+
+    result = measure(
+        "profiles", "profile_http", "profiles",
+        lambda: CrawlerManager.crawl_profiles(args.workers, args.batch_size, args.page_concurrency),
+    )
+    result["pending"] = usernames_collection.count_documents({"username": {"$in": usernames}, "isCrawl": False})
+    # Avatar đã tải có avatar_url là đường dẫn đã lưu thay cho URL pinimg
+    result["avatars"] = sum(
+        1 for doc in profile_collection.find({"username": {"$in": usernames}}, {"avatar_url": 1})
+        if doc.get("avatar_url") and not doc["avatar_url"].startswith("http")
+    )
+    return result
+
+
+def scenario_usernames(server: FakePinterestServer, args) -> Dict[str, Any]:
+    keywords = [f"benchkw{i:05d}" for i in range(args.keywords)]
+    for i, keyword in enumerate(keywords):
+        server.add_search(keyword, [25] * (1 + i % 5))
+    keywords_collection.insert_many([{"keyword": keyword, "isCrawl": False} for keyword in keywords])
+
+    result = measure(
+        "usernames", "search_api", "keywords",
+        lambda: CrawlerManager.crawl_usernames(args.search_workers, engine="http"),
+    )
+    result["pending"] = keywords_collection.count_documents({"keyword": {"$in": keywords}, "isCrawl": False})
+    return result
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    """Các chỉ số xấu đi quá `tolerance` so với baseline"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {item["scenario"]: item for item in json.load(f)}
+    regressions = []
+    for result in results:
+        base = baseline.get(result["scenario"])
+        if base is None:
+            continue
+        for key in COMPARED:
+            old, new = base.get(key), result.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if key in HIGHER_IS_BETTER else change
+            if worse > tolerance:
+                regressions.append(f"{result['scenario']}.{key}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=["profiles", "usernames", "both"], default="both")
+    parser.add_argument("--profiles", type=int, default=1000, help="Số profile của kịch bản profiles")
+    parser.add_argument("--keywords", type=int, default=200, help="Số keyword của kịch bản usernames")
+    parser.add_argument("--workers", type=int, default=4, help="Số ProfileWorker")
+    parser.add_argument("--batch-size", type=int, default=Config.CRAWLER_CONFIG["default_batch_size"])
+    parser.add_argument("--page-concurrency", type=int, default=16)
+    parser.add_argument("--search-workers", type=int, default=Config.CRAWLER_CONFIG["search_concurrency"])
+    parser.add_argument("--latency", type=float, default=0.02, help="Độ trễ (giây) mỗi request tới server giả lập")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Tỉ lệ request trả HTTP 500")
+    parser.add_argument("--save", help="Ghi kết quả ra file JSON (làm baseline)")
+    parser.add_argument("--compare", help="So sánh với file baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    work_dir = tempfile.TemporaryDirectory()
+    Config.DIRECTORIES["avatars"] = os.path.join(work_dir.name, "avatars")
+    Config.JOURNAL_CONFIG["dir"] = os.path.join(work_dir.name, "journal")
+    # Đo tốc độ của crawler, không giới hạn số request mỗi giây
+    Config.RATE_CONFIG["requests_per_second"] = 0
+    # Thử lại nhanh để kịch bản có lỗi kết thúc trong thời gian ngắn
+    Config.RETRY_CONFIG.update(base_delay=0.2, max_delay=2.0)
+    Config.WRITE_BUFFER_CONFIG["flush_interval"] = 0.5
+
+    results = []
+    with FakePinterestServer() as server:
+        Config.PINTEREST_BASE_URL = server.base_url
+        Config.PINIMG_BASE_URL = server.base_url
+        server.profile_latency = server.search_latency = server.avatar_latency = args.latency
+        server.error_rates = {kind: args.error_rate for kind in ("profile", "search", "avatar")}
+        ensure_indexes()
+
+        if args.scenario in ("profiles", "both"):
+            reset_collections()
+            results.append(scenario_profiles(server, args))
+        if args.scenario in ("usernames", "both"):
+            reset_collections()
+            results.append(scenario_usernames(server, args))
+        injected = dict(server.errors)
+    work_dir.cleanup()
+
+    for result in results:
+        print(
+            f"{result['scenario']:9s} {result['items']} {result['unit']} trong {result['elapsed_s']:.1f}s: "
+            f"{result['items_per_s']:.1f} {result['unit']}/s, {result['stage']} p50 {result['p50_s'] * 1000:.0f}ms "
+            f"p99 {result['p99_s'] * 1000:.0f}ms, RSS đỉnh {result['peak_rss_mb']:.0f}MB, "
+            f"{result['mongo_ops_per_item']:.2f} lệnh Mongo/{result['unit'][:-1]}, còn {result['pending']} chưa crawl"
+            + (f", {result['avatars']} avatar" if "avatars" in result else "")
+        )
+    if injected:
+        print(f"Lỗi giả lập: {injected}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Đã lưu kết quả vào {args.save}")
+
+    # Có lỗi giả lập thì keyword lỗi giữ lease tới khi hết hạn (như khi chạy thật), không tính là FAIL
+    failed = not args.error_rate and any(result["pending"] for result in results)
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION  {line}")
+        failed = failed or bool(regressions)
+    print("FAIL" if failed else "OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""Benchmark planner keyword trên một tập người dùng giả lập
+
+Chạy: python -m benchmarks.bench_keyword_planner [số_người_dùng] [số_trang]
+
+Người dùng giả lập có họ tên theo phân bố Zipf. Tìm keyword trả về người
+dùng có username hoặc một từ trong tên bắt đầu bằng keyword, xếp theo độ
+nổi tiếng và bị cắt sau `max_scrolls` trang như Pinterest.
+1. Mô phỏng với cùng số trang kết quả (mỗi trang ~ một lần cuộn browser):
+   cách cũ (seed a-z0-9 rồi mọi từ trong tên, theo thứ tự thêm vào) so với
+   `KeywordPlanner` (keyword được nhắc tới nhiều trong tên trước, mở rộng
+   keyword bị cắt kết quả, bỏ keyword có prefix đã lấy đủ kết quả). Với
+   nửa số trang, planner phải mang về nhiều username mới trên mỗi trang hơn
+   cách cũ; với toàn bộ số trang, nhiều username hơn: cách cũ hết keyword
+   khi các tên phổ biến bị cắt kết quả.
+2. `crawl_usernames` (engine http) trên server giả lập và MongoDB giả lập:
+   chỉ keyword bị cắt kết quả được mở rộng, keyword chờ crawl đều có
+   `expectedYield`, `KeywordQueue` claim keyword có `expectedYield` cao
+   nhất, keyword có prefix đã lấy đủ kết quả bị bỏ qua khi lưu và được
+   claim mà không tìm, và trie nạp lại từ database khớp với số keyword đã
+   crawl.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import random
+import string
+import sys
+from typing import Dict, List, Optional, Set, Tuple
+
+import benchmarks.harness  # noqa: F401  MongoDB giả lập, import trước các module của crawler
+
+from app import CrawlerManager, KeywordQueue
+from benchmarks.fake_pinterest import FakePinterestServer
+from database import ensure_indexes, keywords_collection
+from modules.keyword_manager import create_keywords, save_keywords
+from modules.keyword_planner import KeywordPlanner, keyword_planner
+from utils.config import Config
+
+PAGE_SIZE = 25
+# Thời gian ước lượng của một trang kết quả trong browser: nghỉ giữa hai lần cuộn và chờ response
+PAGE_SECONDS = sum(Config.CRAWLER_CONFIG["scroll_delay"]) / 2 + 1.0
+SEEDS = string.ascii_lowercase + string.digits
+
+
+class UserWorld:
+    """Tập người dùng giả lập và kết quả tìm kiếm theo prefix"""
+
+    def __init__(self, total: int, seed: int = 0):
+        rng = random.Random(seed)
+        consonants, vowels = "bcdfghjklmnprstvwyz", "aeiou"
+        # Tên thật hay chung gốc (mari, maria, mariana): tên ngắn là prefix của tên dài
+        suffixes = ["", "a", "o", "e", "y", "an", "ana", "el", "ella", "ie", "ita", "son", "ton", "er"]
+
+        def names(count: int) -> List[str]:
+            pool: Set[str] = set()
+            while len(pool) < count:
+                start = rng.randrange(2)
+                stem = "".join(rng.choice(vowels if (start + i) % 2 else consonants) for i in range(rng.randint(3, 4)))
+                pool.update(stem + suffix for suffix in rng.sample(suffixes, rng.randint(1, 4)))
+            ordered = sorted(pool)
+            rng.shuffle(ordered)
+            return ordered[:count]
+
+        firsts, lasts = names(300), names(1500)
+        first_weights = [1 / (rank + 1) for rank in range(len(firsts))]
+        last_weights = [1 / (rank + 1) ** 0.8 for rank in range(len(lasts))]
+        self.usernames: List[str] = []
+        self.tokens: List[Tuple[str, ...]] = []
+        for i in range(total):
+            first = rng.choices(firsts, first_weights)[0]
+            last = rng.choices(lasts, last_weights)[0]
+            self.usernames.append(f"{first}{last}{i}")
+            self.tokens.append((first, last))
+        # Độ nổi tiếng cố định: kết quả bị cắt luôn là cùng những người nổi tiếng nhất
+        order = sorted(range(total), key=lambda _: rng.random())
+        self.rank = {user: position for position, user in enumerate(order)}
+        self._index: Dict[str, List[int]] = {}
+        for user in range(total):
+            for word in {self.usernames[user], *self.tokens[user]}:
+                for length in range(1, min(len(word), 4) + 1):
+                    self._index.setdefault(word[:length], []).append(user)
+        for users in self._index.values():
+            users.sort(key=self.rank.__getitem__)
+
+    def matches(self, query: str) -> List[int]:
+        """Người dùng khớp `query`, nổi tiếng trước"""
+        users = self._index.get(query[:4], [])
+        if len(query) > 4:
+            users = [
+                user for user in users
+                if any(word.startswith(query) for word in (self.usernames[user], *self.tokens[user]))
+            ]
+        return list(dict.fromkeys(users))
+
+    def search(self, query: str, max_pages: int) -> Tuple[List[int], int, bool]:
+        """(người dùng trả về, số trang, bị cắt) khi cuộn tối đa `max_pages` trang"""
+        users = self.matches(query)
+        shown = users[: PAGE_SIZE * max_pages]
+        pages = max(1, math.ceil(len(shown) / PAGE_SIZE))
+        return shown, pages, len(users) > len(shown)
+
+
+def simulate(world: UserWorld, budget: int, max_pages: int, planner: Optional[KeywordPlanner]) -> Dict[str, float]:
+    """Crawl keyword tới khi hết `budget` trang, username mới sinh ra keyword từ tên như crawl profile
+
+    Frontier giữ điểm và thời điểm cập nhật của mỗi keyword như document
+    trong database (`save_keywords`: `$max` điểm, `mentionedAt` mới) và lấy
+    keyword theo thứ tự của `FrontierLease`. Cách cũ: mọi keyword cùng điểm,
+    theo thứ tự thêm vào (như sắp theo `_id`).
+    """
+    known_users: Set[int] = set()
+    known_keywords: Set[str] = set(SEEDS)
+    frontier: List[Tuple[float, int, str]] = []
+    latest: Dict[str, Tuple[float, int]] = {}
+    clock = itertools.count()
+
+    def push(keywords: Dict[str, float]) -> None:
+        for keyword, score in keywords.items():
+            score = max(score, latest.get(keyword, (score, 0))[0])
+            latest[keyword] = (score, next(clock))
+            heapq.heappush(frontier, (-score, latest[keyword][1], keyword))
+
+    # Seed của `create_keywords`, planner nạp chúng như keyword chờ crawl (`load`)
+    seeds = dict.fromkeys(SEEDS, float(Config.KEYWORD_CONFIG["planner"]["mention_cap"]))
+    push(seeds)
+    if planner is not None:
+        planner.track(seeds)
+    pages = queries = skipped = writes = 0
+    while frontier and pages < budget:
+        score, mentioned, keyword = heapq.heappop(frontier)
+        if latest.get(keyword) != (-score, mentioned):
+            continue
+        del latest[keyword]
+        if planner is not None and planner.is_covered(keyword):
+            # Như `crawl_usernames`: prefix đã lấy đủ kết quả, không cần tìm
+            planner.record(keyword, 0, 0, False)
+            skipped += 1
+            continue
+        users, used, saturated = world.search(keyword, max_pages)
+        pages += used
+        queries += 1
+        new = [user for user in users if user not in known_users]
+        known_users.update(new)
+        words = [token for user in new for token in world.tokens[user]]
+        if planner is None:
+            tokens = set(words) - known_keywords
+            known_keywords.update(tokens)
+            writes += len(tokens)
+            push(dict.fromkeys(tokens, 0.0))
+            continue
+        planner.note_results(keyword, [world.usernames[user] for user in users])
+        push(planner.record(keyword, len(users), len(new), saturated))
+        planned = planner.plan(words)
+        writes += len(planned)
+        push(planned)
+
+    return {
+        "queries": queries, "skipped": skipped, "pages": pages, "new": len(known_users), "writes": writes,
+        "per_page": len(known_users) / max(pages, 1),
+        "per_minute": len(known_users) / max(pages * PAGE_SECONDS / 60, 1e-9),
+    }
+
+
+class WorldServer(FakePinterestServer):
+    """Server Pinterest giả lập trả kết quả tìm kiếm theo `UserWorld`"""
+
+    def __init__(self, world: UserWorld, **kwargs):
+        super().__init__(**kwargs)
+        self.world = world
+        self.queries: List[str] = []
+
+    def search_page(self, query: str, bookmark: Optional[str]) -> Optional[dict]:
+        self.queries.append(query)
+        users = self.world.matches(query)
+        number = int(bookmark.rsplit(":", 1)[1]) if bookmark else 0
+        start = number * PAGE_SIZE
+        last = start + PAGE_SIZE >= len(users)
+        results = [
+            {"type": "user", "id": str(user), "username": self.world.usernames[user],
+             "full_name": " ".join(self.world.tokens[user]).title()}
+            for user in users[start:start + PAGE_SIZE]
+        ]
+        return {
+            "resource_response": {"status": "success", "data": {"results": results},
+                                  "bookmark": "-end-" if last else f"{query}:{number + 1}"},
+            "resource": {"name": "BaseSearchResource", "options": {"query": query, "scope": "users"}},
+        }
+
+
+def check_crawler(world: UserWorld) -> bool:
+    ensure_indexes()
+    create_keywords()
+    with WorldServer(world) as server:
+        Config.PINTEREST_BASE_URL = server.base_url
+        Config.RATE_CONFIG["requests_per_second"] = 0
+        asyncio.run(CrawlerManager.crawl_usernames(8, engine="http"))
+
+        crawled = {doc["keyword"]: doc for doc in keywords_collection.find({"isCrawl": True})}
+        pending = {doc["keyword"]: doc for doc in keywords_collection.find({"isCrawl": False})}
+        saturated = {keyword for keyword, doc in crawled.items() if doc.get("saturated")}
+        # Chỉ crawl username nên mọi keyword dài hơn seed đều là keyword mở rộng
+        expanded = {keyword[:-1] for keyword in {**crawled, **pending} if len(keyword) > 1}
+        ok = bool(expanded) and expanded <= saturated
+        ok = ok and all(doc.get("expectedYield") is not None for doc in pending.values())
+        print(
+            f"crawl_usernames: {len(crawled)} keyword đã crawl, {len(saturated)} bị cắt kết quả, "
+            f"mở rộng {len(expanded)} keyword, {len(pending)} keyword chờ crawl"
+        )
+
+        complete = sorted(keyword for keyword in crawled if keyword not in saturated)
+        if complete:
+            covered = complete[0] + "zz"
+            planned = keyword_planner.plan([covered, "zzzz"])
+            ok = ok and covered not in planned and "zzzz" in planned
+            print(f"Bỏ qua từ có prefix đã lấy đủ kết quả ({complete[0]}): {covered not in planned}")
+
+            # Keyword lưu trước khi prefix được tìm: được claim nhưng không tìm
+            save_keywords([covered], {covered: 1.0})
+            server.queries.clear()
+            asyncio.run(CrawlerManager.crawl_usernames(8, engine="http"))
+            doc = keywords_collection.find_one({"keyword": covered})
+            ok = ok and doc["isCrawl"] and covered not in server.queries
+            print(f"Keyword {covered} được claim mà không tìm: {covered not in server.queries}")
+
+    # Từ trong tên như `_process_keywords` (mỗi lần xuất hiện), được lưu kèm điểm theo số lần được nhắc tới
+    words = [token for user_tokens in world.tokens[:300] for token in user_tokens]
+    planned = keyword_planner.plan(words)
+    save_keywords(planned, planned)
+    pending = {doc["keyword"]: doc for doc in keywords_collection.find({"isCrawl": False})}
+    ok = ok and bool(pending) and all(doc.get("expectedYield") is not None for doc in pending.values())
+    claimed = KeywordQueue()._claim()
+    best = max((doc.get("expectedYield") or 0 for doc in pending.values()), default=None)
+    ok = ok and bool(claimed) and pending[claimed[0]].get("expectedYield") == best
+    print(
+        f"{len(planned)} keyword được lưu/cập nhật từ {len(set(words))} từ trong tên, claim {claimed[0]} "
+        f"(expectedYield {pending[claimed[0]].get('expectedYield'):.1f}, cao nhất {best:.1f})"
+    )
+
+    reloaded = KeywordPlanner()
+    reloaded.load()
+    crawled = keywords_collection.count_documents({"isCrawl": True})
+    ok = ok and reloaded.searched == crawled == keyword_planner.searched
+    print(f"Nạp lại trie: {reloaded.searched} keyword đã tìm")
+    return ok
+
+
+def main() -> None:
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    budget = int(sys.argv[2]) if len(sys.argv) > 2 else 6000
+    max_pages = 8
+    world = UserWorld(total)
+
+    results = {}
+    for name, planner in (("Cách cũ", None), ("Planner", KeywordPlanner)):
+        half = simulate(world, budget // 2, max_pages, planner and planner())
+        full = simulate(world, budget, max_pages, planner and planner())
+        results[name] = half, full
+        print(
+            f"{name}: {half['pages']} trang, {half['new']} username mới, {half['per_page']:.2f} username/trang "
+            f"(~{half['per_minute']:.0f} username/phút browser); {full['pages']} trang, {full['queries']} keyword "
+            f"(bỏ qua {full['skipped']}), {full['new']} username mới, {full['writes']} lệnh ghi keyword"
+        )
+    (baseline_half, baseline), (planned_half, planned) = results.values()
+    ok = planned_half["per_page"] > baseline_half["per_page"] and planned["new"] > baseline["new"]
+
+    # Trang ngắn hơn để nhiều seed bị cắt kết quả với số người dùng nhỏ của bước 2
+    Config.CRAWLER_CONFIG["max_scrolls"] = 1
+    ok = check_crawler(UserWorld(total // 10, seed=1)) and ok
+    print("OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Đo chi phí timer của metrics và kiểm tra endpoint /metrics
+
+Chạy: python -m benchmarks.bench_metrics [số_lần]
+
+1. So sánh vòng lặp rỗng với vòng lặp bọc `metrics.timer(...)` (label
+   worker khác nhau như khi chạy thật) để ra chi phí mỗi lần đo.
+2. Nhiều thread cùng ghi metric trong lúc endpoint local được đọc: text
+   trả về phải đúng định dạng Prometheus và số đếm khớp.
+"""
+import socket
+import sys
+import threading
+import time
+import urllib.request
+
+from modules.metrics import STAGE_SECONDS, MetricsExporter, MetricsRegistry, summarize
+
+THREADS = 8
+PER_THREAD = 5000
+
+
+def bench_timer(count: int) -> float:
+    """Chi phí (micro giây) của một lần `with registry.timer(...)`"""
+    registry = MetricsRegistry()
+    started = time.perf_counter()
+    for i in range(count):
+        pass
+    baseline = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for i in range(count):
+        with registry.timer("page_goto", f"profile-{i % 8}"):
+            pass
+    timed = time.perf_counter() - started
+    return (timed - baseline) / count * 1e6
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def check_endpoint() -> bool:
+    registry = MetricsRegistry()
+
+    def work(worker: int) -> None:
+        for i in range(PER_THREAD):
+            try:
+                with registry.timer("mongo_write", worker, collection="usernames"):
+                    if i % 100 == 0:
+                        raise ValueError("lỗi giả lập")
+            except ValueError:
+                pass
+
+    port = _free_port()
+    with MetricsExporter(registry.snapshot, port=port, summary_interval=0):
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        # Đọc endpoint trong lúc các thread đang ghi
+        urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics").read()
+        for thread in threads:
+            thread.join()
+        body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics").read().decode("utf-8")
+
+    counts = [
+        float(line.rsplit(" ", 1)[1]) for line in body.splitlines()
+        if line.startswith(f"{STAGE_SECONDS}_count{{")
+    ]
+    errors = [
+        float(line.rsplit(" ", 1)[1]) for line in body.splitlines()
+        if line.startswith("crawler_stage_errors_total{")
+    ]
+    ok = len(counts) == THREADS and sum(counts) == THREADS * PER_THREAD and sum(errors) == THREADS * PER_THREAD / 100
+    print(f"Endpoint: {len(body.splitlines())} dòng, {int(sum(counts))} lần đo, {int(sum(errors))} lỗi")
+    for line in summarize(registry.snapshot()):
+        print(f"  {line}")
+    return ok
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    cost = bench_timer(count)
+    print(f"Timer: {cost:.2f}µs mỗi lần đo ({count} lần)")
+    ok = check_endpoint()
+    print("OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
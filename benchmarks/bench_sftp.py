@@ -0,0 +1,82 @@
+"""Đo tốc độ upload avatar qua SFTP với server giả lập trong process
+
+Chạy: python -m benchmarks.bench_sftp [số_file] [batch_size]
+
+So sánh cách cũ (2 handshake SSH cho mỗi avatar) với SftpPool + upload
+theo batch của AvatarStorage. Độ trễ handshake/lệnh SFTP là giả lập.
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from benchmarks.sftp_standin import LocalSftpServer
+from modules.avatar_storage import AvatarStorage
+from modules.sftp_pool import SftpPool
+from utils.config import Config
+
+HANDSHAKE_LATENCY = 0.05
+OP_LATENCY = 0.002
+
+
+def bench_per_file(server: LocalSftpServer, count: int, content: bytes) -> float:
+    """Mô phỏng cách cũ: một phiên để listdir, một phiên để upload mỗi file"""
+    remote_dir = f"{Config.SFTP_CONFIG['remote_base_path']}/per_file"
+    started = time.monotonic()
+    for i in range(count):
+        session = server.connect()
+        try:
+            session.sftp.listdir(remote_dir)
+        except FileNotFoundError:
+            session.sftp.mkdir(remote_dir)
+        session.close()
+
+        session = server.connect()
+        with BytesIO(content) as file_obj:
+            session.sftp.putfo(file_obj, f"{remote_dir}/user_{i}.jpg")
+        session.close()
+    return time.monotonic() - started
+
+
+def bench_pooled(server: LocalSftpServer, count: int, batch_size: int, content: bytes) -> float:
+    """SftpPool + save_many, các batch chạy song song trên pool_size thread"""
+    pool = SftpPool(size=Config.SFTP_CONFIG["pool_size"], connect=server.connect)
+    storage = AvatarStorage(is_docker=True, sftp_pool=pool)
+    batches = [
+        [(content, f"pooled_{i}.jpg") for i in range(start, min(start + batch_size, count))]
+        for start in range(0, count, batch_size)
+    ]
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        results = list(executor.map(storage.save_many, batches))
+    elapsed = time.monotonic() - started
+    storage.close()
+
+    uploaded = sum(1 for paths in results for path in paths if path)
+    if uploaded != count:
+        raise RuntimeError(f"Chỉ upload được {uploaded}/{count} file")
+    return elapsed
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else Config.AVATAR_CONFIG["write_batch_size"]
+    content = os.urandom(30 * 1024)
+
+    with tempfile.TemporaryDirectory() as root:
+        Config.SFTP_CONFIG["remote_base_path"] = "/avatars"
+        os.makedirs(os.path.join(root, "avatars"))
+
+        server = LocalSftpServer(root, HANDSHAKE_LATENCY, OP_LATENCY)
+        elapsed = bench_per_file(server, count, content)
+        print(f"Mỗi file một kết nối: {count / elapsed:8.1f} file/s, {server.handshakes} handshake")
+
+        server = LocalSftpServer(root, HANDSHAKE_LATENCY, OP_LATENCY)
+        elapsed = bench_pooled(server, count, batch_size, content)
+        print(f"SftpPool + batch {batch_size:3d}:  {count / elapsed:8.1f} file/s, {server.handshakes} handshake")
+
+
+if __name__ == "__main__":
+    main()
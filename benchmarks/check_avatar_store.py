@@ -0,0 +1,255 @@
+"""Kiểm tra lưu avatar theo hash nội dung, index URL và tải lại có điều kiện
+
+Chạy: python -m benchmarks.check_avatar_store [số_username]
+
+`AvatarPipeline` tải avatar từ server giả lập, lưu local và ghi profile vào
+MongoDB giả lập. 10% username dùng chung URL ảnh mặc định, 20% có URL riêng
+nhưng cùng một ảnh.
+1. Lần crawl đầu: mỗi nội dung ảnh chỉ được lưu một file, mọi profile có
+   `avatar_hash` và `avatar_url` trỏ tới file đó.
+2. Crawl lại: URL đã có trong index, không request nào tới server.
+3. Crawl lại sau `revalidate_days`: chỉ gửi request có điều kiện, server
+   trả 304, không tải lại byte ảnh nào và không lưu file mới.
+4. Thư mục shard: nhiều process cùng lưu vào một thư mục avatar không ghi
+   quá `files_per_folder` file vào một shard, process khởi động lại ghi
+   tiếp shard chưa đầy của process đã dừng (kể cả khi được khởi động lại
+   với cùng hostname và pid) thay vì tạo thư mục mới, và
+   upload SFTP mất kết nối giữa batch dùng lại chỗ đã giữ khi thử lại
+   (không bỏ trống shard).
+5. Nhiều writer cùng lưu một ảnh (chế độ SFTP có nhiều writer): ảnh chỉ
+   được lưu một file, file ảnh gốc có đuôi theo định dạng ảnh.
+"""
+import asyncio
+import hashlib
+import math
+import os
+import sys
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import benchmarks.harness  # noqa: F401  MongoDB giả lập, import trước các module của crawler
+
+from benchmarks.fake_pinterest import FakePinterestServer, make_avatar_url
+from benchmarks.sftp_standin import LocalSftpClient, LocalSftpSession
+from database import ensure_indexes, profile_collection
+from modules.avatar_index import AvatarIndex
+from modules.avatar_pipeline import AvatarPipeline
+from modules.avatar_storage import AvatarStorage
+from modules.sftp_pool import SftpPool
+from modules.write_buffer import WriteBuffer
+from utils.config import Config
+
+REUSED_AVATAR = b"\xff\xd8\xff\xe0reused" * 1000
+
+
+def avatar_urls(server: FakePinterestServer, total: int) -> dict:
+    default_url = make_avatar_url(server.base_url, "default_avatar")
+    urls = {}
+    for i in range(total):
+        username = f"avatar_{i:05d}"
+        if i % 10 == 0:
+            urls[username] = default_url
+            continue
+        urls[username] = make_avatar_url(server.base_url, username)
+        if i % 10 in (1, 2):
+            server.avatar_overrides[f"{username}.jpg"] = REUSED_AVATAR
+    return urls
+
+
+async def crawl(urls: dict, index_path: str) -> AvatarPipeline:
+    async with WriteBuffer(flush_interval=0.1) as writes:
+        pipeline = AvatarPipeline(AvatarStorage(is_docker=False), writes=writes, index=AvatarIndex(index_path))
+        async with pipeline:
+            for username, url in urls.items():
+                await pipeline.submit(username, url)
+    return pipeline
+
+
+def stored_files(directory: str) -> int:
+    return sum(len([name for name in files if name.endswith(".jpg")]) for _, _, files in os.walk(directory))
+
+
+SHARD_SIZE = 20
+SHARD_PROCESSES = 4
+
+
+def shard_sizes(directory: str) -> Counter:
+    return Counter({
+        name: len(os.listdir(os.path.join(directory, name)))
+        for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name))
+    })
+
+
+def save_in_process(root: str, worker: int, total: int) -> None:
+    """Process con: lưu `total` ảnh vào thư mục avatar dùng chung theo từng batch nhỏ"""
+    Config.DIRECTORIES["avatars"] = root
+    storage = AvatarStorage(is_docker=False)
+    for start in range(0, total, 3):
+        storage.save_many([(b"avatar", f"{worker}_{i}.jpg") for i in range(start, min(start + 3, total))])
+
+
+class DroppingSftpClient(LocalSftpClient):
+    """Phiên SFTP mất kết nối sau `uploads` lần upload"""
+
+    def __init__(self, root: str, uploads: int):
+        super().__init__(root)
+        self.uploads = uploads
+
+    def putfo(self, *args, **kwargs):
+        if self.uploads == 0:
+            self.closed = True
+        self.uploads -= 1
+        return super().putfo(*args, **kwargs)
+
+
+def check_shards(root: str) -> bool:
+    ok = True
+    Config.AVATAR_CONFIG["files_per_folder"] = SHARD_SIZE
+    shared = os.path.join(root, "shared")
+    total = 50
+    with ProcessPoolExecutor(SHARD_PROCESSES) as pool:
+        list(pool.map(save_in_process, [shared] * SHARD_PROCESSES, range(SHARD_PROCESSES), [total] * SHARD_PROCESSES))
+    sizes = shard_sizes(shared)
+    print(f"Shard: {SHARD_PROCESSES} process lưu {sum(sizes.values())} file vào {len(sizes)} thư mục, "
+          f"nhiều nhất {max(sizes.values())} file/thư mục")
+    if sum(sizes.values()) != SHARD_PROCESSES * total or max(sizes.values()) > SHARD_SIZE:
+        ok = False
+        print(f"FAIL  mỗi shard tối đa {SHARD_SIZE} file")
+
+    # Mỗi lần chạy là một process mới, chạy sau khi process trước đã dừng
+    restarted = os.path.join(root, "restarted")
+    runs, per_run = 3, 5
+    for run in range(runs):
+        with ProcessPoolExecutor(1) as pool:
+            pool.submit(save_in_process, restarted, run, per_run).result()
+    sizes = shard_sizes(restarted)
+    print(f"Khởi động lại: {runs} lần chạy lưu {sum(sizes.values())} file vào {len(sizes)} thư mục")
+    if sizes != Counter({next(iter(sizes)): runs * per_run}):
+        ok = False
+        print("FAIL  process khởi động lại phải ghi tiếp shard chưa đầy")
+
+    # Khởi động lại với cùng hostname và pid (pid 1 trong container): file
+    # đánh dấu mang định danh của chính process, process cũ trông vẫn còn chạy
+    same_owner = os.path.join(root, "same_owner")
+    avatars_dir = Config.DIRECTORIES["avatars"]
+    for run in range(runs):
+        save_in_process(same_owner, run, per_run)
+    Config.DIRECTORIES["avatars"] = avatars_dir
+    sizes = shard_sizes(same_owner)
+    markers = [name for name in os.listdir(same_owner) if name.startswith(".")]
+    print(f"Khởi động lại cùng pid: {runs} lần chạy lưu {sum(sizes.values())} file vào {len(sizes)} thư mục, "
+          f"{len(markers)} file đánh dấu")
+    if sizes != Counter({next(iter(sizes)): runs * per_run}) or len(markers) != 1:
+        ok = False
+        print("FAIL  process khởi động lại cùng định danh phải ghi tiếp shard của lần chạy trước")
+
+    Config.SFTP_CONFIG["remote_base_path"] = "/remote"
+    remote = os.path.join(root, "remote")
+    os.makedirs(remote)
+    connections = iter([3, -1, -1])
+    storage = AvatarStorage(
+        is_docker=True,
+        sftp_pool=SftpPool(connect=lambda: LocalSftpSession(DroppingSftpClient(root, next(connections)))),
+    )
+    count = 2 * SHARD_SIZE + 5
+    paths = storage.save_many([(b"avatar", f"sftp_{i}.jpg") for i in range(count)])
+    sizes = shard_sizes(remote)
+    print(f"SFTP mất kết nối giữa batch: {sum(path is not None for path in paths)}/{count} file "
+          f"trong {len(sizes)} thư mục")
+    if None in paths or len(sizes) != math.ceil(count / SHARD_SIZE):
+        ok = False
+        print("FAIL  lần thử lại phải dùng lại chỗ đã giữ")
+    return ok
+
+
+PNG_AVATAR = b"\x89PNG\r\n\x1a\n" + b"concurrent" * 100
+
+
+async def write_concurrently(pipeline: AvatarPipeline, batches: list) -> None:
+    await asyncio.gather(*(pipeline._write_batch(batch) for batch in batches))
+
+
+def check_concurrent_writers(root: str) -> bool:
+    directory = os.path.join(root, "concurrent")
+    os.makedirs(directory)
+    Config.DIRECTORIES["avatars"] = directory
+    pipeline = AvatarPipeline(AvatarStorage(is_docker=False), index=AvatarIndex(os.path.join(directory, "index.sqlite3")))
+    digest = hashlib.sha256(PNG_AVATAR).hexdigest()
+    batches = [
+        [(PNG_AVATAR, f"concurrent_{writer}_{i}", digest, f"https://i.pinimg.com/{writer}_{i}.png", "", {})
+         for i in range(3)]
+        for writer in range(4)
+    ]
+    asyncio.run(write_concurrently(pipeline, batches))
+    names = [name for _, _, files in os.walk(directory) for name in files if name.startswith(digest)]
+    print(
+        f"Writer song song: {pipeline.downloaded} avatar, {len(names)} file {names[:1]}, "
+        f"{pipeline.deduplicated} ảnh trùng"
+    )
+    ok = True
+    if len(names) != 1 or pipeline.downloaded != 12 or pipeline.deduplicated != 11:
+        ok = False
+        print("FAIL  nhiều writer cùng lưu một ảnh chỉ được lưu một file")
+    if names and not names[0].endswith(".png"):
+        ok = False
+        print("FAIL  ảnh PNG lưu nguyên bản gốc phải có đuôi .png")
+    return ok
+
+
+def main() -> None:
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    ok = True
+    ensure_indexes()
+    with tempfile.TemporaryDirectory() as root, FakePinterestServer() as server:
+        Config.DIRECTORIES["avatars"] = root
+        Config.PINIMG_BASE_URL = server.base_url
+        index_path = os.path.join(root, "index.sqlite3")
+        urls = avatar_urls(server, total)
+        profile_collection.insert_many([{"username": username} for username in urls])
+        unique_contents = 2 + sum(1 for i in range(total) if i % 10 not in (0, 1, 2))
+
+        pipeline = asyncio.run(crawl(urls, index_path))
+        files = stored_files(root)
+        profiles = list(profile_collection.find({}, {"username": 1, "avatar_url": 1, "avatar_hash": 1}))
+        hashes = {doc.get("avatar_hash") for doc in profiles}
+        print(
+            f"Lần 1: {pipeline.downloaded} avatar, {files} file cho {unique_contents} ảnh khác nhau, "
+            f"{pipeline.deduplicated} ảnh trùng không lưu lại, {server.avatar_requests} request, "
+            f"{server.avatar_bytes // 1024}KB"
+        )
+        if files != unique_contents or len(hashes) != unique_contents or None in hashes:
+            ok = False
+            print("FAIL  mỗi ảnh phải được lưu đúng một file và mọi profile phải có avatar_hash")
+        if any(not doc.get("avatar_url", "").startswith(root) for doc in profiles):
+            ok = False
+            print("FAIL  avatar_url của profile phải trỏ tới file đã lưu")
+
+        requests, sent = server.avatar_requests, server.avatar_bytes
+        pipeline = asyncio.run(crawl(urls, index_path))
+        print(f"Lần 2: {pipeline.index_hits} URL đã biết, {server.avatar_requests - requests} request")
+        if server.avatar_requests != requests or pipeline.index_hits != total:
+            ok = False
+            print("FAIL  URL đã có trong index không được gọi mạng")
+
+        Config.AVATAR_CONFIG["revalidate_days"] = 0
+        requests = server.avatar_requests
+        pipeline = asyncio.run(crawl(urls, index_path))
+        print(
+            f"Lần 3 (kiểm tra lại): {server.avatar_requests - requests} request có điều kiện, "
+            f"{pipeline.not_modified} ảnh không đổi, {server.avatar_bytes - sent} byte tải lại, "
+            f"{stored_files(root)} file"
+        )
+        if pipeline.not_modified != total or server.avatar_bytes != sent or stored_files(root) != files:
+            ok = False
+            print("FAIL  ảnh không đổi phải được bỏ qua bằng 304")
+
+        ok = check_shards(root) and ok
+        ok = check_concurrent_writers(root) and ok
+
+    print("OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
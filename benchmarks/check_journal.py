@@ -0,0 +1,340 @@
+"""Kiểm tra journal của write buffer khi process crawler bị kill và khi nhận SIGTERM
+
+Chạy: python -m benchmarks.check_journal [số_username]
+
+Process con chạy `crawl_profiles` (fast path HTTP) với server Pinterest giả
+lập và MongoDB giả lập, write buffer không tự flush trong lúc chạy nên mọi
+profile đã crawl chỉ nằm trong buffer và journal.
+1. SIGKILL giữa chừng: đọc lại journal (trên MongoDB giả lập của process
+   này) phải ghi được đúng các profile đã vào journal, username tương ứng
+   được đánh dấu đã crawl nên không bị claim lại, journal rỗng sau đó.
+   Journal được đọc sau khi process con đã dừng hẳn, đếm theo nội dung
+   (bỏ dòng cắt dở) chứ không theo số dòng, nên kết quả không phụ thuộc
+   thời điểm kill. Process kiểm tra (cùng host, pid khác) nhận journal của
+   process con đã chết.
+2. SIGTERM giữa chừng: process con phải ghi xong mọi profile đã crawl trước
+   khi thoát (mã 0), không để lại journal và trả lease mọi username chưa
+   crawl (kể cả username của batch đang crawl dở).
+3. MongoDB không kết nối được khi flush: các lệnh lỗi được giữ lại trong
+   journal và được ghi lại ở lần chạy sau; khi tắt journal, được giữ lại
+   trong buffer và ghi ở lượt flush sau. Keyword ghi lại sau lỗi giữ số
+   username mới tính ở lần ghi đầu.
+4. Crawler bị dừng khi producer đang claim batch trong thread: lượt claim
+   được chờ xong trước khi trả lease, không username nào còn giữ lease.
+"""
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("AVATAR_STORAGE", "local")
+
+import benchmarks.harness  # noqa: F401  MongoDB giả lập, import trước các module của crawler
+
+from pymongo.errors import ConnectionFailure
+
+from app import CrawlerManager, UsernameQueue, run_crawler
+from benchmarks.fake_pinterest import FakePinterestServer
+from database import ensure_indexes, keywords_collection, profile_collection, usernames_collection
+from modules import write_buffer
+from modules.pinterest import crawl_stats
+from modules.write_buffer import WriteBuffer
+from modules.write_journal import WriteJournal
+from utils.config import Config
+
+RESULT_PREFIX = "RESULT "
+
+
+def usernames_for(total: int):
+    return [f"journal_{i:05d}" for i in range(total)]
+
+
+def run_child(total: int, journal_dir: str) -> None:
+    """Process con: crawl profile, không flush write buffer cho tới khi dừng"""
+    Config.JOURNAL_CONFIG["dir"] = journal_dir
+    Config.WRITE_BUFFER_CONFIG.update(max_ops=10 ** 6, flush_interval=3600)
+    Config.RATE_CONFIG["requests_per_second"] = 0
+    Config.DIRECTORIES["avatars"] = tempfile.mkdtemp()
+    ensure_indexes()
+    usernames_collection.insert_many([{"username": username, "isCrawl": False} for username in usernames_for(total)])
+
+    run_crawler(CrawlerManager.crawl_profiles(2, 10, 4))
+    print(RESULT_PREFIX + json.dumps({
+        "crawled": crawl_stats["profiles"],
+        "saved": profile_collection.count_documents({}),
+        "marked": usernames_collection.count_documents({"isCrawl": True}),
+        "leased": usernames_collection.count_documents({"isCrawl": False, "leaseUntil": {"$ne": None}}),
+    }), flush=True)
+
+
+def journal_files(directory: str) -> list:
+    return [os.path.join(root, name) for root, _, files in os.walk(directory) for name in files]
+
+
+def journal_lines(directory: str) -> int:
+    total = 0
+    for path in journal_files(directory):
+        with open(path, encoding="utf-8") as f:
+            total += sum(1 for _ in f)
+    return total
+
+
+def journaled_usernames(directory: str) -> tuple:
+    """(username có profile, username được đánh dấu đã crawl) trong journal, bỏ qua dòng cắt dở"""
+    records = list(WriteJournal._read(journal_files(directory)))
+    profiles = {record["key"] for record in records if record["bucket"] == "profiles"}
+    marked = {
+        record["key"] for record in records
+        if record["bucket"] == "usernames" and record["update"].get("$set", {}).get("isCrawl")
+    }
+    return profiles, marked
+
+
+def start_child(total: int, journal_dir: str, base_url: str) -> subprocess.Popen:
+    env = dict(os.environ, PINTEREST_BASE_URL=base_url, PINIMG_BASE_URL=base_url, METRICS_PORT="0")
+    return subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.check_journal", "--child", str(total), journal_dir],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+
+
+def wait_for_journal(child: subprocess.Popen, journal_dir: str, lines: int, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while journal_lines(journal_dir) < lines:
+        if child.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError("process con dừng hoặc quá thời gian trước khi ghi đủ journal")
+        time.sleep(0.05)
+
+
+def check_kill(server: FakePinterestServer, total: int) -> bool:
+    with tempfile.TemporaryDirectory() as journal_dir:
+        child = start_child(total, journal_dir, server.base_url)
+        # Mỗi profile tạo hai lệnh: upsert profile và đánh dấu username
+        wait_for_journal(child, journal_dir, total // 2)
+        child.send_signal(signal.SIGKILL)
+        child.wait()
+
+        # Đọc sau khi process con đã dừng hẳn: journal không còn thay đổi
+        profiles, marked_in_journal = journaled_usernames(journal_dir)
+        usernames_collection.insert_many(
+            [{"username": username, "isCrawl": False} for username in usernames_for(total)]
+        )
+
+        async def replay() -> list:
+            # Journal của process mới (cùng host, pid khác) nhận journal của process con đã chết
+            async with WriteBuffer(journal=WriteJournal.for_process()):
+                pass
+            batches = await asyncio.to_thread(UsernameQueue(batch_size=total)._claim)
+            return [item["username"] for batch in batches for item in batch]
+
+        Config.JOURNAL_CONFIG["dir"] = journal_dir
+        claimed = asyncio.run(replay())
+        saved = profile_collection.count_documents({})
+        marked = usernames_collection.count_documents({"isCrawl": True})
+        left = journal_files(journal_dir)
+
+    print(
+        f"SIGKILL: {len(profiles)} profile và {len(marked_in_journal)} username đã crawl trong journal, "
+        f"đọc lại ghi được {saved} profile, {marked} username đã crawl, "
+        f"claim lại {len(claimed)}/{total - marked} username còn lại, journal còn {len(left)} file"
+    )
+    return 0 < len(profiles) < total and saved == len(profiles) and marked == len(marked_in_journal) \
+        and len(claimed) == total - marked and not left
+
+
+def check_sigterm(server: FakePinterestServer, total: int) -> bool:
+    with tempfile.TemporaryDirectory() as journal_dir:
+        child = start_child(total, journal_dir, server.base_url)
+        wait_for_journal(child, journal_dir, total // 2)
+        child.send_signal(signal.SIGTERM)
+        output, _ = child.communicate(timeout=60)
+        left = len(journal_files(journal_dir))
+
+    results = [line for line in output.splitlines() if line.startswith(RESULT_PREFIX)]
+    if child.returncode != 0 or not results:
+        print(f"SIGTERM: process con thoát với mã {child.returncode}, không có kết quả")
+        return False
+    result = json.loads(results[-1][len(RESULT_PREFIX):])
+    print(
+        f"SIGTERM: đã crawl {result['crawled']} profile, đã ghi {result['saved']} profile và "
+        f"{result['marked']} username trước khi thoát, journal còn {left} file, "
+        f"{result['leased']} username chưa crawl còn giữ lease"
+    )
+    return 0 < result["crawled"] == result["saved"] == result["marked"] and left == 0 and result["leased"] == 0
+
+
+class UnavailableCollection:
+    """Collection của MongoDB đang không kết nối được"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def bulk_write(self, *args, **kwargs):
+        raise ConnectionFailure(f"{self.name}: không kết nối được MongoDB")
+
+
+def check_outage(total: int) -> bool:
+    """Flush khi MongoDB không kết nối được giữ lệnh trong journal, lần chạy sau ghi lại"""
+    usernames = [f"outage_{i:05d}" for i in range(total)]
+    # Username đã claim: trạng thái crawl chỉ cập nhật document có sẵn
+    usernames_collection.insert_many([{"username": username, "isCrawl": False} for username in usernames])
+    available = write_buffer.profile_collection, write_buffer.usernames_collection
+
+    async def crawl() -> int:
+        async with WriteBuffer(journal=WriteJournal.for_process()) as writes:
+            for username in usernames:
+                writes.upsert_profile({"username": username, "full_name": username})
+                writes.mark_username_crawled(username)
+            await writes.flush()
+        return writes.failed
+
+    async def replay() -> None:
+        async with WriteBuffer(journal=WriteJournal.for_process()):
+            pass
+
+    with tempfile.TemporaryDirectory() as journal_dir:
+        Config.JOURNAL_CONFIG["dir"] = journal_dir
+        write_buffer.profile_collection = UnavailableCollection("profiles")
+        write_buffer.usernames_collection = UnavailableCollection("usernames")
+        try:
+            failed = asyncio.run(crawl())
+        finally:
+            write_buffer.profile_collection, write_buffer.usernames_collection = available
+        kept, _ = journaled_usernames(journal_dir)
+        asyncio.run(replay())
+        saved = profile_collection.count_documents({"username": {"$in": usernames}})
+        marked = usernames_collection.count_documents({"username": {"$in": usernames}, "isCrawl": True})
+        left = journal_files(journal_dir)
+
+    print(
+        f"MongoDB lỗi khi flush: {failed} lệnh lỗi, journal giữ {len(kept)} profile; "
+        f"lần chạy sau ghi được {saved} profile, {marked} username đã crawl, journal còn {len(left)} file"
+    )
+    return failed > 0 and len(kept) == saved == marked == total and not left
+
+
+def check_outage_without_journal(total: int) -> bool:
+    """Journal tắt: lệnh ghi lỗi được giữ trong buffer và ghi ở lượt flush sau"""
+    usernames = [f"memory_{i:05d}" for i in range(total)]
+    usernames_collection.insert_many([{"username": username, "isCrawl": False} for username in usernames])
+    available = write_buffer.profile_collection, write_buffer.usernames_collection
+
+    async def crawl() -> tuple:
+        async with WriteBuffer() as writes:
+            for username in usernames:
+                writes.upsert_profile({"username": username, "full_name": username})
+                writes.mark_username_crawled(username)
+            write_buffer.profile_collection = UnavailableCollection("profiles")
+            write_buffer.usernames_collection = UnavailableCollection("usernames")
+            try:
+                await writes.flush()
+            finally:
+                write_buffer.profile_collection, write_buffer.usernames_collection = available
+            kept = writes.pending
+        return writes.failed, kept
+
+    failed, kept = asyncio.run(crawl())
+    saved = profile_collection.count_documents({"username": {"$in": usernames}})
+    marked = usernames_collection.count_documents({"username": {"$in": usernames}, "isCrawl": True})
+    print(
+        f"MongoDB lỗi khi flush, journal tắt: {failed} lệnh lỗi, buffer giữ {kept} lệnh; "
+        f"lượt flush sau ghi được {saved} profile, {marked} username đã crawl"
+    )
+    return failed > 0 and kept == 2 * total and saved == marked == total
+
+
+def check_keyword_retry(total: int) -> bool:
+    """Ghi keyword lỗi rồi ghi lại: số username mới của keyword tính ở lần ghi đầu không bị mất"""
+    keyword = "retrykw"
+    usernames = [f"retry_{i:05d}" for i in range(total)]
+    keywords_collection.insert_one({"keyword": keyword, "isCrawl": False})
+    available = write_buffer.keywords_collection
+
+    async def crawl() -> None:
+        async with WriteBuffer() as writes:
+            for username in usernames:
+                writes.add_username(username, source=keyword)
+            writes.mark_keyword_crawled(keyword, found=total)
+            write_buffer.keywords_collection = UnavailableCollection("keywords")
+            try:
+                await writes.flush()
+            finally:
+                write_buffer.keywords_collection = available
+
+    asyncio.run(crawl())
+    doc = keywords_collection.find_one({"keyword": keyword})
+    print(f"Ghi lại keyword sau lỗi: yieldScore {doc.get('yieldScore')}, totalNew {doc.get('totalNew')} (cần {total})")
+    return doc.get("isCrawl") is True and doc.get("yieldScore") == doc.get("totalNew") == total
+
+
+CLAIM_SECONDS = 0.5
+
+
+class SlowClaimQueue(UsernameQueue):
+    """Claim trong database chậm: crawler bị dừng khi lượt claim còn chạy trong thread"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.claiming = threading.Event()
+
+    def _claim(self, limit=None):
+        self.claiming.set()
+        time.sleep(CLAIM_SECONDS)
+        return super()._claim(limit)
+
+
+def check_stop_during_claim(total: int) -> bool:
+    """Dừng crawler giữa lượt claim: username của lượt claim đó được trả lease"""
+    usernames = [f"stopping_{i:05d}" for i in range(total)]
+    Config.DIRECTORIES["avatars"] = tempfile.mkdtemp()
+    usernames_collection.insert_many([{"username": username, "isCrawl": False} for username in usernames])
+
+    async def crawl() -> None:
+        queue = SlowClaimQueue(batch_size=10)
+        async with WriteBuffer() as writes:
+            task = asyncio.create_task(CrawlerManager._run_profile_workers(queue, 1, 1, writes))
+            await asyncio.to_thread(queue.claiming.wait)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(crawl())
+    # Lượt claim chưa được chờ sẽ ghi lease sau khi crawler đã trả lease
+    time.sleep(CLAIM_SECONDS)
+    leased = usernames_collection.count_documents({"username": {"$in": usernames}, "leaseUntil": {"$ne": None}})
+    print(f"Dừng khi đang claim: {leased} username còn giữ lease")
+    return leased == 0
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        run_child(int(sys.argv[2]), sys.argv[3])
+        return
+
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    ensure_indexes()
+    with FakePinterestServer() as server:
+        # Đủ chậm để process con bị dừng giữa chừng
+        server.profile_latency = 0.02
+        for i, username in enumerate(usernames_for(total)):
+            server.add_profile({
+                "id": str(i), "username": username, "full_name": f"Journal {i}", "about": "journal",
+                "follower_count": i, "following_count": i,
+            })
+        ok = check_kill(server, total)
+        ok = check_sigterm(server, total) and ok
+    ok = check_outage(total // 10) and ok
+    ok = check_outage_without_journal(total // 10) and ok
+    ok = check_keyword_retry(total // 10) and ok
+    ok = check_stop_during_claim(total // 10) and ok
+
+    print("OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
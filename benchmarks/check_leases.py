@@ -0,0 +1,112 @@
+"""Kiểm tra giao thức lease khi nhiều crawler cùng claim một backlog
+
+Chạy với MongoDB giả lập (nhiều thread trong một process):
+    python -m benchmarks.check_leases
+Chạy với mongod local (nhiều process):
+    python -m benchmarks.check_leases --mongo mongodb://localhost:27017
+
+Một claimer "chết" giữa chừng (claim rồi không xử lý), các claimer còn lại
+phải claim lại phần việc đó sau khi lease hết hạn. Mỗi username phải được
+xử lý đúng một lần.
+"""
+import argparse
+import multiprocessing
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import List
+
+from benchmarks.memory_mongo import MemoryCollection
+from modules.work_lease import WorkLease
+
+LEASE_SECONDS = 1
+
+
+def run_claimer(collection, owner: str, batch_size: int) -> List[str]:
+    """Claim và "crawl" cho tới khi không còn item, trả về username đã xử lý"""
+    lease = WorkLease(collection, "username", owner_id=owner, lease_seconds=LEASE_SECONDS)
+    processed: List[str] = []
+    idle_rounds = 0
+    while idle_rounds < 3:
+        batch = lease.claim(batch_size, {"username": 1})
+        if not batch:
+            # Chờ lease của claimer chết hết hạn rồi thử lại
+            idle_rounds += 1
+            time.sleep(LEASE_SECONDS)
+            continue
+        idle_rounds = 0
+        usernames = [doc["username"] for doc in batch]
+        collection.update_many({"username": {"$in": usernames}}, {"$set": {"isCrawl": True}})
+        lease.finish(usernames)
+        processed.extend(usernames)
+    return processed
+
+
+def crash_claimer(collection, batch_size: int) -> None:
+    """Claim một batch rồi bỏ dở như container bị kill"""
+    WorkLease(collection, "username", owner_id="crashed", lease_seconds=LEASE_SECONDS).claim(batch_size)
+
+
+def _process_claimer(mongo_url: str, db_name: str, owner: str, batch_size: int) -> List[str]:
+    from pymongo import MongoClient
+
+    collection = MongoClient(mongo_url)[db_name]["usernames"]
+    return run_claimer(collection, owner, batch_size)
+
+
+def check(processed: List[str], total: int) -> int:
+    counts = Counter(processed)
+    duplicates = [name for name, count in counts.items() if count > 1]
+    missing = total - len(counts)
+    print(f"Đã xử lý {len(counts)}/{total} username, {len(duplicates)} bị trùng, {missing} bị sót")
+    return 1 if duplicates or missing else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo", help="URL mongod local, bỏ trống để dùng MongoDB giả lập")
+    parser.add_argument("--claimers", type=int, default=4)
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+
+    docs = [{"username": f"user_{i:06d}", "isCrawl": False} for i in range(args.items)]
+
+    if args.mongo:
+        from pymongo import MongoClient
+
+        db_name = f"lease_check_{uuid.uuid4().hex[:8]}"
+        client = MongoClient(args.mongo)
+        collection = client[db_name]["usernames"]
+        collection.insert_many(docs)
+        crash_claimer(collection, args.batch_size)
+        try:
+            with multiprocessing.get_context("spawn").Pool(args.claimers) as pool:
+                results = pool.starmap(
+                    _process_claimer,
+                    [(args.mongo, db_name, f"proc-{i}", args.batch_size) for i in range(args.claimers)],
+                )
+        finally:
+            client.drop_database(db_name)
+    else:
+        collection = MemoryCollection("usernames")
+        collection.insert_many(docs)
+        crash_claimer(collection, args.batch_size)
+        results = [[] for _ in range(args.claimers)]
+
+        def target(index: int) -> None:
+            results[index] = run_claimer(collection, f"thread-{index}", args.batch_size)
+
+        threads = [threading.Thread(target=target, args=(i,)) for i in range(args.claimers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    sys.exit(check([name for result in results for name in result], args.items))
+
+
+if __name__ == "__main__":
+    main()
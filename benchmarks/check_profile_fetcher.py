@@ -0,0 +1,115 @@
+"""Kiểm tra fast path HTTP lấy profile với các trang profile đã lưu
+
+Chạy: python -m benchmarks.check_profile_fetcher
+
+Mỗi file `fixtures/profiles/<username>.html` được phục vụ từ server local,
+kết quả trích xuất được so sánh với `<username>.expected.json`. Profile
+không tồn tại (HTTP 404) và server lỗi (HTTP 500) phải báo đúng loại lỗi
+mà không chuyển sang browser, 404 tính là request thành công với rate
+control còn 500 là bị throttle. Profile có username trong JSON khác chữ hoa
+với username đã claim được ghi theo username đã claim (MongoDB giả lập),
+không tạo document username mới.
+"""
+import asyncio
+import json
+import os
+import sys
+
+from benchmarks.harness import NoBrowserPool, RecordingLimiter
+
+from benchmarks.fake_pinterest import FIXTURE_DIR, FakePinterestServer, render_profile_html
+from database import profile_collection, usernames_collection
+from modules.browser_pool import LazyLease
+from modules.pinterest import FAILURE_NO_PROPS, FAILURE_THROTTLED, PinterestCrawler, ProfileFetchError
+from modules.profile_fetcher import ProfileHttpFetcher
+from modules.rate_control import AdaptiveLimiter
+from modules.write_buffer import WriteBuffer
+from utils.config import Config
+
+
+async def check_profiles(server: FakePinterestServer) -> int:
+    """Trả về số profile không khớp với expected"""
+    failures = 0
+    # Chunk nhỏ để kiểm tra parser streaming và ký tự UTF-8 bị cắt giữa chunk
+    ProfileHttpFetcher.CHUNK_SIZE = 97
+    async with ProfileHttpFetcher() as fetcher:
+        for username in sorted(server.profiles):
+            expected_path = os.path.join(FIXTURE_DIR, "profiles", f"{username}.expected.json")
+            with open(expected_path, encoding="utf-8") as f:
+                expected = json.load(f)
+
+            data = await fetcher.fetch_initial_props(username)
+            profile = PinterestCrawler._parse_profile_data(data or {}, username)
+            actual = profile.to_dict() if profile else None
+            if actual == expected:
+                print(f"OK    {username}")
+            else:
+                failures += 1
+                print(f"FAIL  {username}\n  expected: {expected}\n  actual:   {actual}")
+
+    return failures
+
+
+async def check_status_handling(server: FakePinterestServer) -> int:
+    """404 là thành công với rate control, 429/5xx được hẹn thử lại, cả hai không mở browser"""
+    failures = 0
+    pool = NoBrowserPool()
+    limiter = RecordingLimiter()
+    cases = [
+        ("HTTP 404", "khong_ton_tai", 0.0, FAILURE_NO_PROPS, (True, False)),
+        ("HTTP 500", sorted(server.profiles)[0], 1.0, FAILURE_THROTTLED, (False, True)),
+    ]
+    async with ProfileHttpFetcher() as fetcher:
+        crawler = PinterestCrawler(pool, None, fetcher=fetcher, limiter=limiter)
+        for label, username, error_rate, expected, outcome in cases:
+            server.error_rates["profile"] = error_rate
+            category = None
+            try:
+                async with LazyLease(pool) as lease:
+                    await crawler._fetch_profile(lease, asyncio.Semaphore(1), username)
+            except ProfileFetchError as e:
+                category = e.category
+            if (category, limiter.outcomes[-1], pool.leases) == (expected, outcome, 0):
+                print(f"OK    {label}: lỗi {category}, rate control (ok, throttled) = {outcome}")
+            else:
+                failures += 1
+                print(
+                    f"FAIL  {label}: lỗi {category} (cần {expected}), rate control {limiter.outcomes[-1]} "
+                    f"(cần {outcome}), mượn browser {pool.leases} lần"
+                )
+    server.error_rates["profile"] = 0.0
+    return failures
+
+
+async def check_claimed_username(server: FakePinterestServer) -> int:
+    """Pinterest trả username khác chữ hoa: profile và trạng thái crawl ghi theo username đã claim"""
+    claimed = "caseuser"
+    server.profiles[claimed] = render_profile_html({
+        "id": "42", "username": "CaseUser", "full_name": "Case User", "follower_count": 3, "following_count": 1,
+    })
+    usernames_collection.insert_one({"username": claimed, "isCrawl": False})
+    async with ProfileHttpFetcher() as fetcher, WriteBuffer() as writes:
+        crawler = PinterestCrawler(NoBrowserPool(), writes, fetcher=fetcher, limiter=AdaptiveLimiter(rate=0))
+        failures = await crawler.crawl_user_profile([{"username": claimed}])
+
+    usernames = {doc["username"]: doc.get("isCrawl") for doc in usernames_collection.find({})}
+    profiles = [doc["username"] for doc in profile_collection.find({})]
+    if not failures and usernames == {claimed: True} and profiles == [claimed]:
+        print(f"OK    username khác chữ hoa: ghi theo {claimed}")
+        return 0
+    print(f"FAIL  username khác chữ hoa: lỗi {failures}, usernames {usernames}, profiles {profiles}")
+    return 1
+
+
+def main() -> None:
+    with FakePinterestServer() as server:
+        server.load_profile_fixtures()
+        Config.PINTEREST_BASE_URL = server.base_url
+        failures = asyncio.run(check_profiles(server))
+        failures += asyncio.run(check_status_handling(server))
+        failures += asyncio.run(check_claimed_username(server))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Kiểm tra điều chỉnh concurrency (AIMD) và token bucket với server giả lập throttle
+
+Chạy: python -m benchmarks.check_rate_control [số_profile]
+
+1. Server trả HTTP 429 khi có quá `max_concurrent` request profile đồng
+   thời. Limiter bắt đầu với concurrency cao phải giảm xuống quanh ngưỡng
+   của server, tỉ lệ 429 ở nửa sau phải thấp hơn nửa đầu và mọi profile
+   vẫn lấy được (request bị 429 được thử lại).
+2. Không throttle, token bucket phải giữ tốc độ không vượt
+   `requests_per_second` (cộng phần burst).
+3. Page profile đang chờ browser pool (khởi động lại browser) không giữ
+   slot của limiter: request khác vẫn lấy được slot khi limiter chỉ còn 1.
+4. Chạy nhiều process: limiter tạo sau khi chia (`share_rate`) nhận phần
+   tốc độ và burst của process.
+"""
+import asyncio
+import sys
+import time
+from contextlib import asynccontextmanager
+
+import benchmarks.harness  # noqa: F401  MongoDB giả lập, import trước các module của crawler
+
+from benchmarks.fake_pinterest import FakePinterestServer
+from modules.browser_pool import LazyLease
+from modules.pinterest import PinterestCrawler
+from modules.profile_fetcher import ProfileHttpError, ProfileHttpFetcher
+from modules.rate_control import AdaptiveLimiter, share_rate
+from utils.config import Config
+
+SERVER_MAX_CONCURRENT = 8
+TASKS = 64
+
+
+async def fetch_all(fetcher: ProfileHttpFetcher, limiter: AdaptiveLimiter, usernames, on_result=None) -> int:
+    """Lấy hết profile qua limiter, thử lại profile lỗi; trả về số request đã gửi"""
+    queue: asyncio.Queue = asyncio.Queue()
+    for username in usernames:
+        queue.put_nowait(username)
+    sent = 0
+
+    async def worker() -> None:
+        nonlocal sent
+        while not queue.empty():
+            username = queue.get_nowait()
+            async with limiter.request() as outcome:
+                sent += 1
+                try:
+                    outcome.ok = await fetcher.fetch_initial_props(username) is not None
+                except ProfileHttpError as e:
+                    outcome.throttled = e.throttled
+            if on_result is not None:
+                on_result(outcome.ok)
+            if not outcome.ok:
+                queue.put_nowait(username)
+
+    await asyncio.gather(*[worker() for _ in range(TASKS)])
+    return sent
+
+
+async def check_aimd(server: FakePinterestServer, usernames) -> bool:
+    server.max_concurrent = SERVER_MAX_CONCURRENT
+    server.profile_latency = 0.05
+    limiter = AdaptiveLimiter(initial=TASKS, rate=0)
+    results = []
+    started = time.monotonic()
+    async with ProfileHttpFetcher() as fetcher:
+        sent = await fetch_all(fetcher, limiter, usernames, results.append)
+    elapsed = time.monotonic() - started
+
+    half = len(results) // 2
+    first = results[:half].count(False) / max(1, half)
+    second = results[half:].count(False) / max(1, len(results) - half)
+    print(
+        f"AIMD: {len(usernames)} profile, {sent} request, {elapsed:.1f}s, "
+        f"concurrency {TASKS} -> {int(limiter.limit)} (server chịu {SERVER_MAX_CONCURRENT}), "
+        f"{limiter.decreases} lần giảm, 429: {first:.0%} nửa đầu / {second:.0%} nửa sau"
+    )
+    return limiter.limit <= 2 * SERVER_MAX_CONCURRENT and second < first and limiter.decreases > 0
+
+
+async def check_token_bucket(server: FakePinterestServer, usernames) -> bool:
+    server.max_concurrent = 0
+    server.profile_latency = 0.0
+    rate, burst = 100, 10
+    limiter = AdaptiveLimiter(initial=TASKS, rate=rate, burst=burst)
+    started = time.monotonic()
+    async with ProfileHttpFetcher() as fetcher:
+        sent = await fetch_all(fetcher, limiter, usernames)
+    elapsed = time.monotonic() - started
+
+    achieved = (sent - burst) / elapsed
+    print(f"Token bucket: {sent} request, {elapsed:.1f}s, {achieved:.0f} request/s (giới hạn {rate})")
+    return achieved <= rate * 1.05
+
+
+class WaitingPool:
+    """Browser pool đang chờ khởi động lại browser: lease chỉ trả context sau khi `ready` được set"""
+
+    def __init__(self):
+        self.waiting = asyncio.Event()
+        self.ready = asyncio.Event()
+
+    @asynccontextmanager
+    async def lease(self):
+        self.waiting.set()
+        await self.ready.wait()
+        yield ClosedContext()
+
+
+class ClosedContext:
+    async def new_page(self):
+        raise RuntimeError("browser đã đóng")
+
+
+async def check_pool_wait() -> bool:
+    limiter = AdaptiveLimiter(initial=1, minimum=1, maximum=1, rate=0)
+    pool = WaitingPool()
+    crawler = PinterestCrawler(pool, None, limiter=limiter)
+
+    async def other_request() -> None:
+        async with limiter.request():
+            pass
+
+    async with LazyLease(pool) as lease:
+        page = asyncio.create_task(crawler._crawl_profile_page(lease, asyncio.Semaphore(1), "user00000"))
+        await pool.waiting.wait()
+        try:
+            await asyncio.wait_for(other_request(), 1.0)
+            free = True
+        except asyncio.TimeoutError:
+            free = False
+        pool.ready.set()
+        await asyncio.gather(page, return_exceptions=True)
+    print(f"Chờ browser pool: request khác {'lấy được' if free else 'không lấy được'} slot duy nhất của limiter")
+    return free
+
+
+def check_share_rate(processes: int = 4) -> bool:
+    saved = dict(Config.RATE_CONFIG)
+    Config.RATE_CONFIG.update(requests_per_second=20, burst=40)
+    try:
+        share_rate(processes)
+        bucket = AdaptiveLimiter().bucket
+    finally:
+        Config.RATE_CONFIG.update(saved)
+    print(f"{processes} process: mỗi limiter {bucket.rate:.1f} request/s, burst {bucket.burst}")
+    return bucket.rate == 20 / processes and bucket.burst == 40 // processes
+
+
+def main() -> None:
+    num_profiles = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    Config.RATE_CONFIG.update(window_seconds=0.5, min_samples=10)
+
+    with FakePinterestServer() as server:
+        usernames = [f"user{i:05d}" for i in range(num_profiles)]
+        for username in usernames:
+            server.add_profile({"username": username, "full_name": username, "follower_count": 1})
+        Config.PINTEREST_BASE_URL = server.base_url
+
+        ok = asyncio.run(check_aimd(server, usernames))
+        ok = asyncio.run(check_token_bucket(server, usernames[:300])) and ok
+    ok = asyncio.run(check_pool_wait()) and ok
+    ok = check_share_rate() and ok
+    print("OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
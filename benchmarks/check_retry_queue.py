@@ -0,0 +1,131 @@
+"""Kiểm tra thử lại username lỗi với backoff và dead letter trên MongoDB giả lập
+
+Chạy: python -m benchmarks.check_retry_queue [số_username]
+
+Worker giả lập (không cần browser) crawl batch từ `UsernameQueue`:
+- username `flaky_*` lỗi timeout 2 lần đầu rồi thành công,
+- username `dead_*` luôn lỗi parse_error,
+- còn lại thành công ngay.
+Username flaky phải được crawl xong, username dead phải nằm trong
+`dead_letters` sau đúng `max_retries` lần thử lại, mỗi lần thử lại cách lần
+trước ít nhất nửa thời gian backoff và việc thử lại được trộn với username
+mới trong cùng batch. Mỗi batch mất `base_delay` giây (thời gian chờ tối đa
+của lần thử lại đầu), nên username lỗi ở lượt batch đầu chắc chắn đến hạn
+khi còn batch username mới chưa claim.
+"""
+import asyncio
+import sys
+import time
+from collections import Counter, defaultdict
+
+import benchmarks.harness  # noqa: F401  MongoDB giả lập, import trước các module của crawler
+
+from app import UsernameQueue
+from database import dead_letters_collection, ensure_indexes, usernames_collection
+from modules.pinterest import FAILURE_PARSE, FAILURE_TIMEOUT, crawl_stats
+from modules.retry_queue import max_retries
+from modules.write_buffer import WriteBuffer
+from utils.config import Config
+
+FLAKY_FAILURES = 2
+NUM_WORKERS = 4
+
+
+async def run(usernames) -> dict:
+    attempts = Counter()
+    seen_at = defaultdict(list)
+    mixed_batches = 0
+    queue = UsernameQueue(batch_size=20)
+
+    async def crawl(batch) -> dict:
+        failures = {}
+        for item in batch:
+            username = item["username"]
+            attempts[username] += 1
+            seen_at[username].append(time.monotonic())
+            if username.startswith("dead_"):
+                failures[username] = FAILURE_PARSE
+            elif username.startswith("flaky_") and attempts[username] <= FLAKY_FAILURES:
+                failures[username] = FAILURE_TIMEOUT
+            else:
+                writes.mark_username_crawled(username)
+        await asyncio.sleep(Config.RETRY_CONFIG["base_delay"])
+        return failures
+
+    async def worker() -> None:
+        nonlocal mixed_batches
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                break
+            retried = sum(1 for item in batch if item.get("retryCount"))
+            if 0 < retried < len(batch):
+                mixed_batches += 1
+            await queue.done(batch, await crawl(batch))
+
+    async with WriteBuffer(max_ops=50, flush_interval=0.05) as writes:
+        queue.writes = writes
+        await queue.start(NUM_WORKERS)
+        await asyncio.gather(*[worker() for _ in range(NUM_WORKERS)])
+    return {"attempts": attempts, "seen_at": seen_at, "mixed_batches": mixed_batches}
+
+
+def main() -> None:
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    Config.RETRY_CONFIG.update(base_delay=0.2, max_delay=1.0)
+    usernames = [
+        f"{'dead' if i % 20 == 0 else 'flaky' if i % 10 == 0 else 'user'}_{i:05d}" for i in range(total)
+    ]
+    ensure_indexes()
+    usernames_collection.insert_many([{"username": username, "isCrawl": False} for username in usernames])
+
+    started = time.monotonic()
+    result = asyncio.run(run(usernames))
+    elapsed = time.monotonic() - started
+
+    ok = True
+    attempts = result["attempts"]
+    pending = usernames_collection.count_documents({"isCrawl": False})
+    dead = {doc["username"]: doc for doc in dead_letters_collection.find({})}
+    expected_dead = {username for username in usernames if username.startswith("dead_")}
+    dead_attempts = max_retries(FAILURE_PARSE) + 1
+    print(
+        f"{total} username, {elapsed:.1f}s, {crawl_stats['retries']} lần thử lại, "
+        f"{len(dead)} dead letter, {result['mixed_batches']} batch trộn thử lại với username mới"
+    )
+
+    if pending:
+        ok = False
+        print(f"FAIL  còn {pending} username chưa crawl")
+    if set(dead) != expected_dead:
+        ok = False
+        print(f"FAIL  dead letter {len(dead)}, cần {len(expected_dead)}")
+    if any(attempts[username] != dead_attempts for username in expected_dead):
+        ok = False
+        print(f"FAIL  username dead phải được thử đúng {dead_attempts} lần")
+    flaky = [username for username in usernames if username.startswith("flaky_")]
+    if any(attempts[username] != FLAKY_FAILURES + 1 for username in flaky):
+        ok = False
+        print(f"FAIL  username flaky phải thành công ở lần thử {FLAKY_FAILURES + 1}")
+    # Jitter giữ ít nhất nửa thời gian backoff: lần thử thứ n chờ >= base * 2^(n-1) / 2
+    base = Config.RETRY_CONFIG["base_delay"]
+    too_early = [
+        username for username in flaky
+        if any(
+            later - earlier < base * 2 ** n / 2
+            for n, (earlier, later) in enumerate(zip(result["seen_at"][username], result["seen_at"][username][1:]))
+        )
+    ]
+    if too_early:
+        ok = False
+        print(f"FAIL  {len(too_early)} username được thử lại trước thời gian backoff")
+    if not result["mixed_batches"]:
+        ok = False
+        print("FAIL  không có batch nào trộn việc thử lại với username mới")
+
+    print("OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Kiểm tra engine tìm username qua search API với server giả lập
+
+Chạy: python -m benchmarks.check_search_api [số_keyword] [số_worker]
+
+Server local phát lại các trang tìm kiếm đã ghi lại trong `fixtures/search`
+và sinh thêm kết quả nhiều trang cho các keyword khác, mỗi XHR có độ trễ
+giả lập. `crawl_usernames` chạy với engine http trên MongoDB giả lập, không
+cần browser: mọi keyword phải được đánh dấu đã crawl và đủ username. Keyword
+có trang thứ hai lỗi (HTTP 500) phải được ghi là bị cắt kết quả, keyword lấy
+hết trang thì không. Trang đầu bị throttle (HTTP 429) phải báo throttle cho
+rate control và không mở browser, trang đầu bị từ chối (HTTP 403) mới chuyển
+sang browser.
+"""
+import asyncio
+import sys
+import time
+
+from benchmarks.harness import NoBrowserPool, RecordingLimiter
+
+from app import CrawlerManager
+from benchmarks.fake_pinterest import FakePinterestServer
+from database import ensure_indexes, keywords_collection, usernames_collection
+from modules.pinterest import PinterestCrawler
+from modules.search_fetcher import SearchHttpFetcher
+from utils.config import Config
+
+SEARCH_LATENCY = 0.05
+# Keyword 3 trang, trang thứ hai lỗi: tìm dừng khi vẫn còn bookmark
+BROKEN_KEYWORD = "kwbroken"
+
+
+async def check_status_handling(server: FakePinterestServer) -> int:
+    """Trang đầu HTTP 429 báo throttle và không mở browser, HTTP 403 chuyển sang browser"""
+    failures = 0
+    cases = [
+        ("HTTP 429", "kwthrottled", 429, (False, True), 0),
+        ("HTTP 403", "kwrejected", 403, (False, False), 1),
+    ]
+    async with SearchHttpFetcher() as fetcher:
+        for label, keyword, status, outcome, leases in cases:
+            server.add_search(keyword, [25])
+            server.search_errors[(keyword, 0)] = status
+            pool, limiter = NoBrowserPool(), RecordingLimiter()
+            crawler = PinterestCrawler(pool, None, search_fetcher=fetcher, limiter=limiter)
+            try:
+                await crawler.crawl_usernames(keyword)
+            except Exception:
+                pass
+            if (limiter.outcomes, pool.leases) == ([outcome], leases):
+                print(f"OK    {label}: rate control (ok, throttled) = {outcome}, mượn browser {leases} lần")
+            else:
+                failures += 1
+                print(
+                    f"FAIL  {label}: rate control {limiter.outcomes} (cần {[outcome]}), "
+                    f"mượn browser {pool.leases} lần (cần {leases})"
+                )
+    return failures
+
+
+def main() -> None:
+    num_keywords = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    num_workers = int(sys.argv[2]) if len(sys.argv) > 2 else Config.CRAWLER_CONFIG["search_concurrency"]
+
+    with FakePinterestServer() as server:
+        server.load_search_fixtures()
+        for i in range(num_keywords):
+            server.add_search(f"kw{i:05d}", [25] * (1 + i % 5))
+        server.search_latency = SEARCH_LATENCY
+        Config.PINTEREST_BASE_URL = server.base_url
+        # Đo tốc độ của engine, không giới hạn số request mỗi giây
+        Config.RATE_CONFIG["requests_per_second"] = 0
+
+        expected = {
+            user["username"]
+            for pages in server.searches.values()
+            for page in pages
+            for user in page["resource_response"]["data"]["results"]
+        }
+        xhr_expected = sum(len(pages) for pages in server.searches.values())
+        server.add_search(BROKEN_KEYWORD, [25, 25, 25])
+        server.search_errors[(BROKEN_KEYWORD, 1)] = 500
+        xhr_expected += 2
+
+        ensure_indexes()
+        keywords_collection.insert_many(
+            [{"keyword": query, "isCrawl": False} for query in server.searches]
+        )
+
+        started = time.monotonic()
+        asyncio.run(CrawlerManager.crawl_usernames(num_workers, engine="http"))
+        elapsed = time.monotonic() - started
+        num_searches, search_requests = len(server.searches), server.search_requests
+        status_failures = asyncio.run(check_status_handling(server))
+
+    saved = {doc["username"] for doc in usernames_collection.find({}, {"username": 1})}
+    pending = keywords_collection.count_documents({"isCrawl": False})
+    print(
+        f"{num_searches} keyword, {num_workers} worker: {elapsed:.1f}s "
+        f"({num_searches / elapsed:.1f} keyword/s), "
+        f"{search_requests}/{xhr_expected} XHR, {len(saved & expected)}/{len(expected)} username"
+    )
+    ok = pending == 0 and saved >= expected and search_requests == xhr_expected and not status_failures
+    if not ok:
+        print(
+            f"FAIL  còn {pending} keyword chưa crawl, {search_requests}/{xhr_expected} XHR, "
+            f"{status_failures} lỗi xử lý HTTP"
+        )
+
+    saturated = {doc["keyword"] for doc in keywords_collection.find({"saturated": True}, {"keyword": 1})}
+    print(f"Keyword bị cắt kết quả: {sorted(saturated)}")
+    if saturated != {BROKEN_KEYWORD}:
+        ok = False
+        print(f"FAIL  chỉ {BROKEN_KEYWORD} (trang sau lỗi) được ghi là bị cắt kết quả")
+    print("OK" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
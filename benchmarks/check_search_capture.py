@@ -0,0 +1,101 @@
+"""Kiểm tra crawl username theo keyword với các trang tìm kiếm đã ghi lại
+
+Chạy: python -m benchmarks.check_search_capture
+
+Server local phát lại các trang response BaseSearchResource trong
+`fixtures/search/<query>.json`. Bước đầu kiểm tra parser trên chuỗi trang
+theo bookmark (không cần browser). Nếu Chromium của Playwright đã được cài,
+chạy thêm `PinterestCrawler.crawl_usernames` thật với MongoDB giả lập: phải
+lấy đủ username, dừng ngay khi hết bookmark và không cuộn thừa.
+"""
+import asyncio
+import json
+import sys
+import time
+from urllib.parse import quote
+from urllib.request import urlopen
+
+import benchmarks.harness  # noqa: F401  MongoDB giả lập, import trước các module của crawler
+
+from benchmarks.fake_pinterest import FakePinterestServer
+from database import usernames_collection
+from modules.browser_pool import BrowserPool
+from modules.pinterest import PinterestCrawler
+from modules.write_buffer import WriteBuffer
+from utils.config import Config
+
+
+def expected_usernames(server: FakePinterestServer, query: str) -> set:
+    return {
+        user["username"]
+        for page in server.searches[query]
+        for user in page["resource_response"]["data"]["results"]
+    }
+
+
+def check_parser(server: FakePinterestServer) -> int:
+    """Đi theo bookmark qua các XHR của server, trả về số query không khớp"""
+    failures = 0
+    for query in sorted(server.searches):
+        usernames, bookmark = PinterestCrawler._parse_search_resource(server.searches[query][0])
+        pages = 1
+        while bookmark:
+            data = json.dumps({"options": {"query": query, "scope": "users", "bookmarks": [bookmark]}})
+            with urlopen(f"{server.base_url}/resource/BaseSearchResource/get/?data={quote(data)}") as response:
+                page_usernames, bookmark = PinterestCrawler._parse_search_resource(json.load(response))
+            usernames |= page_usernames
+            pages += 1
+
+        expected = expected_usernames(server, query)
+        if usernames == expected and pages == len(server.searches[query]):
+            print(f"OK    parser {query}: {len(usernames)} username, {pages} trang")
+        else:
+            failures += 1
+            print(f"FAIL  parser {query}: {len(usernames)}/{len(expected)} username, {pages} trang")
+    return failures
+
+
+async def check_crawler(server: FakePinterestServer) -> int:
+    """Chạy crawl_usernames thật trên Chromium, trả về số query không khớp"""
+    failures = 0
+    async with WriteBuffer() as writes, BrowserPool(size=1) as pool:
+        crawler = PinterestCrawler(pool, writes)
+        for query in sorted(server.searches):
+            server.search_requests = 0
+            started = time.monotonic()
+            await crawler.crawl_usernames(query)
+            await writes.flush()
+            elapsed = time.monotonic() - started
+
+            saved = {doc["username"] for doc in usernames_collection.find({}, {"username": 1})}
+            expected = expected_usernames(server, query)
+            xhr_expected = len(server.searches[query]) - 1
+            if expected <= saved and server.search_requests == xhr_expected:
+                print(f"OK    crawler {query}: {len(expected)} username, "
+                      f"{server.search_requests} XHR, {elapsed:.1f}s")
+            else:
+                failures += 1
+                print(f"FAIL  crawler {query}: {len(expected & saved)}/{len(expected)} username, "
+                      f"{server.search_requests}/{xhr_expected} XHR, {elapsed:.1f}s")
+    return failures
+
+
+def main() -> None:
+    with FakePinterestServer() as server:
+        server.load_search_fixtures()
+        server.search_latency = 0.2
+        Config.PINTEREST_BASE_URL = server.base_url
+        Config.CRAWLER_CONFIG["search_response_timeout"] = 3
+        Config.CRAWLER_CONFIG["scroll_delay"] = (0.1, 0.2)
+
+        failures = check_parser(server)
+        try:
+            failures += asyncio.run(check_crawler(server))
+        except Exception as e:
+            # Playwright chưa cài Chromium (playwright install chromium)
+            print(f"SKIP  crawler: không khởi động được browser ({str(e).splitlines()[0]})")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import traceback
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+AVATAR_LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+
+
+def render_profile_html(user: dict, resource_key: Optional[str] = None) -> str:
+    """Sinh HTML trang profile có script#__PWS_INITIAL_PROPS__ giống Pinterest"""
+    if resource_key is None:
+        resource_key = f'[["field_set_key","unauth_profile"],["is_mobile_fork",true],["username","{user["username"]}"]]'
+    props = {
+        "context": {"locale": "en-US"},
+        "initialReduxState": {
+            "resources": {"UserResource": {resource_key: {"data": user}}}
+        },
+    }
+    # Pinterest escape "<" trong JSON để không đóng thẻ script sớm
+    raw_json = json.dumps(props, ensure_ascii=False).replace("<", "\\u003c")
+    padding = "<div class=\"pin\"><img src=\"/static/placeholder.png\" alt=\"\"></div>\n"
+    return (
+        "<!DOCTYPE html><html lang=\"en\"><head><meta charset=\"utf-8\">"
+        f"<title>{user.get('full_name', '')} | Pinterest</title>"
+        "<link rel=\"stylesheet\" href=\"/static/app.css\">"
+        "<script>window.__pws_start = Date.now();</script></head><body>"
+        "<div id=\"__PWS_ROOT__\"></div>\n"
+        f"{padding * 40}"
+        f"<script id=\"__PWS_INITIAL_PROPS__\" type=\"application/json\">{raw_json}</script>"
+        f"{padding * 40}"
+        "</body></html>"
+    )
+
+
+def make_search_pages(query: str, page_sizes: List[int]) -> List[dict]:
+    """Sinh chuỗi trang response BaseSearchResource, trang cuối có bookmark -end-"""
+    pages: List[dict] = []
+    for number, size in enumerate(page_sizes):
+        bookmark = "-end-" if number == len(page_sizes) - 1 else f"{query}:{number + 1}"
+        previous = pages[-1]["resource_response"]["bookmark"] if pages else None
+        results = [
+            {"type": "user", "id": f"{number}{index}", "username": f"{query}_{number}_{index}",
+             "full_name": f"{query.title()} {number} {index}"}
+            for index in range(size)
+        ]
+        pages.append({
+            "resource_response": {"status": "success", "data": {"results": results}, "bookmark": bookmark},
+            "resource": {"name": "BaseSearchResource",
+                         "options": {"query": query, "scope": "users", "bookmarks": [previous] if previous else []}},
+        })
+    return pages
+
+
+def render_search_html(query: str, first_page: dict) -> str:
+    """Sinh HTML trang /search/users/ với trang kết quả đầu trong initialReduxState
+
+    Khi cuộn tới cuối trang, script gọi XHR BaseSearchResource với bookmark
+    hiện tại giống Pinterest, rồi thêm kết quả vào DOM.
+    """
+    response = first_page["resource_response"]
+    props = {
+        "context": {"locale": "en-US"},
+        "initialReduxState": {
+            "resources": {
+                "BaseSearchResource": {
+                    f'[["query","{query}"],["scope","users"]]': {
+                        "data": response["data"],
+                        "nextBookmark": response.get("bookmark"),
+                    }
+                }
+            }
+        },
+    }
+    raw_json = json.dumps(props, ensure_ascii=False).replace("<", "\\u003c")
+    reps = "".join(
+        f'<div data-test-id="user-rep"><a href="/{user["username"]}/">{user.get("full_name", "")}</a></div>\n'
+        for user in response["data"]["results"]
+    )
+    script = """
+var query = %s, bookmark = %s, loading = false;
+window.addEventListener("scroll", function () {
+  if (loading || !bookmark || bookmark === "-end-") return;
+  if (window.innerHeight + window.scrollY < document.body.scrollHeight - 200) return;
+  loading = true;
+  var data = JSON.stringify({options: {query: query, scope: "users", bookmarks: [bookmark]}, context: {}});
+  fetch("/resource/BaseSearchResource/get/?source_url=" + encodeURIComponent("/search/users/?q=" + query)
+        + "&data=" + encodeURIComponent(data))
+    .then(function (r) { return r.json(); })
+    .then(function (payload) {
+      var response = payload.resource_response;
+      bookmark = response.bookmark;
+      response.data.results.forEach(function (user) {
+        var rep = document.createElement("div");
+        rep.setAttribute("data-test-id", "user-rep");
+        rep.innerHTML = '<a href="/' + user.username + '/"></a>';
+        document.getElementById("results").appendChild(rep);
+      });
+      loading = false;
+    });
+});
+""" % (json.dumps(query), json.dumps(response.get("bookmark")))
+    return (
+        "<!DOCTYPE html><html lang=\"en\"><head><meta charset=\"utf-8\">"
+        f"<title>{query} | Pinterest</title></head><body>"
+        f"<div id=\"results\">{reps}</div>"
+        "<div style=\"height: 3000px\"></div>"
+        f"<script id=\"__PWS_INITIAL_PROPS__\" type=\"application/json\">{raw_json}</script>"
+        f"<script>{script}</script>"
+        "</body></html>"
+    )
+
+
+def make_avatar_url(base_url: str, username: str) -> str:
+    """URL avatar 75x75 kiểu i.pinimg.com (server có bản gốc trong /originals/)"""
+    digest = f"{zlib.crc32(username.encode('utf-8')):08x}"
+    return f"{base_url}/75x75_RS/{digest[:2]}/{digest[2:4]}/{digest[4:6]}/{username}.jpg"
+
+
+class _Server(ThreadingHTTPServer):
+    # Backlog mặc định (5) làm SYN bị bỏ, client phải chờ retransmit khi nhiều kết nối song song
+    request_queue_size = 256
+
+
+class FakePinterestServer:
+    """Server HTTP local đóng vai pinterest.com và i.pinimg.com
+
+    Phục vụ HTML profile đã lưu hoặc sinh tự động, trang/XHR tìm kiếm và ảnh
+    avatar, với độ trễ và tỉ lệ lỗi (HTTP 500) cấu hình được cho từng loại
+    request qua `latency`/`error_rates` ("profile", "search", "avatar").
+
+    Dùng: `with FakePinterestServer() as server:` rồi trỏ
+    `Config.PINTEREST_BASE_URL` (và `Config.PINIMG_BASE_URL`) tới `server.base_url`.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, seed: int = 0):
+        self.profiles: Dict[str, str] = {}
+        self.searches: Dict[str, List[dict]] = {}
+        self.request_count = 0
+        self.search_requests = 0
+        self.search_latency = 0.0
+        # Giả lập throttle: trả 429 khi số request profile đồng thời vượt ngưỡng (0: không giới hạn)
+        self.max_concurrent = 0
+        self.profile_latency = 0.0
+        self.throttled = 0
+        self.avatar_latency = 0.0
+        self.avatar_size = 20 * 1024
+        # Tỉ lệ request trả HTTP 500 theo loại, và số lỗi đã giả lập
+        self.error_rates: Dict[str, float] = {"profile": 0.0, "search": 0.0, "avatar": 0.0}
+        self.errors: Counter = Counter()
+        # HTTP status trả cho một trang tìm kiếm cố định: (query, số thứ tự trang) -> status
+        self.search_errors: Dict[Tuple[str, int], int] = {}
+        self.avatar_requests = 0
+        # Nội dung ảnh thay cho ảnh sinh tự động theo tên file (nhiều avatar dùng chung một ảnh)
+        self.avatar_overrides: Dict[str, bytes] = {}
+        # Số request avatar trả 304 (If-None-Match khớp ETag) và số byte ảnh đã gửi
+        self.avatar_not_modified = 0
+        self.avatar_bytes = 0
+        self._random = random.Random(seed)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._httpd = _Server((host, port), _FakePinterestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._httpd.handle_error = self._handle_error
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def load_profile_fixtures(self, directory: Optional[str] = None) -> None:
+        """Load các file <username>.html trong thư mục fixture"""
+        directory = directory or os.path.join(FIXTURE_DIR, "profiles")
+        for name in os.listdir(directory):
+            if name.endswith(".html"):
+                with open(os.path.join(directory, name), encoding="utf-8") as f:
+                    self.profiles[name[: -len(".html")]] = f.read()
+
+    def load_search_fixtures(self, directory: Optional[str] = None) -> None:
+        """Load các file <query>.json chứa các trang response tìm kiếm đã ghi lại"""
+        directory = directory or os.path.join(FIXTURE_DIR, "search")
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                with open(os.path.join(directory, name), encoding="utf-8") as f:
+                    recording = json.load(f)
+                self.searches[recording["query"]] = recording["pages"]
+
+    def add_search(self, query: str, page_sizes: List[int]) -> None:
+        """Thêm kết quả tìm kiếm sinh tự động cho `query`"""
+        self.searches[query] = make_search_pages(query, page_sizes)
+
+    def search_page_index(self, query: str, bookmark: Optional[str]) -> Optional[int]:
+        """Số thứ tự trang kết quả tiếp theo sau `bookmark` (None là trang đầu)"""
+        pages = self.searches.get(query) or []
+        if bookmark is None:
+            return 0 if pages else None
+        for index, page in enumerate(pages[:-1]):
+            if page["resource_response"].get("bookmark") == bookmark:
+                return index + 1
+        return None
+
+    def search_page(self, query: str, bookmark: Optional[str]) -> Optional[dict]:
+        """Trang kết quả tiếp theo sau `bookmark` (None là trang đầu)"""
+        index = self.search_page_index(query, bookmark)
+        return None if index is None else self.searches[query][index]
+
+    def add_profile(self, user: dict) -> None:
+        """Thêm một profile sinh tự động"""
+        self.profiles[user["username"]] = render_profile_html(user)
+
+    def inject_error(self, kind: str) -> bool:
+        """Quyết định request loại `kind` có bị trả lỗi hay không"""
+        rate = self.error_rates.get(kind, 0.0)
+        if not rate:
+            return False
+        with self._lock:
+            failed = self._random.random() < rate
+            self.errors[kind] += failed
+        return failed
+
+    def avatar_content(self, path: str) -> bytes:
+        """Nội dung ảnh giả lập, cố định theo đường dẫn"""
+        override = self.avatar_overrides.get(path.rsplit("/", 1)[-1])
+        if override is not None:
+            return override
+        header = b"\xff\xd8\xff\xe0" + path.encode("utf-8")
+        return (header * (self.avatar_size // len(header) + 1))[: self.avatar_size]
+
+    @staticmethod
+    def _handle_error(request, client_address) -> None:
+        # Client đóng kết nối keep-alive (ví dụ sau khi nhận 429) không phải lỗi của server
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            traceback.print_exc()
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class _FakePinterestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._head_only = True
+        try:
+            self.do_GET()
+        finally:
+            self._head_only = False
+
+    def do_GET(self):
+        fake: FakePinterestServer = self.server.fake
+        with fake._lock:
+            fake.request_count += 1
+
+        url = urlparse(self.path)
+        path = url.path
+        params = parse_qs(url.query)
+        if path.startswith(("/originals/", "/75x75_RS/")):
+            with fake._lock:
+                fake.avatar_requests += 1
+            if fake.avatar_latency:
+                time.sleep(fake.avatar_latency)
+            if fake.inject_error("avatar"):
+                self._send(500, b"Internal error", "text/plain")
+                return
+            content = fake.avatar_content(path)
+            etag = f'"{zlib.crc32(content):08x}"'
+            if self.headers.get("If-None-Match") == etag:
+                with fake._lock:
+                    fake.avatar_not_modified += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            if not getattr(self, "_head_only", False):
+                with fake._lock:
+                    fake.avatar_bytes += len(content)
+            self._send(200, content, "image/jpeg", {"ETag": etag, "Last-Modified": AVATAR_LAST_MODIFIED})
+            return
+        if path == "/search/users/":
+            query = params.get("q", [""])[0]
+            page = fake.search_page(query, None)
+            if page is not None:
+                self._send(200, render_search_html(query, page).encode("utf-8"), "text/html; charset=utf-8")
+                return
+        if path == "/resource/BaseSearchResource/get/":
+            with fake._lock:
+                fake.search_requests += 1
+            if fake.search_latency:
+                time.sleep(fake.search_latency)
+            if fake.inject_error("search"):
+                self._send(500, b"Internal error", "text/plain")
+                return
+            try:
+                options = json.loads(params.get("data", ["{}"])[0]).get("options", {})
+            except ValueError:
+                options = {}
+            bookmarks = options.get("bookmarks") or [None]
+            query = options.get("query", "")
+            index = fake.search_page_index(query, bookmarks[0])
+            status = fake.search_errors.get((query, index))
+            if status is not None:
+                self._send(status, b"Search error", "text/plain")
+                return
+            page = fake.search_page(query, bookmarks[0])
+            if page is not None:
+                self._send(200, json.dumps(page).encode("utf-8"), "application/json")
+                return
+
+        parts = [part for part in path.split("/") if part]
+        if len(parts) == 1 and parts[0] in fake.profiles:
+            with fake._lock:
+                fake._in_flight += 1
+                throttled = 0 < fake.max_concurrent < fake._in_flight
+                fake.throttled += throttled
+            try:
+                if fake.profile_latency:
+                    time.sleep(fake.profile_latency)
+                if throttled:
+                    self._send(429, b"Too many requests", "text/plain")
+                elif fake.inject_error("profile"):
+                    self._send(500, b"Internal error", "text/plain")
+                else:
+                    self._send(200, fake.profiles[parts[0]].encode("utf-8"), "text/html; charset=utf-8")
+            finally:
+                with fake._lock:
+                    fake._in_flight -= 1
+            return
+        self._send(404, b"Not found", "text/plain")
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not getattr(self, "_head_only", False):
+            self.wfile.write(body)
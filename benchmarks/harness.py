@@ -0,0 +1,38 @@
+"""Phần dùng chung của các script benchmark/kiểm tra
+
+Import module này trước mọi module của crawler: database mặc định
+`pinterest_fixture` (đặt DATABASE_NAME trước khi import để đổi) được thay
+bằng MongoDB giả lập trong bộ nhớ (`use_memory_client`).
+"""
+import os
+
+os.environ.setdefault("DATABASE_NAME", "pinterest_fixture")
+
+from benchmarks.memory_mongo import use_memory_client
+
+use_memory_client()
+
+from modules.rate_control import AdaptiveLimiter
+
+
+class NoBrowserPool:
+    """Browser pool đếm số lần bị mượn (không có browser thật)"""
+
+    def __init__(self):
+        self.leases = 0
+
+    def lease(self):
+        self.leases += 1
+        raise RuntimeError("không có browser")
+
+
+class RecordingLimiter(AdaptiveLimiter):
+    """Limiter không giới hạn tốc độ, ghi lại kết quả (ok, throttled) của từng request"""
+
+    def __init__(self):
+        super().__init__(rate=0)
+        self.outcomes = []
+
+    def _release(self, latency: float, ok: bool, throttled: bool = False) -> None:
+        self.outcomes.append((ok, throttled))
+        super()._release(latency, ok, throttled)
@@ -0,0 +1,490 @@
+import copy
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, UpdateResult
+
+from utils.config import Config
+
+_MISSING = object()
+
+
+def _get(doc: dict, path: str) -> Any:
+    value: Any = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _compare(value: Any, operator: str, operand: Any) -> bool:
+    if operator == "$exists":
+        return (value is not _MISSING) == bool(operand)
+    if operator == "$in":
+        if isinstance(operand, frozenset):
+            try:
+                if isinstance(value, list):
+                    return any(item in operand for item in value)
+                return value in operand
+            except TypeError:
+                return False
+        return any(_equals(value, item) for item in operand)
+    if operator == "$nin":
+        return not any(_equals(value, item) for item in operand)
+    if operator == "$ne":
+        return not _equals(value, operand)
+    if operator == "$eq":
+        return _equals(value, operand)
+    if value is _MISSING or value is None:
+        return False
+    try:
+        if operator == "$gt":
+            return value > operand
+        if operator == "$gte":
+            return value >= operand
+        if operator == "$lt":
+            return value < operand
+        if operator == "$lte":
+            return value <= operand
+    except TypeError:
+        return False
+    raise NotImplementedError(f"Toán tử {operator} chưa được hỗ trợ")
+
+
+def _equals(value: Any, operand: Any) -> bool:
+    if operand is None:
+        return value is _MISSING or value is None
+    if isinstance(value, list) and not isinstance(operand, list):
+        return operand in value
+    return value == operand
+
+
+def _hashable(value: Any) -> bool:
+    return isinstance(value, (str, int, float, bytes, bool, ObjectId))
+
+
+def _prepare(query: dict) -> dict:
+    """Đổi danh sách `$in` toàn giá trị hashable thành frozenset để so khớp O(1)"""
+    prepared = {}
+    for key, condition in query.items():
+        if key in ("$or", "$and"):
+            condition = [_prepare(sub) for sub in condition]
+        elif isinstance(condition, dict) and isinstance(condition.get("$in"), list):
+            items = condition["$in"]
+            if None not in items and all(_hashable(item) for item in items):
+                condition = dict(condition, **{"$in": frozenset(items)})
+        prepared[key] = condition
+    return prepared
+
+
+def matches(doc: dict, query: dict) -> bool:
+    """Kiểm tra document có khớp query (tập con cú pháp MongoDB) không"""
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict) and any(k.startswith("$") for k in condition):
+            value = _get(doc, key)
+            if not all(_compare(value, op, operand) for op, operand in condition.items()):
+                return False
+        elif not _equals(_get(doc, key), condition):
+            return False
+    return True
+
+
+def _set_path(doc: dict, path: str, value: Any) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset_path(doc: dict, path: str) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part, {})
+    doc.pop(parts[-1], None)
+
+
+def _apply_update(doc: dict, update: dict, inserting: bool) -> None:
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            if operator == "$set":
+                _set_path(doc, path, copy.deepcopy(value))
+            elif operator == "$setOnInsert":
+                if inserting:
+                    _set_path(doc, path, copy.deepcopy(value))
+            elif operator == "$unset":
+                _unset_path(doc, path)
+            elif operator == "$inc":
+                current = _get(doc, path)
+                _set_path(doc, path, (0 if current is _MISSING else current) + value)
+            elif operator == "$max":
+                current = _get(doc, path)
+                if current is _MISSING or value > current:
+                    _set_path(doc, path, value)
+            else:
+                raise NotImplementedError(f"Toán tử update {operator} chưa được hỗ trợ")
+
+
+def _project(doc: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k for k, v in projection.items() if v}
+    if include:
+        result = {k: copy.deepcopy(doc[k]) for k in include if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    return {k: copy.deepcopy(v) for k, v in doc.items() if projection.get(k, 1)}
+
+
+class MemoryCursor:
+    def __init__(self, docs: List[dict], projection: Optional[dict] = None,
+                 index: Optional[str] = None, examined: int = 0):
+        # Document gốc (không bị sửa tại chỗ), projection áp dụng khi đọc
+        # để sort được theo field không có trong projection
+        self._docs = docs
+        self._projection = projection
+        self._limit = 0
+        self._index = index
+        self._examined = examined
+
+    def sort(self, key, direction: int = 1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            # Như MongoDB: giá trị null/thiếu đứng đầu khi tăng dần, cuối khi giảm dần
+            empty = [d for d in self._docs if _get(d, field) in (_MISSING, None)]
+            present = [d for d in self._docs if _get(d, field) not in (_MISSING, None)]
+            present.sort(key=lambda d: _get(d, field), reverse=order < 0)
+            self._docs = present + empty if order < 0 else empty + present
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    def explain(self) -> dict:
+        """Plan dạng explain của MongoDB: index băm (luôn đọc document) hoặc quét toàn bộ"""
+        if self._index:
+            plan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": self._index}}
+        else:
+            plan = {"stage": "COLLSCAN"}
+        returned = len(self._docs[: self._limit] if self._limit else self._docs)
+        return {
+            "queryPlanner": {"winningPlan": plan},
+            "executionStats": {
+                "nReturned": returned,
+                "totalKeysExamined": self._examined if self._index else 0,
+                "totalDocsExamined": self._examined,
+            },
+        }
+
+    def __iter__(self):
+        docs = self._docs[: self._limit] if self._limit else self._docs
+        return iter([_project(d, self._projection) for d in docs])
+
+
+class MemoryCollection:
+    """Collection MongoDB giả lập trong bộ nhớ, an toàn giữa các thread
+
+    Hỗ trợ tập con API pymongo mà crawler dùng, đếm số lệnh theo loại
+    trong `ops` để benchmark tính số thao tác Mongo trên mỗi profile.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._docs: Dict[Any, dict] = {}
+        self._unique: List[str] = []
+        # Index băm theo field: giá trị -> tập _id
+        self._indexes: Dict[str, Dict[Any, set]] = {}
+        self._index_names: Dict[str, str] = {}
+        # Partial index: tên -> (partialFilterExpression, tập _id khớp filter)
+        self._partials: Dict[str, Tuple[dict, set]] = {}
+        self._lock = threading.RLock()
+        self.ops: Counter = Counter()
+
+    # --- index ---
+    def create_index(self, keys, unique: bool = False, **kwargs) -> str:
+        self.ops["create_index"] += 1
+        field = keys if isinstance(keys, str) else keys[0][0]
+        partial = kwargs.get("partialFilterExpression")
+        with self._lock:
+            if partial is not None:
+                name = kwargs.get("name") or f"{field}_1"
+                self._partials[name] = (partial, {d["_id"] for d in self._docs.values() if matches(d, partial)})
+                return name
+            if unique and field not in self._unique:
+                self._unique.append(field)
+            if field not in self._indexes:
+                index: Dict[Any, set] = {}
+                for doc in self._docs.values():
+                    self._index_add(index, doc, field)
+                self._indexes[field] = index
+                self._index_names[field] = kwargs.get("name") or f"{field}_1"
+        return kwargs.get("name") or f"{field}_1"
+
+    @staticmethod
+    def _index_add(index: Dict[Any, set], doc: dict, field: str) -> None:
+        value = _get(doc, field)
+        if value is not _MISSING and _hashable(value):
+            index.setdefault(value, set()).add(doc["_id"])
+
+    def _store(self, doc: dict) -> None:
+        """Ghi document và cập nhật các index"""
+        old = self._docs.get(doc["_id"])
+        for field, index in self._indexes.items():
+            if old is not None:
+                value = _get(old, field)
+                if value is not _MISSING and _hashable(value):
+                    index.get(value, set()).discard(old["_id"])
+            self._index_add(index, doc, field)
+        for partial, ids in self._partials.values():
+            if matches(doc, partial):
+                ids.add(doc["_id"])
+            else:
+                ids.discard(doc["_id"])
+        self._docs[doc["_id"]] = doc
+
+    def _candidates(self, query: dict) -> List[dict]:
+        """Document có thể khớp query, dùng index nếu query lọc bằng field có index"""
+        return self._plan(query)[0]
+
+    def _plan(self, query: dict) -> Tuple[List[dict], Optional[str]]:
+        """(document có thể khớp query, field index được dùng)"""
+        for field, index in self._indexes.items():
+            condition = query.get(field, _MISSING)
+            if condition is _MISSING:
+                continue
+            if isinstance(condition, dict):
+                values = condition.get("$in")
+                if not isinstance(values, frozenset):
+                    continue
+            elif _hashable(condition) and condition is not None:
+                values = (condition,)
+            else:
+                continue
+            ids = set()
+            for value in values:
+                ids |= index.get(value, set())
+            return [self._docs[_id] for _id in ids], self._index_names[field]
+        for name, (partial, ids) in self._partials.items():
+            if all(query.get(key, _MISSING) == value for key, value in partial.items()):
+                return [self._docs[_id] for _id in ids], name
+        return list(self._docs.values()), None
+
+    def _check_unique(self, doc: dict, ignore_id: Any = None) -> None:
+        for field in self._unique:
+            value = _get(doc, field)
+            if value is _MISSING:
+                continue
+            others = (
+                [self._docs[_id] for _id in self._indexes[field].get(value, ())]
+                if field in self._indexes and _hashable(value) else self._docs.values()
+            )
+            for other in others:
+                if other["_id"] != ignore_id and _get(other, field) == value:
+                    raise DuplicateKeyError(f"E11000 duplicate key {field}: {value}", 11000)
+
+    # --- đọc ---
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **kwargs) -> MemoryCursor:
+        self.ops["find"] += 1
+        query = _prepare(filter or {})
+        with self._lock:
+            candidates, index = self._plan(query)
+            docs = [d for d in candidates if matches(d, query)]
+        cursor = MemoryCursor(docs, projection, index, len(candidates))
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        if kwargs.get("limit"):
+            cursor.limit(kwargs["limit"])
+        return cursor
+
+    def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **kwargs) -> Optional[dict]:
+        for doc in self.find(filter, projection, **kwargs).limit(1):
+            return doc
+        return None
+
+    def count_documents(self, filter: dict, **kwargs) -> int:
+        self.ops["count_documents"] += 1
+        query = _prepare(filter)
+        with self._lock:
+            return sum(1 for d in self._candidates(query) if matches(d, query))
+
+    # --- ghi ---
+    def insert_many(self, documents: List[dict], ordered: bool = True) -> InsertManyResult:
+        self.ops["insert_many"] += 1
+        ids = []
+        with self._lock:
+            for document in documents:
+                doc = copy.deepcopy(document)
+                doc.setdefault("_id", ObjectId())
+                document.setdefault("_id", doc["_id"])
+                self._check_unique(doc)
+                self._store(doc)
+                ids.append(doc["_id"])
+        return InsertManyResult(ids, True)
+
+    def insert_one(self, document: dict):
+        return self.insert_many([document])
+
+    def _update(self, filter: dict, update: dict, upsert: bool, multi: bool) -> Dict[str, Any]:
+        query = _prepare(filter)
+        with self._lock:
+            targets = [d for d in self._candidates(query) if matches(d, query)]
+            if not multi:
+                targets = targets[:1]
+            for doc in targets:
+                updated = copy.deepcopy(doc)
+                _apply_update(updated, update, inserting=False)
+                self._check_unique(updated, ignore_id=doc["_id"])
+                self._store(updated)
+            result = {"n": len(targets), "nModified": len(targets), "upserted": None}
+            if not targets and upsert:
+                doc = {k: v for k, v in filter.items() if not k.startswith("$") and not isinstance(v, dict)}
+                _apply_update(doc, update, inserting=True)
+                doc.setdefault("_id", ObjectId())
+                self._check_unique(doc)
+                self._store(doc)
+                result["upserted"] = doc["_id"]
+            return result
+
+    def update_one(self, filter: dict, update: dict, upsert: bool = False) -> UpdateResult:
+        self.ops["update_one"] += 1
+        raw = self._update(filter, update, upsert, multi=False)
+        return UpdateResult(raw, True)
+
+    def update_many(self, filter: dict, update: dict, upsert: bool = False) -> UpdateResult:
+        self.ops["update_many"] += 1
+        raw = self._update(filter, update, upsert, multi=True)
+        return UpdateResult(raw, True)
+
+    def find_one_and_update(self, filter: dict, update: dict, projection: Optional[dict] = None,
+                            sort=None, upsert: bool = False,
+                            return_document=ReturnDocument.BEFORE, **kwargs) -> Optional[dict]:
+        self.ops["find_one_and_update"] += 1
+        with self._lock:
+            query = _prepare(filter)
+            cursor = MemoryCursor([d for d in self._candidates(query) if matches(d, query)])
+            if sort:
+                cursor.sort(sort)
+            for doc in cursor.limit(1):
+                before = copy.deepcopy(doc)
+                updated = copy.deepcopy(doc)
+                _apply_update(updated, update, inserting=False)
+                self._store(updated)
+                result = updated if return_document == ReturnDocument.AFTER else before
+                return _project(result, projection)
+            if upsert:
+                raw = self._update(filter, update, True, multi=False)
+                return _project(self._docs[raw["upserted"]], projection)
+        return None
+
+    def delete_many(self, filter: dict) -> DeleteResult:
+        self.ops["delete_many"] += 1
+        query = _prepare(filter)
+        with self._lock:
+            targets = [d for d in self._candidates(query) if matches(d, query)]
+            for doc in targets:
+                for field, index in self._indexes.items():
+                    value = _get(doc, field)
+                    if value is not _MISSING and _hashable(value):
+                        index.get(value, set()).discard(doc["_id"])
+                for _, ids in self._partials.values():
+                    ids.discard(doc["_id"])
+                del self._docs[doc["_id"]]
+        return DeleteResult({"n": len(targets)}, True)
+
+    def bulk_write(self, requests: list, ordered: bool = True) -> BulkWriteResult:
+        """Thực thi UpdateOne/UpdateMany/InsertOne của pymongo"""
+        self.ops["bulk_write"] += 1
+        details = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0,
+                   "nRemoved": 0, "upserted": [], "writeErrors": [], "writeConcernErrors": []}
+        for index, request in enumerate(requests):
+            name = type(request).__name__
+            try:
+                if name == "InsertOne":
+                    self.insert_many([request._doc])
+                    details["nInserted"] += 1
+                    continue
+                multi = name == "UpdateMany"
+                raw = self._update(request._filter, request._doc, bool(request._upsert), multi)
+                details["nMatched"] += raw["n"]
+                details["nModified"] += raw["nModified"]
+                if raw["upserted"] is not None:
+                    details["nUpserted"] += 1
+                    details["upserted"].append({"index": index, "_id": raw["upserted"]})
+            except DuplicateKeyError as e:
+                details["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if details["writeErrors"]:
+            raise BulkWriteError(details)
+        return BulkWriteResult(details, True)
+
+
+class MemoryDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = MemoryCollection(name)
+            return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def total_ops(self) -> Counter:
+        total: Counter = Counter()
+        for collection in self._collections.values():
+            total.update(collection.ops)
+        return total
+
+
+class MemoryClient:
+    """Thay cho `pymongo.MongoClient` trong benchmark (xem `use_memory_client`)"""
+
+    _databases: Dict[str, MemoryDatabase] = {}
+
+    def __init__(self, url: Optional[str] = None, **kwargs):
+        self.url = url
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(name)
+        return self._databases[name]
+
+
+def use_memory_client() -> MemoryDatabase:
+    """Thay client MongoDB của module `database` bằng MongoDB giả lập trong bộ nhớ
+
+    Phải gọi trước khi import các module của crawler: `from database import *`
+    chép các collection lúc import.
+    """
+    import database
+
+    database.client = MemoryClient()
+    database.db = database.client[Config.DATABASE_NAME]
+    for name, value in list(vars(database).items()):
+        if isinstance(value, Collection):
+            setattr(database, name, database.db[value.name])
+    database.INDEXES = [(database.db[collection.name], keys, options) for collection, keys, options in database.INDEXES]
+    return database.db
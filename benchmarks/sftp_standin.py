@@ -0,0 +1,93 @@
+import os
+import shutil
+import threading
+import time
+
+from modules.sftp_pool import SftpSession
+
+
+class LocalSftpClient:
+    """SFTPClient giả lập trong process, ghi file vào một thư mục local
+
+    Chỉ cài đặt các hàm mà crawler dùng: stat, listdir, mkdir, open, rename,
+    remove, putfo, close.
+    `op_latency` mô phỏng round trip của mỗi lệnh SFTP.
+    """
+
+    def __init__(self, root: str, op_latency: float = 0.0):
+        self.root = root
+        self.op_latency = op_latency
+        self.closed = False
+
+    def _local(self, path: str) -> str:
+        return os.path.join(self.root, path.lstrip("/"))
+
+    def _round_trip(self) -> None:
+        if self.closed:
+            raise EOFError("SFTP session đã đóng")
+        if self.op_latency:
+            time.sleep(self.op_latency)
+
+    def stat(self, path: str):
+        self._round_trip()
+        return os.stat(self._local(path))
+
+    def listdir(self, path: str = "."):
+        self._round_trip()
+        return os.listdir(self._local(path))
+
+    def mkdir(self, path: str, mode: int = 0o777) -> None:
+        self._round_trip()
+        os.makedirs(self._local(path), mode=mode, exist_ok=False)
+
+    def open(self, filename: str, mode: str = "r"):
+        self._round_trip()
+        return open(self._local(filename), mode)
+
+    def rename(self, oldpath: str, newpath: str) -> None:
+        self._round_trip()
+        os.rename(self._local(oldpath), self._local(newpath))
+
+    def remove(self, path: str) -> None:
+        self._round_trip()
+        os.remove(self._local(path))
+
+    def putfo(self, fl, remotepath: str, file_size: int = 0, callback=None, confirm=True):
+        self._round_trip()
+        with open(self._local(remotepath), "wb") as f:
+            shutil.copyfileobj(fl, f)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class LocalSftpSession(SftpSession):
+    """Phiên SFTP giả lập, dùng làm `connect` cho SftpPool"""
+
+    def __init__(self, sftp: LocalSftpClient):
+        self.ssh = None
+        self.sftp = sftp
+
+    def is_alive(self) -> bool:
+        return not self.sftp.closed
+
+    def close(self) -> None:
+        self.sftp.close()
+
+
+class LocalSftpServer:
+    """Đếm số lần "handshake" và tạo phiên giả lập với độ trễ cấu hình được"""
+
+    def __init__(self, root: str, handshake_latency: float = 0.0, op_latency: float = 0.0):
+        self.root = root
+        self.handshake_latency = handshake_latency
+        self.op_latency = op_latency
+        self.handshakes = 0
+        self._lock = threading.Lock()
+
+    def connect(self) -> LocalSftpSession:
+        with self._lock:
+            self.handshakes += 1
+        if self.handshake_latency:
+            time.sleep(self.handshake_latency)
+        return LocalSftpSession(LocalSftpClient(self.root, self.op_latency))
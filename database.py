@@ -1,5 +1,11 @@
 from utils.config import Config
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, MongoClient
+from pymongo.errors import OperationFailure
+
+from utils.logger import setup_logger
+
+# Cấu hình logger
+logger = setup_logger(__name__)
 
 client = MongoClient(Config.MONGO_URL)
 db = client[Config.DATABASE_NAME]
@@ -8,4 +14,38 @@ print(f"✅ Kết nối đến MongoDB: {Config.DATABASE_NAME}")
 
 profile_collection = db["profiles"]
 usernames_collection = db["usernames"]
-keywords_collection = db["keywords"]
\ No newline at end of file
+keywords_collection = db["keywords"]
+# Username crawl lỗi quá số lần thử lại
+dead_letters_collection = db["dead_letters"]
+
+
+# Index cho các truy vấn chính của crawler: (collection, keys, options)
+# - keyword/username unique: upsert, lookup `$in` và gia hạn lease theo key
+# - pending_claim (username)/frontier_claim (keyword) chỉ chứa item `isCrawl: false` nên nhỏ dần
+#   khi crawl, phục vụ claim username theo `_id`, keyword theo `expectedYield`/`mentionedAt`
+#   (lọc `leaseUntil` ngay trên index) và đếm backlog
+INDEXES = [
+    (keywords_collection, [("keyword", ASCENDING)], {"unique": True}),
+    (keywords_collection,
+     [("expectedYield", DESCENDING), ("mentionedAt", ASCENDING), ("_id", ASCENDING), ("leaseUntil", ASCENDING)],
+     {"name": "frontier_claim", "partialFilterExpression": {"isCrawl": False}}),
+    (usernames_collection, [("username", ASCENDING)], {"unique": True}),
+    (usernames_collection, [("_id", ASCENDING), ("leaseUntil", ASCENDING)],
+     {"name": "pending_claim", "partialFilterExpression": {"isCrawl": False}}),
+    (profile_collection, [("username", ASCENDING)], {"unique": True}),
+    # Crawl lại (--refresh): item đã crawl, sắp theo độ ưu tiên, lọc `refreshAt` trên index
+    (keywords_collection, [("yieldScore", DESCENDING), ("_id", ASCENDING), ("refreshAt", ASCENDING)],
+     {"name": "refresh_priority", "partialFilterExpression": {"isCrawl": True}}),
+    (usernames_collection, [("refreshPriority", DESCENDING), ("_id", ASCENDING), ("refreshAt", ASCENDING)],
+     {"name": "refresh_priority", "partialFilterExpression": {"isCrawl": True}}),
+    (dead_letters_collection, [("username", ASCENDING)], {"unique": True}),
+]
+
+
+def ensure_indexes() -> None:
+    """Tạo các index trong INDEXES (bỏ qua index lỗi, ví dụ dữ liệu cũ còn bản ghi trùng)"""
+    for collection, keys, options in INDEXES:
+        try:
+            collection.create_index(keys, **options)
+        except OperationFailure as e:
+            logger.warning(f"Không tạo được index {collection.name} {keys}: {e}")
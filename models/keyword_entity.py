@@ -7,6 +7,8 @@ class KeywordEntity(BaseModel):
     keyword: Optional[str] = Field(None, description="Từ khóa tìm kiếm")
     isCrawl: Optional[bool] = Field(False, description="Trạng thái đã crawl hay chưa")
     crawlDate: Optional[datetime] = Field(None, description="Ngày crawl")
+    expectedYield: Optional[float] = Field(None, description="Điểm của planner (ước lượng username mới mỗi trang), cao thì crawl trước")
+    mentionedAt: Optional[datetime] = Field(None, description="Lần gần nhất planner cập nhật điểm, cùng điểm thì cũ hơn crawl trước")
 
     def to_dict(self):
         return self.model_dump(exclude_unset=True)
@@ -0,0 +1,89 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class AvatarIndex:
+    """Index local (SQLite) của avatar đã lưu theo nội dung
+
+    - `blobs`: hash nội dung (ảnh gốc) -> đường dẫn đã lưu và thumbnail (nếu
+      có), mỗi ảnh chỉ lưu một lần dù nhiều profile dùng chung (ảnh mặc
+      định, ảnh dùng lại).
+    - `urls`: URL avatar -> hash, URL đã tải (ảnh gốc thực sự tải), ETag,
+      Last-Modified và thời điểm kiểm tra gần nhất. URL đã biết không cần gọi
+      mạng; sau `revalidate_days` thì gửi request có điều kiện.
+
+    Các hàm chạy blocking, gọi qua `asyncio.to_thread`. SQLite ở chế độ WAL
+    nên nhiều process trên cùng máy dùng chung được một file index.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "hash TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL, "
+            "thumb_path TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "url TEXT PRIMARY KEY, hash TEXT NOT NULL, fetched_url TEXT NOT NULL, "
+            "etag TEXT, last_modified TEXT, checked_at REAL NOT NULL)"
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def lookup_url(self, url: str) -> Optional[Dict[str, Any]]:
+        """Thông tin URL đã tải kèm đường dẫn ảnh đã lưu, None nếu chưa biết"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT urls.*, blobs.path, blobs.thumb_path FROM urls JOIN blobs ON blobs.hash = urls.hash WHERE url = ?", (url,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def blob(self, digest: str) -> Optional[Dict[str, Any]]:
+        """Đường dẫn ảnh và thumbnail đã lưu của ảnh có hash `digest`"""
+        with self._lock:
+            row = self._conn.execute("SELECT path, thumb_path FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        return dict(row) if row else None
+
+    def add_blob(self, digest: str, path: str, size: int, thumb_path: Optional[str] = None) -> None:
+        """Ghi ảnh đã lưu, `size` là số byte đã lưu (sau khi encode lại)"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO blobs (hash, path, size, created_at, thumb_path) VALUES (?, ?, ?, ?, ?)",
+                (digest, path, size, time.time(), thumb_path),
+            )
+
+    def remember_url(self, url: str, digest: str, fetched_url: str,
+                     etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        """Ghi (hoặc cập nhật sau khi kiểm tra lại) hash và validator của URL"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO urls (url, hash, fetched_url, etag, last_modified, checked_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, digest, fetched_url, etag, last_modified, time.time()),
+            )
+
+    def touch_url(self, url: str) -> None:
+        """Ảnh không đổi (HTTP 304): chỉ cập nhật thời điểm kiểm tra"""
+        with self._lock:
+            self._conn.execute("UPDATE urls SET checked_at = ? WHERE url = ?", (time.time(), url))
+
+    def stats(self) -> Dict[str, int]:
+        """Số ảnh, tổng dung lượng và số URL trong index"""
+        with self._lock:
+            blobs, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+            urls = self._conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+        return {"blobs": blobs, "bytes": size, "urls": urls}
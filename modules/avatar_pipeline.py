@@ -0,0 +1,421 @@
+import asyncio
+import hashlib
+import os
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+
+from database import *
+from modules.avatar_index import AvatarIndex
+from modules.avatar_storage import AvatarStorage
+from modules.avatar_transcoder import AvatarTranscoder
+from modules.metrics import metrics
+from modules.write_buffer import WriteBuffer
+from utils.config import Config
+from utils.logger import setup_logger
+
+# Cấu hình logger
+logger = setup_logger(__name__)
+
+# Số byte avatar theo kind: "original" (ảnh tải về) và "stored" (ảnh và thumbnail đã lưu)
+AVATAR_BYTES = "crawler_avatar_bytes_total"
+
+# Chữ ký đầu file của các định dạng ảnh, dùng đặt đuôi file cho ảnh lưu nguyên bản gốc
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+]
+
+
+def image_extension(content: bytes) -> str:
+    """Đuôi file theo nội dung ảnh (mặc định `jpg` khi không nhận ra định dạng)"""
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return "webp"
+    for signature, extension in IMAGE_SIGNATURES:
+        if content.startswith(signature):
+            return extension
+    return "jpg"
+
+
+class AvatarPipeline:
+    """Stage tải avatar bất đồng bộ, tách khỏi quá trình crawl profile
+
+    Crawler đẩy (username, url) vào queue có giới hạn qua `submit()`. Nhiều
+    downloader chạy song song trên một HTTP session keep-alive, thử lại với
+    backoff khi lỗi. Ảnh tải xong được writer gom theo batch và lưu qua
+    `AvatarStorage` (một phiên SFTP cho cả batch) rồi cập nhật `avatar_url`
+    của profile trong MongoDB.
+
+    Ảnh được lưu theo hash nội dung (SHA-256): ảnh trùng (ảnh mặc định, ảnh
+    dùng lại) chỉ lưu một lần, profile ghi `avatar_hash` cùng đường dẫn.
+    `AvatarIndex` nhớ URL -> hash nên URL đã tải không cần gọi mạng; quá
+    `revalidate_days` thì tải lại có điều kiện (ETag/Last-Modified), ảnh
+    không đổi (HTTP 304) không phải tải và lưu lại.
+
+    Với `AvatarTranscoder` (bật qua AVATAR_TRANSCODE=1, cần Pillow), ảnh mới
+    được encode lại gọn hơn kèm thumbnail trong process pool trước khi lưu.
+    """
+
+    def __init__(
+        self,
+        storage: Optional[AvatarStorage] = None,
+        num_downloaders: int = Config.AVATAR_CONFIG["downloaders"],
+        queue_size: int = Config.AVATAR_CONFIG["queue_size"],
+        writes: Optional[WriteBuffer] = None,
+        index: Optional[AvatarIndex] = None,
+        transcoder: Optional[AvatarTranscoder] = None,
+    ):
+        self.storage = storage or AvatarStorage()
+        self.writes = writes
+        self.index = index
+        self.transcoder = transcoder
+        self.num_downloaders = max(1, num_downloaders)
+        self.queue_size = queue_size
+        self.downloaded = 0
+        self.failed = 0
+        # URL đã biết không gọi mạng, ảnh không đổi (304), ảnh trùng không lưu lại
+        self.index_hits = 0
+        self.not_modified = 0
+        self.deduplicated = 0
+        # Số byte ảnh tải về và đã lưu theo thư mục shard
+        self.original_bytes: Counter = Counter()
+        self.stored_bytes: Counter = Counter()
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._writers: List[asyncio.Task] = []
+        # Hash ảnh đang được một writer lưu -> kết quả lưu (ảnh đã lưu hoặc None)
+        self._saving: Dict[str, asyncio.Future] = {}
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def start(self) -> None:
+        """Mở index avatar, tạo HTTP session và khởi động các downloader"""
+        if self.index is None:
+            path = Config.AVATAR_CONFIG["index_path"] or os.path.join(
+                Config.DIRECTORIES["avatars"], f"index_{'sftp' if self.storage.is_docker else 'local'}.sqlite3"
+            )
+            self.index = await asyncio.to_thread(AvatarIndex, path)
+        if self.transcoder is None and Config.AVATAR_CONFIG["transcode"]["enabled"]:
+            if AvatarTranscoder.available():
+                self.transcoder = AvatarTranscoder()
+            else:
+                logger.warning("Chưa cài Pillow, lưu avatar gốc không encode lại")
+        if self.transcoder is not None:
+            self.transcoder.start()
+        connector = aiohttp.TCPConnector(
+            limit=Config.HTTP_CONFIG["max_connections"], ttl_dns_cache=300
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers={"User-Agent": Config.CRAWLER_CONFIG["user_agent"]},
+            timeout=aiohttp.ClientTimeout(total=Config.CRAWLER_CONFIG["timeout"]),
+        )
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._write_queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [
+            asyncio.create_task(self._downloader(i))
+            for i in range(self.num_downloaders)
+        ]
+        # Mỗi writer giữ một phiên SFTP trong lúc ghi batch
+        num_writers = Config.SFTP_CONFIG["pool_size"] if self.storage.is_docker else 1
+        self._writers = [asyncio.create_task(self._writer()) for _ in range(num_writers)]
+        logger.info(f"Khởi động {self.num_downloaders} downloader avatar")
+
+    async def close(self) -> None:
+        """Chờ tải hết các avatar còn trong queue rồi dừng downloader"""
+        for _ in self._tasks:
+            await self._queue.put(None)
+        await asyncio.gather(*self._tasks)
+        self._tasks = []
+        for _ in self._writers:
+            await self._write_queue.put(None)
+        await asyncio.gather(*self._writers)
+        self._writers = []
+        await asyncio.to_thread(self.storage.close)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self.index is not None:
+            await asyncio.to_thread(self.index.close)
+        if self.transcoder is not None:
+            await asyncio.to_thread(self.transcoder.close)
+        for shard in sorted(self.original_bytes):
+            original, stored = self.original_bytes[shard], self.stored_bytes[shard]
+            logger.info(
+                f"Avatar shard {shard}: tải {original / 1024:.0f}KB, lưu {stored / 1024:.0f}KB "
+                f"(tiết kiệm {(original - stored) / 1024:.0f}KB)"
+            )
+        logger.info(
+            f"Đã tải {self.downloaded} avatar, {self.failed} avatar lỗi, {self.index_hits} URL đã biết, "
+            f"{self.not_modified} ảnh không đổi, {self.deduplicated} ảnh trùng"
+        )
+
+    async def submit(self, username: str, url: str) -> None:
+        """Đưa avatar vào queue (chờ nếu queue đầy)"""
+        await self._queue.put((username, url))
+
+    async def _downloader(self, downloader_id: int) -> None:
+        """Lấy avatar từ queue, tải ảnh (nếu chưa biết) rồi chuyển sang writer"""
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                break
+            username, url = item
+            try:
+                with metrics.timer("avatar_fetch", f"avatar-{downloader_id}"):
+                    downloaded = await self._download(username, url)
+            except Exception as e:
+                logger.error(f"Lỗi khi tải avatar cho {username}: {e}")
+                downloaded = None
+
+            if downloaded is None:
+                self.failed += 1
+            elif downloaded:
+                await self._write_queue.put(downloaded)
+
+    async def _download(self, username: str, url: str) -> Optional[Tuple]:
+        """Tải avatar, trả về item cho writer, () nếu ảnh đã có sẵn, None nếu lỗi"""
+        cached = await asyncio.to_thread(self.index.lookup_url, url)
+        if cached is not None:
+            age = time.time() - cached["checked_at"]
+            if age < Config.AVATAR_CONFIG["revalidate_days"] * 86400:
+                self.index_hits += 1
+                await self._set_avatar(username, cached["path"], cached["hash"], cached["thumb_path"])
+                return ()
+            fetched_url = cached["fetched_url"]
+            headers = {}
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+            status, content, validators = await self._fetch(fetched_url, headers)
+            if status == 304:
+                self.not_modified += 1
+                await asyncio.to_thread(self.index.touch_url, url)
+                await self._set_avatar(username, cached["path"], cached["hash"], cached["thumb_path"])
+                return ()
+        else:
+            fetched_url = await self.resolve_avatar_url(url)
+            status, content, validators = await self._fetch(fetched_url)
+
+        if content is None:
+            return None
+        digest = hashlib.sha256(content).hexdigest()
+        return content, username, digest, url, fetched_url, validators
+
+    async def _writer(self) -> None:
+        """Gom ảnh đã tải thành batch, lưu và cập nhật profile"""
+        loop = asyncio.get_running_loop()
+        batch_size = Config.AVATAR_CONFIG["write_batch_size"]
+        flush_interval = Config.AVATAR_CONFIG["write_flush_interval"]
+        stopping = False
+
+        while not stopping:
+            item = await self._write_queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + flush_interval
+            while len(batch) < batch_size:
+                try:
+                    item = self._write_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    if loop.time() >= deadline:
+                        break
+                    await asyncio.sleep(0.05)
+                    continue
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                await self._write_batch(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"Lỗi khi lưu {len(batch)} avatar: {e}")
+
+    async def _write_batch(self, batch: List[Tuple]) -> None:
+        """Lưu một batch ảnh (bỏ qua ảnh đã lưu) và cập nhật đường dẫn vào profile
+
+        Hash được giữ chỗ (`_saving`) trên event loop trước khi tra index, nên
+        các writer (chế độ SFTP) không cùng lưu một ảnh: writer sau chờ kết quả
+        của writer đang lưu. Bộ đếm chỉ được cập nhật trên event loop.
+        """
+        loop = asyncio.get_running_loop()
+        owned: Dict[str, asyncio.Future] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+        contents: Dict[str, bytes] = {}
+        for content, _, digest, *_ in batch:
+            if digest in owned or digest in waiting:
+                self.deduplicated += 1
+            elif digest in self._saving:
+                self.deduplicated += 1
+                waiting[digest] = self._saving[digest]
+            else:
+                owned[digest] = self._saving[digest] = loop.create_future()
+                contents[digest] = content
+
+        blobs: Dict[str, dict] = {}
+        try:
+            known, new = await asyncio.to_thread(self._known_blobs, contents)
+            self.deduplicated += len(known)
+            blobs.update(known)
+            files = {digest: (content, None) for digest, content in new.items()}
+            if new and self.transcoder is not None:
+                # Ảnh không encode lại được giữ nguyên bản gốc
+                for digest, result in (await self.transcoder.transcode_many(new)).items():
+                    if result is not None:
+                        files[digest] = result
+            saved, sizes = await asyncio.to_thread(self._save_blobs, new, files)
+            blobs.update(saved)
+            for digest, stored in sizes.items():
+                # Thư mục shard theo ngày chứa ảnh
+                shard = os.path.basename(os.path.dirname(saved[digest]["path"]))
+                self.original_bytes[shard] += len(new[digest])
+                self.stored_bytes[shard] += stored
+                metrics.inc(AVATAR_BYTES, len(new[digest]), kind="original")
+                metrics.inc(AVATAR_BYTES, stored, kind="stored")
+        finally:
+            for digest, future in owned.items():
+                del self._saving[digest]
+                future.set_result(blobs.get(digest))
+
+        # Chờ sau khi đã lưu phần của mình để hai writer không chờ lẫn nhau
+        for digest, future in waiting.items():
+            blob = await future
+            if blob:
+                blobs[digest] = blob
+        await asyncio.to_thread(self._remember_urls, batch, blobs)
+
+        for content, username, digest, *_ in batch:
+            blob = blobs.get(digest)
+            if not blob:
+                self.failed += 1
+                continue
+            self.downloaded += 1
+            await self._set_avatar(username, blob["path"], digest, blob["thumb_path"])
+
+    def _known_blobs(self, contents: Dict[str, bytes]) -> Tuple[Dict[str, dict], Dict[str, bytes]]:
+        """Ảnh đã có trong index và ảnh mới (chưa lưu) theo hash (chạy trong thread)"""
+        blobs: Dict[str, dict] = {}
+        new: Dict[str, bytes] = {}
+        for digest, content in contents.items():
+            blob = self.index.blob(digest)
+            if blob is None:
+                new[digest] = content
+            else:
+                blobs[digest] = blob
+        return blobs, new
+
+    def _save_blobs(self, new: Dict[str, bytes], files: Dict[str, Tuple[bytes, Optional[bytes]]]
+                    ) -> Tuple[Dict[str, dict], Dict[str, int]]:
+        """Lưu ảnh mới (và thumbnail) và ghi index ảnh (chạy trong thread)
+
+        `files` là nội dung sẽ lưu theo hash: (ảnh, thumbnail) đã encode lại,
+        hoặc (ảnh gốc, None). Trả về ảnh đã lưu và số byte đã lưu theo hash.
+        """
+        blobs: Dict[str, dict] = {}
+        sizes: Dict[str, int] = {}
+        if not new:
+            return blobs, sizes
+        digests = list(new)
+        names = {
+            digest: f"{digest}.{self.transcoder.extension}" if files[digest][1] is not None
+            else f"{digest}.{image_extension(new[digest])}"
+            for digest in digests
+        }
+        paths = self.storage.save_many([(files[digest][0], names[digest]) for digest in digests])
+        with_thumb = [digest for digest, path in zip(digests, paths) if path and files[digest][1] is not None]
+        thumb_paths = dict(zip(with_thumb, self.storage.save_many(
+            [(files[digest][1], names[digest].replace(".", "_thumb.", 1)) for digest in with_thumb]
+        ))) if with_thumb else {}
+
+        for digest, path in zip(digests, paths):
+            if not path:
+                continue
+            main, thumb = files[digest]
+            sizes[digest] = len(main) + len(thumb or b"")
+            blobs[digest] = {"path": path, "thumb_path": thumb_paths.get(digest)}
+            self.index.add_blob(digest, path, sizes[digest], thumb_paths.get(digest))
+        return blobs, sizes
+
+    def _remember_urls(self, batch: List[Tuple], blobs: Dict[str, dict]) -> None:
+        """Ghi URL -> hash của các ảnh đã lưu trong batch vào index (chạy trong thread)"""
+        for _, _, digest, url, fetched_url, validators in batch:
+            if digest in blobs:
+                self.index.remember_url(url, digest, fetched_url, **validators)
+
+    async def _set_avatar(self, username: str, path: str, digest: str, thumb_path: Optional[str] = None) -> None:
+        if self.writes is not None:
+            self.writes.set_avatar(username, path, digest, thumb_path)
+            return
+        fields = {"avatar_url": path, "avatar_hash": digest}
+        if thumb_path:
+            fields["avatar_thumb_url"] = thumb_path
+        await asyncio.to_thread(profile_collection.update_one, {"username": username}, {"$set": fields})
+
+    async def resolve_avatar_url(self, avatar_url: str) -> str:
+        """Đổi URL avatar 75x75 sang bản gốc nếu tồn tại (kiểm tra bằng HEAD)"""
+        path_parts = urlparse(avatar_url).path.split("/")
+        if "75x75_RS" not in path_parts:
+            return avatar_url
+
+        image_path = "/".join(path_parts[2:])
+        original_url = f"{Config.PINIMG_BASE_URL}/originals/{image_path}"
+        try:
+            async with self._session.head(original_url, allow_redirects=True) as response:
+                return original_url if response.status == 200 else avatar_url
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Lỗi kiểm tra avatar gốc {original_url}: {e}")
+            return avatar_url
+
+    async def _fetch(
+        self, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, Optional[bytes], Dict[str, Any]]:
+        """Tải nội dung ảnh, thử lại với exponential backoff + jitter
+
+        Trả về (HTTP status, nội dung, ETag/Last-Modified của response), nội
+        dung None khi ảnh không đổi (304 với `headers` có điều kiện) hoặc lỗi.
+        """
+        max_retries = Config.AVATAR_CONFIG["max_retries"]
+        status = 0
+        for attempt in range(max_retries + 1):
+            try:
+                async with self._session.get(url, headers=headers) as response:
+                    status = response.status
+                    if status == 200:
+                        validators = {
+                            "etag": response.headers.get("ETag"),
+                            "last_modified": response.headers.get("Last-Modified"),
+                        }
+                        return status, await response.read(), validators
+                    if status == 304:
+                        return status, None, {}
+                    if status != 429 and status < 500:
+                        logger.warning(f"Không tải được avatar {url}: HTTP {status}")
+                        return status, None, {}
+                    error = f"HTTP {status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+
+            if attempt < max_retries:
+                delay = Config.AVATAR_CONFIG["backoff_base"] * (2 ** attempt)
+                await asyncio.sleep(delay + random.uniform(0, delay))
+
+        logger.error(f"Tải avatar {url} thất bại sau {max_retries + 1} lần: {error}")
+        return status, None, {}
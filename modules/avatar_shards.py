@@ -0,0 +1,197 @@
+import os
+import re
+import socket
+import threading
+from typing import Dict, List, Optional
+
+from utils.logger import setup_logger
+from utils.process import is_dead_on_host, process_tag
+
+# Cấu hình logger
+logger = setup_logger(__name__)
+
+SHARD_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2})(?:_(\d+))?$")
+# File đánh dấu shard chưa đầy đang được một process ghi: `.<shard>@<host>_<tên process>_<pid>`
+MARKER_PATTERN = re.compile(r"^\.(\d{4}-\d{2}-\d{2}(?:_\d+)?)@(.+)$")
+
+
+class LocalShardFs:
+    """Thao tác thư mục shard trên ổ đĩa local, đường dẫn tính từ `base_dir`"""
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+
+    def listdir(self, name: str = "") -> List[str]:
+        return os.listdir(os.path.join(self.base_dir, name))
+
+    def create(self, name: str) -> bool:
+        """Tạo thư mục mới, False nếu thư mục đã có (process khác đã tạo)"""
+        try:
+            os.makedirs(os.path.join(self.base_dir, name))
+        except FileExistsError:
+            return False
+        return True
+
+    def touch(self, name: str) -> None:
+        with open(os.path.join(self.base_dir, name), "a"):
+            pass
+
+    def rename(self, source: str, target: str) -> bool:
+        """Đổi tên file, False nếu `source` không còn (process khác đã đổi trước)"""
+        try:
+            os.rename(os.path.join(self.base_dir, source), os.path.join(self.base_dir, target))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def remove(self, name: str) -> None:
+        try:
+            os.remove(os.path.join(self.base_dir, name))
+        except FileNotFoundError:
+            pass
+
+
+class SftpShardFs:
+    """Thao tác thư mục shard trên remote server qua một SFTPClient đang mở"""
+
+    def __init__(self, sftp, base_dir: str):
+        self.sftp = sftp
+        self.base_dir = base_dir
+
+    def listdir(self, name: str = "") -> List[str]:
+        return self.sftp.listdir(f"{self.base_dir}/{name}" if name else self.base_dir)
+
+    def create(self, name: str) -> bool:
+        """Tạo thư mục mới, False nếu thư mục đã có (process khác đã tạo)"""
+        try:
+            self.sftp.mkdir(f"{self.base_dir}/{name}")
+        except OSError:
+            # SFTP không phân biệt lỗi thư mục đã tồn tại với các lỗi khác
+            if name in self.listdir():
+                return False
+            raise
+        return True
+
+    def touch(self, name: str) -> None:
+        self.sftp.open(f"{self.base_dir}/{name}", "w").close()
+
+    def rename(self, source: str, target: str) -> bool:
+        """Đổi tên file, False nếu `source` không còn (process khác đã đổi trước)"""
+        try:
+            self.sftp.rename(f"{self.base_dir}/{source}", f"{self.base_dir}/{target}")
+        except OSError:
+            return False
+        return True
+
+    def remove(self, name: str) -> None:
+        try:
+            self.sftp.remove(f"{self.base_dir}/{name}")
+        except OSError:
+            pass
+
+
+class _DayShard:
+    """Shard process đang ghi của một ngày (None nếu chưa có) và suffix lớn nhất đã biết"""
+
+    def __init__(self, suffix: int = 0, name: Optional[str] = None, count: int = 0):
+        self.suffix = suffix
+        self.name = name
+        self.count = count
+
+
+class ShardCounter:
+    """Bộ đếm số file trong thư mục avatar theo ngày (`YYYY-MM-DD`, `_2`, `_3`...)
+
+    Mỗi thư mục shard chỉ do một process ghi: process giữ thư mục mới bằng
+    cách tự tạo nó (tạo thư mục là thao tác atomic cả trên ổ đĩa local lẫn
+    SFTP), thư mục đã có là của process khác nên chuyển sang suffix tiếp
+    theo. Shard chưa đầy có file đánh dấu `.<shard>@<process>` trong thư mục
+    gốc, bị xóa khi shard đầy. Nhờ vậy nhiều process/container dùng chung
+    thư mục avatar không ghi quá `files_per_folder` file vào cùng một shard.
+
+    Lần đầu ghi trong ngày, process quét thư mục gốc một lần: shard chưa đầy
+    của process đã dừng trên cùng host (process được khởi động lại, lần chạy
+    CLI trước) được nhận bằng cách đổi tên file đánh dấu (atomic, chỉ một
+    process nhận được), shard có file đánh dấu trùng định danh của process
+    (khởi động lại với cùng hostname và pid) được nhận luôn, và ghi tiếp từ
+    số file hiện có, nên khởi động lại không tạo thêm thư mục. Sau đó đếm
+    trong bộ nhớ, chuyển sang thư mục mới khi đầy trong O(1), không cần
+    `listdir` cho từng avatar. Bộ đếm được khóa bằng `threading.Lock` cho các
+    writer trong process.
+    """
+
+    def __init__(self, files_per_folder: int, owner: Optional[str] = None):
+        self.files_per_folder = files_per_folder
+        self.owner = owner or process_tag()
+        self._days: Dict[str, _DayShard] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def shard_name(day: str, suffix: int) -> str:
+        return day if suffix == 1 else f"{day}_{suffix}"
+
+    def _marker(self, shard: str) -> str:
+        return f".{shard}@{self.owner}"
+
+    def reserve(self, day: str, count: int, fs) -> List[str]:
+        """Giữ chỗ cho `count` file, trả về tên thư mục shard cho từng file"""
+        with self._lock:
+            state = self._days.get(day)
+            if state is None:
+                state = self._days[day] = self._resume(day, fs)
+
+            names: List[str] = []
+            while len(names) < count:
+                if state.name is None or state.count >= self.files_per_folder:
+                    if state.name is not None:
+                        # Shard đầy không cần được nhận lại
+                        fs.remove(self._marker(state.name))
+                    state.suffix += 1
+                    state.name, state.count = self.shard_name(day, state.suffix), 0
+                    if fs.create(state.name):
+                        fs.touch(self._marker(state.name))
+                    else:
+                        state.name = None
+                    continue
+
+                take = min(self.files_per_folder - state.count, count - len(names))
+                names.extend([state.name] * take)
+                state.count += take
+            return names
+
+    def _resume(self, day: str, fs) -> _DayShard:
+        """Quét thư mục gốc: suffix lớn nhất trong ngày và shard chưa đầy nhận lại được"""
+        try:
+            entries = sorted(fs.listdir(""))
+        except FileNotFoundError:
+            return _DayShard()
+
+        state = _DayShard()
+        for entry in entries:
+            match = SHARD_PATTERN.match(entry)
+            if match and match.group(1) == day:
+                state.suffix = max(state.suffix, int(match.group(2) or 1))
+
+        host = socket.gethostname()
+        for entry in entries:
+            match = MARKER_PATTERN.match(entry)
+            if match is None or not match.group(1).startswith(day):
+                continue
+            # Cùng định danh: lần chạy trước của chính process này (container
+            # khởi động lại giữ hostname và pid, ví dụ pid 1), không cần đổi tên
+            own = match.group(2) == self.owner
+            if not own and not is_dead_on_host(match.group(2), host):
+                continue
+            shard = match.group(1)
+            if not own and not fs.rename(entry, self._marker(shard)):
+                continue
+            count = len(fs.listdir(shard))
+            if count >= self.files_per_folder:
+                fs.remove(self._marker(shard))
+                continue
+            logger.info(f"Ghi tiếp shard avatar {shard} ({count} file) của process đã dừng {match.group(2)}")
+            state.name, state.count = shard, count
+            break
+        if state.name is None and state.suffix:
+            logger.info(f"Shard avatar ngày {day}: đã có tới {self.shard_name(day, state.suffix)}")
+        return state
@@ -0,0 +1,116 @@
+import os
+import time
+from datetime import datetime
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+from modules.avatar_shards import LocalShardFs, SftpShardFs, ShardCounter
+from modules.metrics import metrics
+from modules.sftp_pool import SftpPool
+from utils.config import Config
+from utils.logger import setup_logger
+
+# Cấu hình logger
+logger = setup_logger(__name__)
+
+
+class AvatarStorage:
+    """Lưu nội dung ảnh avatar vào local hoặc remote server (SFTP) tùy môi trường"""
+
+    def __init__(
+        self, is_docker: Optional[bool] = None, sftp_pool: Optional[SftpPool] = None
+    ):
+        # Kiểm tra môi trường (hoặc theo cấu hình AVATAR_STORAGE)
+        if is_docker is None:
+            mode = Config.AVATAR_CONFIG["storage"]
+            is_docker = os.path.exists("/.dockerenv") if mode == "auto" else mode == "sftp"
+        self.is_docker = is_docker
+        self.sftp_pool = sftp_pool
+        if self.is_docker and self.sftp_pool is None:
+            self.sftp_pool = SftpPool()
+
+        # Bộ đếm file theo thư mục ngày, tránh listdir cho mỗi avatar
+        files_per_folder = Config.AVATAR_CONFIG["files_per_folder"]
+        self._local_fs = LocalShardFs(Config.DIRECTORIES["avatars"])
+        self.local_shards = ShardCounter(files_per_folder)
+        self.remote_shards = ShardCounter(files_per_folder)
+
+    def close(self) -> None:
+        """Đóng các phiên SFTP"""
+        if self.sftp_pool is not None:
+            self.sftp_pool.close()
+
+    def save(self, content: bytes, name: str) -> Optional[str]:
+        """Lưu một ảnh với tên file `name`, trả về đường dẫn đã lưu (None nếu lỗi)"""
+        return self.save_many([(content, name)])[0]
+
+    def save_many(self, items: List[Tuple[bytes, str]]) -> List[Optional[str]]:
+        """Lưu nhiều ảnh (content, tên file), trả về đường dẫn theo đúng thứ tự
+
+        Pipeline avatar dùng hash nội dung làm tên file (`<hash>.<đuôi theo định dạng ảnh>`).
+
+        Hàm chạy blocking (I/O đĩa/SSH), cần gọi qua `asyncio.to_thread`.
+        """
+        if self.is_docker:
+            return self._save_remote_many(items)
+
+        paths = []
+        shards = self.local_shards.reserve(self._today(), len(items), self._local_fs)
+        for (content, name), shard in zip(items, shards):
+            try:
+                paths.append(self._save_local(content, name, shard))
+            except Exception as e:
+                logger.error(f"Lỗi lưu avatar {name}: {e}")
+                paths.append(None)
+        return paths
+
+    def _save_remote_many(self, items: List[Tuple[bytes, str]]) -> List[Optional[str]]:
+        """Upload nhiều ảnh qua một phiên SFTP, kết nối lại một lần nếu lỗi"""
+        started = time.monotonic()
+        paths: List[Optional[str]] = [None] * len(items)
+        pending = list(range(len(items)))
+        shards: Optional[List[str]] = None
+
+        for attempt in range(2):
+            if not pending:
+                break
+            try:
+                with self.sftp_pool.session() as sftp:
+                    remote_base = Config.SFTP_CONFIG["remote_base_path"]
+                    if shards is None:
+                        # Giữ chỗ một lần cho cả batch, lần thử lại dùng lại chỗ đã giữ
+                        shards = self.remote_shards.reserve(
+                            self._today(), len(items), SftpShardFs(sftp, remote_base)
+                        )
+                    for index in list(pending):
+                        content, name = items[index]
+                        remote_path = f"{remote_base}/{shards[index]}/{name}"
+                        with BytesIO(content) as file_obj, metrics.timer("sftp_upload"):
+                            sftp.putfo(file_obj, remote_path)
+                        paths[index] = remote_path
+                        pending.remove(index)
+            except Exception as e:
+                logger.error(
+                    f"Lỗi upload avatar qua SFTP (lần {attempt + 1}), còn {len(pending)} file: {e}"
+                )
+
+        uploaded = len(items) - len(pending)
+        elapsed = max(time.monotonic() - started, 1e-6)
+        logger.info(
+            f"Đã upload {uploaded}/{len(items)} avatar qua SFTP trong {elapsed:.2f}s "
+            f"({uploaded / elapsed:.1f} file/s)"
+        )
+        return paths
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now().strftime("%Y-%m-%d")
+
+    @staticmethod
+    def _save_local(content: bytes, name: str, shard: str) -> Optional[str]:
+        """Ghi ảnh vào thư mục shard local của ngày"""
+        filename = os.path.join(Config.DIRECTORIES["avatars"], shard, name)
+        with open(filename, "wb") as f:
+            f.write(content)
+        logger.info(f"Ảnh avatar đã lưu local: {filename}")
+        return filename
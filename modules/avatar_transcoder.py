@@ -0,0 +1,112 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+from utils.config import Config
+from utils.logger import setup_logger
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow là dependency tùy chọn
+    Image = None
+
+# Cấu hình logger
+logger = setup_logger(__name__)
+
+# Phần mở rộng file theo định dạng Pillow
+EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg", "PNG": "png"}
+
+
+def _encode(image, fmt: str, quality: int) -> bytes:
+    """Encode ảnh, không kèm EXIF/ICC/metadata của ảnh gốc"""
+    if fmt == "JPEG" and image.mode != "RGB":
+        # JPEG không có kênh alpha: nền trắng thay cho phần trong suốt
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A") if "A" in image.getbands() else None)
+        image = background
+    with BytesIO() as output:
+        image.save(output, fmt, quality=quality, optimize=True)
+        return output.getvalue()
+
+
+def transcode(content: bytes, fmt: str, quality: int, max_size: int, thumb_size: int) -> Tuple[bytes, bytes]:
+    """Encode lại ảnh với cạnh dài tối đa `max_size` và tạo thumbnail `thumb_size`
+
+    Chạy trong process của `ProcessPoolExecutor` nên phải là hàm cấp module.
+    Trả về (ảnh, thumbnail) đã encode theo `fmt`.
+    """
+    with Image.open(BytesIO(content)) as source:
+        # Xoay theo EXIF trước khi bỏ metadata
+        image = ImageOps.exif_transpose(source)
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+    image.info = {}
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    main = _encode(image, fmt, quality)
+    image.thumbnail((thumb_size, thumb_size), Image.LANCZOS)
+    return main, _encode(image, fmt, quality)
+
+
+class AvatarTranscoder:
+    """Encode lại avatar (định dạng gọn, giới hạn kích thước, bỏ metadata) và tạo thumbnail
+
+    Decode/encode ảnh tốn CPU nên chạy trong `ProcessPoolExecutor`, event loop
+    của crawler chỉ chờ kết quả. Cần Pillow; khi chưa cài thì `available()`
+    trả về False và pipeline lưu ảnh gốc như cũ.
+    """
+
+    def __init__(
+        self,
+        fmt: str = Config.AVATAR_CONFIG["transcode"]["format"],
+        quality: int = Config.AVATAR_CONFIG["transcode"]["quality"],
+        max_size: int = Config.AVATAR_CONFIG["transcode"]["max_size"],
+        thumb_size: int = Config.AVATAR_CONFIG["transcode"]["thumb_size"],
+        workers: Optional[int] = Config.AVATAR_CONFIG["transcode"]["workers"],
+    ):
+        self.fmt = fmt.upper()
+        self.extension = EXTENSIONS[self.fmt]
+        self.quality = quality
+        self.max_size = max_size
+        self.thumb_size = thumb_size
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.failed = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @staticmethod
+    def available() -> bool:
+        return Image is not None
+
+    def start(self) -> None:
+        # spawn thay vì fork: process encode không kế thừa event loop, thread hay kết nối của crawler
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        logger.info(f"Khởi động {self.workers} process encode avatar ({self.fmt}, tối đa {self.max_size}px)")
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def transcode_many(self, items: Dict[str, bytes]) -> Dict[str, Optional[Tuple[bytes, bytes]]]:
+        """Encode lại các ảnh theo hash, trả về (ảnh, thumbnail), None với ảnh không encode được"""
+        loop = asyncio.get_running_loop()
+        digests: List[str] = list(items)
+        results = await asyncio.gather(
+            *[
+                loop.run_in_executor(
+                    self._executor, transcode, items[digest], self.fmt, self.quality, self.max_size, self.thumb_size
+                )
+                for digest in digests
+            ],
+            return_exceptions=True,
+        )
+        output: Dict[str, Optional[Tuple[bytes, bytes]]] = {}
+        for digest, result in zip(digests, results):
+            if isinstance(result, Exception):
+                self.failed += 1
+                logger.warning(f"Không encode lại được avatar {digest[:12]}, lưu ảnh gốc: {result}")
+                output[digest] = None
+            else:
+                output[digest] = result
+        return output
@@ -0,0 +1,253 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import psutil
+from playwright.async_api import async_playwright
+
+from modules.metrics import metrics
+from modules.request_filter import RequestFilter
+from utils.config import Config
+from utils.logger import setup_logger
+
+# Cấu hình logger
+logger = setup_logger(__name__)
+
+
+class _PooledContext:
+    """Một browser context trong pool cùng các thông số theo dõi"""
+
+    def __init__(self, slot_id: int):
+        self.slot_id = slot_id
+        self.context = None
+        self.generation = -1
+        self.pages_served = 0
+
+    def _on_page(self, page) -> None:
+        """Đếm số page đã mở trên context"""
+        self.pages_served += 1
+
+
+class BrowserPool:
+    """Pool browser Chromium dùng chung cho tất cả worker
+
+    Browser chỉ được khởi động một lần (lazy, ở lần lease đầu tiên) và được
+    giữ lại suốt quá trình crawl. Mỗi worker mượn một context qua `lease()`,
+    context được tạo lại sau `max_pages_per_context` page, browser được khởi
+    động lại khi RSS vượt `max_rss_mb` hoặc khi bị crash.
+    """
+
+    def __init__(
+        self,
+        size: int = Config.CRAWLER_CONFIG["default_workers"],
+        max_pages_per_context: Optional[int] = None,
+        max_rss_mb: Optional[int] = None,
+    ):
+        self.size = max(1, size)
+        self.max_pages_per_context = (
+            max_pages_per_context
+            or Config.BROWSER_POOL_CONFIG["max_pages_per_context"]
+        )
+        self.max_rss_mb = max_rss_mb or Config.BROWSER_POOL_CONFIG["max_rss_mb"]
+        self.request_filter = RequestFilter()
+
+        self._playwright = None
+        self._browser = None
+        self._generation = 0
+        self._active = 0
+        self._restart_pending = False
+        self._slots: List[_PooledContext] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._cond: Optional[asyncio.Condition] = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def start(self) -> None:
+        """Khởi tạo các slot context (browser được launch khi cần)"""
+        self._idle = asyncio.Queue()
+        self._cond = asyncio.Condition()
+        for slot_id in range(self.size):
+            slot = _PooledContext(slot_id)
+            self._slots.append(slot)
+            self._idle.put_nowait(slot)
+        logger.info(f"Khởi tạo browser pool với {self.size} context")
+
+    async def close(self) -> None:
+        """Đóng toàn bộ context, browser và playwright"""
+        for slot in self._slots:
+            await self._close_context(slot)
+        await self._shutdown_browser()
+        self.request_filter.log_summary()
+        logger.info("Đã đóng browser pool")
+
+    @asynccontextmanager
+    async def lease(self):
+        """Mượn một browser context, tự động trả lại khi thoát khỏi with"""
+        slot = await self._idle.get()
+        try:
+            await self._prepare(slot)
+        except BaseException:
+            self._idle.put_nowait(slot)
+            raise
+
+        try:
+            yield slot.context
+        finally:
+            await self._release(slot)
+            self._idle.put_nowait(slot)
+
+    async def _prepare(self, slot: _PooledContext) -> None:
+        """Đảm bảo browser còn sống và context của slot dùng được"""
+        async with self._cond:
+            if self._restart_pending:
+                # Chờ các lease khác trả context rồi mới khởi động lại browser
+                await self._cond.wait_for(lambda: self._active == 0)
+                if self._restart_pending:
+                    await self._shutdown_browser(keep_playwright=True)
+                    self._restart_pending = False
+
+            if not self._is_healthy():
+                await self._launch_browser()
+
+            if (
+                slot.context is None
+                or slot.generation != self._generation
+                or slot.pages_served >= self.max_pages_per_context
+            ):
+                await self._close_context(slot)
+                slot.context = await self._create_browser_context(slot)
+                slot.generation = self._generation
+                slot.pages_served = 0
+
+            self._active += 1
+
+    async def _release(self, slot: _PooledContext) -> None:
+        """Trả context về pool, tái chế context/browser nếu cần"""
+        async with self._cond:
+            self._active -= 1
+
+            if not self._is_healthy():
+                # Browser đã crash, context của slot không còn dùng được
+                slot.context = None
+            elif slot.pages_served >= self.max_pages_per_context:
+                logger.info(
+                    f"Context {slot.slot_id} đã phục vụ {slot.pages_served} page, tạo lại context"
+                )
+                await self._close_context(slot)
+
+            rss_mb = self._browser_rss_mb()
+            if rss_mb > self.max_rss_mb and not self._restart_pending:
+                logger.warning(
+                    f"RSS của browser {rss_mb:.0f}MB vượt giới hạn {self.max_rss_mb}MB, sẽ khởi động lại browser"
+                )
+                self._restart_pending = True
+
+            self._cond.notify_all()
+
+    def _is_healthy(self) -> bool:
+        """Kiểm tra browser còn kết nối hay không"""
+        return self._browser is not None and self._browser.is_connected()
+
+    async def _launch_browser(self) -> None:
+        """Khởi động (hoặc khởi động lại sau crash) browser Chromium"""
+        if self._browser is not None:
+            logger.warning("Browser không còn kết nối, khởi động lại browser")
+            await self._shutdown_browser(keep_playwright=True)
+
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        minimal = Config.BROWSER_POOL_CONFIG["minimal_profile"]
+        with metrics.timer("browser_launch"):
+            self._browser = await self._playwright.chromium.launch(
+                headless=Config.BROWSER_POOL_CONFIG["headless"],
+                args=Config.BROWSER_POOL_CONFIG["minimal_launch_args"] if minimal else None,
+            )
+        self._browser.on("disconnected", self._on_disconnected)
+        self._generation += 1
+        logger.info(f"Đã khởi động browser (lần {self._generation})")
+
+    def _on_disconnected(self, browser) -> None:
+        """Đánh dấu browser đã mất kết nối để lần lease sau khởi động lại"""
+        if browser is self._browser:
+            logger.error("Browser bị ngắt kết nối")
+            self._browser = None
+
+    async def _create_browser_context(self, slot: _PooledContext):
+        """Tạo và trả về context được cấu hình sẵn"""
+        minimal = Config.BROWSER_POOL_CONFIG["minimal_profile"]
+        context = await self._browser.new_context(
+            user_agent=Config.CRAWLER_CONFIG["user_agent"],
+            viewport=Config.BROWSER_POOL_CONFIG["minimal_viewport"] if minimal else Config.CRAWLER_CONFIG["viewport"],
+            locale=Config.CRAWLER_CONFIG["locale"],
+            service_workers="block",
+        )
+        context.on("page", slot._on_page)
+        await self.request_filter.install(context)
+        return context
+
+    @staticmethod
+    async def _close_context(slot: _PooledContext) -> None:
+        """Đóng context của slot (bỏ qua lỗi nếu browser đã chết)"""
+        context, slot.context = slot.context, None
+        if context is None:
+            return
+        try:
+            await context.close()
+        except Exception as e:
+            logger.warning(f"Lỗi khi đóng context {slot.slot_id}: {e}")
+
+    async def _shutdown_browser(self, keep_playwright: bool = False) -> None:
+        """Đóng browser và (tuỳ chọn) playwright"""
+        browser, self._browser = self._browser, None
+        if browser is not None:
+            try:
+                await browser.close()
+            except Exception as e:
+                logger.warning(f"Lỗi khi đóng browser: {e}")
+        if not keep_playwright and self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    @staticmethod
+    def _browser_rss_mb() -> float:
+        """Tổng RSS (MB) của các tiến trình con (playwright driver + chromium)"""
+        total = 0
+        for child in psutil.Process().children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                continue
+        return total / (1024 * 1024)
+
+
+class LazyLease:
+    """Chỉ mượn context từ pool ở lần đầu tiên thực sự cần tới"""
+
+    def __init__(self, pool: BrowserPool):
+        self._pool = pool
+        self._lease_cm = None
+        self._context = None
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self._lease_cm is not None:
+            await self._lease_cm.__aexit__(exc_type, exc_val, exc_tb)
+            self._lease_cm = None
+            self._context = None
+
+    async def get(self):
+        """Trả về context đã mượn, mượn mới nếu chưa có"""
+        async with self._lock:
+            if self._context is None:
+                lease_cm = self._pool.lease()
+                self._context = await lease_cm.__aenter__()
+                self._lease_cm = lease_cm
+            return self._context
@@ -0,0 +1,125 @@
+from typing import Any, Dict, List, Optional
+
+from database import *
+from modules.keyword_planner import FrontierLease
+from modules.scheduler import RefreshLease
+from modules.work_lease import WorkLease
+from utils.config import Config
+from utils.logger import setup_logger
+
+# Cấu hình logger
+logger = setup_logger(__name__)
+
+# Stage đọc trực tiếp trên index (không cần document nếu không có FETCH)
+INDEX_STAGES = {"IXSCAN", "COUNT_SCAN", "DISTINCT_SCAN", "IDHACK", "EXPRESS_IXSCAN", "EXPRESS_IDHACK"}
+
+
+class HotQuery:
+    """Một truy vấn crawler chạy thường xuyên, dùng để explain"""
+
+    def __init__(self, name: str, collection, filter: dict, projection: Optional[dict] = None,
+                 sort: Optional[list] = None, limit: int = 0):
+        self.name = name
+        self.collection = collection
+        self.filter = filter
+        self.projection = projection
+        self.sort = sort
+        self.limit = limit
+
+    def explain(self) -> dict:
+        cursor = self.collection.find(self.filter, self.projection)
+        if self.sort:
+            cursor = cursor.sort(self.sort)
+        if self.limit:
+            cursor = cursor.limit(self.limit)
+        return cursor.explain()
+
+
+def _sample(collection, field: str, limit: int) -> List[Any]:
+    """Lấy giá trị thật của field để explain lookup trên dữ liệu hiện có"""
+    return [doc[field] for doc in collection.find({}, {field: 1, "_id": 0}).limit(limit) if field in doc]
+
+
+def hot_queries() -> List[HotQuery]:
+    """Các truy vấn chính của queue, lease và write buffer"""
+    keyword_lease = FrontierLease(keywords_collection, "keyword")
+    username_lease = WorkLease(usernames_collection, "username")
+    refresh_lease = RefreshLease(usernames_collection, "username", "refreshPriority")
+    keywords = _sample(keywords_collection, "keyword", 1) or ["a"]
+    usernames = _sample(usernames_collection, "username", Config.CRAWLER_CONFIG["default_batch_size"]) or ["a"]
+    claimable = keyword_lease._claimable(keyword_lease._now())
+
+    return [
+        HotQuery("claim keyword", keywords_collection, claimable, sort=keyword_lease.order, limit=1),
+        HotQuery("claim batch username", usernames_collection, username_lease._claimable(username_lease._now()),
+                 {"_id": 1}, sort=[("_id", 1)], limit=Config.CRAWLER_CONFIG["default_batch_size"]),
+        HotQuery("claim username crawl lại", usernames_collection, refresh_lease._claimable(refresh_lease._now()),
+                 {"_id": 1}, sort=refresh_lease.order, limit=Config.CRAWLER_CONFIG["default_batch_size"]),
+        HotQuery("đếm keyword chưa crawl", keywords_collection, {"isCrawl": False}, {"_id": 1}),
+        HotQuery("upsert keyword", keywords_collection, {"keyword": keywords[0]}, {"keyword": 1, "_id": 0}),
+        HotQuery("lookup username $in", usernames_collection, {"username": {"$in": usernames}},
+                 {"username": 1, "_id": 0}),
+        HotQuery("gia hạn lease username", usernames_collection,
+                 {"username": {"$in": usernames}, "claimedBy": username_lease.owner_id}),
+        HotQuery("upsert profile", profile_collection, {"username": usernames[0]}, {"username": 1, "_id": 0}),
+    ]
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Danh sách stage của plan, từ ngoài vào trong"""
+    stages = [plan] if "stage" in plan else []
+    for key in ("queryPlan", "inputStage"):
+        if key in plan:
+            stages += _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+
+def describe_plan(explain: dict) -> Dict[str, Any]:
+    """Tóm tắt kết quả explain: các stage, index dùng, có cover được không"""
+    stages = _plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+    names = [stage["stage"] for stage in stages]
+    indexes = sorted({stage["indexName"] for stage in stages if stage.get("indexName")})
+    if "COLLSCAN" in names:
+        verdict = "quét toàn bộ collection"
+    elif INDEX_STAGES.intersection(names) and "FETCH" not in names:
+        verdict = "covered"
+    elif INDEX_STAGES.intersection(names):
+        verdict = "dùng index, cần đọc document"
+    else:
+        verdict = "không rõ"
+
+    stats = explain.get("executionStats", {})
+    return {
+        "stages": " <- ".join(names),
+        "indexes": indexes,
+        "verdict": verdict,
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "returned": stats.get("nReturned"),
+    }
+
+
+def explain_indexes() -> List[Dict[str, Any]]:
+    """Explain các truy vấn chính và log truy vấn nào được index cover"""
+    results = []
+    for query in hot_queries():
+        try:
+            summary = describe_plan(query.explain())
+        except Exception as e:
+            logger.error(f"Không explain được truy vấn {query.name}: {e}")
+            continue
+        summary["name"] = query.name
+        summary["collection"] = query.collection.name
+        results.append(summary)
+
+        detail = ""
+        if summary["docs_examined"] is not None:
+            detail = (f", keys {summary['keys_examined']}, docs {summary['docs_examined']}, "
+                      f"trả về {summary['returned']}")
+        indexes = ", ".join(summary["indexes"]) or "-"
+        log = logger.warning if summary["verdict"] == "quét toàn bộ collection" else logger.info
+        log(f"{query.name} ({query.collection.name}): {summary['verdict']} "
+            f"[{summary['stages']}] index: {indexes}{detail}")
+    return results
@@ -1,5 +1,11 @@
 from utils.config import Config
 import string
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from database import *
 from models.keyword_entity import KeywordEntity
 from utils.logger import setup_logger
@@ -7,6 +13,71 @@ import requests
 
 logger = setup_logger(__name__)
 
+# Mã lỗi duplicate key của MongoDB
+DUPLICATE_KEY_ERROR = 11000
+
+
+class KeywordCache:
+    """Cache LRU các keyword đã biết là có trong database (dùng chung trong process)"""
+
+    def __init__(self, max_size: int = Config.KEYWORD_CONFIG["cache_size"]):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, keyword: str) -> bool:
+        with self._lock:
+            if keyword in self._items:
+                self._items.move_to_end(keyword)
+                return True
+            return False
+
+    def add_many(self, keywords: Iterable[str]) -> None:
+        with self._lock:
+            for keyword in keywords:
+                self._items[keyword] = True
+                self._items.move_to_end(keyword)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
+known_keywords = KeywordCache()
+
+
+def save_keywords(keywords: Iterable[str], expected: Optional[Dict[str, float]] = None) -> int:
+    """Lưu các keyword chưa có vào database, trả về số keyword được thêm mới
+
+    Keyword đã nằm trong cache được bỏ qua, phần còn lại được upsert bằng một
+    lệnh `bulk_write` không thứ tự, nên hai worker cùng thêm một keyword cũng
+    chỉ tạo một document (kết hợp unique index trên `keyword`). `expected`
+    là điểm của keyword theo planner, dùng làm thứ tự claim: keyword có điểm
+    luôn được ghi (kể cả khi đã có) để nâng `expectedYield` (`$max`) và cập
+    nhật thời điểm được nhắc tới `mentionedAt`.
+    """
+    expected = expected or {}
+    candidates = {keyword for keyword in keywords if keyword in expected or keyword not in known_keywords}
+    if not candidates:
+        return 0
+
+    now = datetime.now(timezone.utc)
+    operations = []
+    for keyword in candidates:
+        update = {"$setOnInsert": KeywordEntity(isCrawl=False, crawlDate=None).to_dict()}
+        if keyword in expected:
+            update.update({"$max": {"expectedYield": expected[keyword]}, "$set": {"mentionedAt": now}})
+        operations.append(UpdateOne({"keyword": keyword}, update, upsert=True))
+    try:
+        inserted = keywords_collection.bulk_write(operations, ordered=False).upserted_count
+    except BulkWriteError as e:
+        # Worker khác vừa thêm cùng keyword: bỏ qua lỗi duplicate key
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+            raise
+        inserted = e.details.get("nUpserted", 0)
+
+    known_keywords.add_many(candidates)
+    return inserted
+
 
 # Hàm tạo default keyword serach
 def create_keywords():
@@ -14,20 +85,12 @@ def create_keywords():
     # Tạo danh sách các ký tự từ a-z và số 0-9
     keywords = list(string.ascii_lowercase + string.digits)
 
-    # Chuyển đổi thành KeywordEntity
-    keyword_entities = [
-        KeywordEntity(keyword=keyword, isCrawl=False, crawlDate=None)
-        for keyword in keywords
-    ]
-
-    # Lưu vào database
-    if keyword_entities:
-        keywords_collection.insert_many(
-            [entity.to_dict() for entity in keyword_entities]
-        )
-        logger.info(
-            f"✅ Đã lưu {len(keyword_entities)} keywords vào MongoDB: {Config.DATABASE_NAME}"
-        )
+    # Lưu vào database (bỏ qua keyword đã có), điểm cao nhất để được tìm trước các từ trong tên
+    score = float(Config.KEYWORD_CONFIG["planner"]["mention_cap"])
+    inserted = save_keywords(keywords, {keyword: score for keyword in keywords})
+    logger.info(
+        f"✅ Đã lưu {inserted} keywords vào MongoDB: {Config.DATABASE_NAME}"
+    )
 
 
 def count_keyword_not_crawl():
@@ -0,0 +1,231 @@
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from database import *
+from modules.keyword_manager import save_keywords
+from modules.work_lease import WorkLease
+from utils.config import Config
+from utils.logger import setup_logger
+
+# Cấu hình logger
+logger = setup_logger(__name__)
+
+
+class _TrieNode:
+    """Một ký tự trong trie: số liệu của keyword tới node này (nếu đã tìm)"""
+
+    __slots__ = ("children", "found", "new", "saturated", "searched")
+
+    def __init__(self):
+        self.children: Optional[Dict[str, "_TrieNode"]] = None
+        self.found = 0
+        self.new = 0
+        self.saturated = False
+        self.searched = False
+
+
+class KeywordPlanner:
+    """Chọn keyword đáng tìm theo trie các keyword đã tìm và số lần tên được nhắc tới
+
+    Mỗi keyword đã tìm lưu số username tìm được (`found`), số username mới
+    (`new`) và kết quả có bị cắt không (`saturated`: vẫn còn trang sau khi
+    dừng tìm, kể cả khi dừng vì lỗi hoặc hết thời gian chờ).
+    - Điểm (`expectedYield`) của keyword chờ crawl là số lần nó được nhắc
+      tới trong tên của các profile vừa crawl (mỗi từ nhận keyword làm prefix
+      tính một lần), tối đa `mention_cap`: keyword khớp nhiều người dùng lấp
+      đầy trang kết quả nên mang về nhiều username mới hơn trên mỗi trang.
+      Cùng điểm thì keyword lâu không được nhắc tới (`mentionedAt`, với
+      keyword đã đạt `mention_cap` chỉ cập nhật sau mỗi `mention_refresh` lần
+      được nhắc tới để không ghi database cho mỗi lần) được tìm trước: tên vẫn liên tục xuất hiện trong profile mới là tên mà người
+      dùng của nó đang được tìm thấy qua các keyword khác.
+    - Keyword bị cắt kết quả và còn nhiều username mới được mở rộng thêm một
+      ký tự để với tới phần kết quả bị cắt, chỉ với các ký tự (trong
+      `alphabet`) đứng sau keyword trong username tìm được (`note_results`).
+      Điểm là tỉ phần kết quả của keyword cha rơi vào nó (dưới 1), nên phần
+      đuôi chỉ được tìm sau các từ trong tên.
+    - Keyword có prefix đã tìm mà kết quả không bị cắt không được lưu: mọi
+      username khớp prefix đã được lấy. Keyword đã lưu trước khi prefix được
+      tìm không bị lọc khỏi lượt claim (`FrontierLease`), mà được claim rồi
+      đánh dấu đã crawl không cần tìm (`is_covered`), tốn một lượt claim và
+      một lệnh ghi nhưng không tốn request tới Pinterest.
+
+    Trie nằm trong bộ nhớ của process, được dựng lại từ keyword đã crawl khi
+    khởi động (`load`) và cập nhật sau mỗi lần write buffer ghi keyword. Số
+    lần nhắc tới chỉ được đếm cho keyword chờ crawl mà process đã nạp hoặc đã
+    lưu (tối đa `pending_size` keyword gần nhất), database giữ điểm cao nhất
+    (`$max`).
+    """
+
+    def __init__(self, config: Optional[dict] = None):
+        config = config or Config.KEYWORD_CONFIG["planner"]
+        self.enabled = config["enabled"]
+        self.alphabet = config["alphabet"]
+        self.max_length = config["max_length"]
+        self.min_yield = config["min_yield"]
+        self.prior_yield = config["prior_yield"]
+        self.prior_weight = config["prior_weight"]
+        self.mention_cap = config["mention_cap"]
+        self.mention_refresh = max(1, config["mention_refresh"])
+        self.pending_size = config["pending_size"]
+        self.searched = 0
+        self.expanded = 0
+        self.skipped = 0
+        self._root = _TrieNode()
+        # Số username tìm được theo ký tự đứng sau keyword, chờ tới khi keyword được ghi
+        self._next_chars: Dict[str, Counter] = {}
+        # Số lần được nhắc tới của các keyword chờ crawl mà process đã lưu
+        self._mentions: "OrderedDict[str, int]" = OrderedDict()
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _path(self, keyword: str, create: bool = False) -> List[_TrieNode]:
+        """Các node từ ký tự đầu tới hết keyword (dừng ở node chưa có nếu không `create`)"""
+        path = []
+        node = self._root
+        for char in keyword:
+            child = node.children.get(char) if node.children else None
+            if child is None:
+                if not create:
+                    break
+                if node.children is None:
+                    node.children = {}
+                child = node.children[char] = _TrieNode()
+            path.append(child)
+            node = child
+        return path
+
+    def _smoothed(self, new: int, found: int) -> float:
+        return (new + self.prior_yield * self.prior_weight) / (found + self.prior_weight)
+
+    def _covered(self, keyword: str) -> bool:
+        return any(node.searched and not node.saturated for node in self._path(keyword[:-1]))
+
+    def _searched(self, keyword: str) -> bool:
+        path = self._path(keyword)
+        return len(path) == len(keyword) and path[-1].searched
+
+    def _remember(self, keyword: str, mentions: int = 0) -> None:
+        self._mentions[keyword] = mentions
+        self._mentions.move_to_end(keyword)
+        while len(self._mentions) > self.pending_size:
+            self._mentions.popitem(last=False)
+
+    def load(self) -> None:
+        """Dựng trie từ các keyword đã crawl trong database (một lần mỗi process)"""
+        if self._loaded:
+            return
+        cursor = keywords_collection.find(
+            {"isCrawl": True}, {"keyword": 1, "lastFound": 1, "yieldScore": 1, "saturated": 1, "_id": 0}
+        )
+        for doc in cursor:
+            if doc.get("keyword") and "lastFound" in doc:
+                # Keyword crawl trước khi có planner: không biết kết quả có bị cắt, không dùng để bỏ qua keyword con
+                self.record(doc["keyword"], doc["lastFound"], doc.get("yieldScore") or 0, doc.get("saturated", True))
+        pending = keywords_collection.find(
+            {"isCrawl": False}, {"keyword": 1, "expectedYield": 1, "_id": 0}
+        ).limit(self.pending_size)
+        self.track({doc["keyword"]: doc.get("expectedYield") or 0 for doc in pending if doc.get("keyword")})
+        self._loaded = True
+        logger.info(f"Planner keyword: đã nạp {self.searched} keyword đã tìm, {len(self._mentions)} keyword chờ crawl")
+
+    def track(self, keywords: Dict[str, float]) -> None:
+        """Đếm tiếp số lần nhắc tới của keyword chờ crawl đã có trong database (seed, process trước)
+
+        Điểm đã lưu được dùng làm số lần đã nhắc tới.
+        """
+        with self._lock:
+            for keyword, score in keywords.items():
+                if keyword not in self._mentions:
+                    self._remember(keyword, int(score))
+
+    def note_results(self, keyword: str, usernames: Iterable[str]) -> None:
+        """Đếm ký tự đứng sau keyword trong username tìm được, dùng khi mở rộng keyword"""
+        size = len(keyword)
+        chars = Counter(
+            username[size].lower() for username in usernames
+            if len(username) > size and username[:size].lower() == keyword
+        )
+        with self._lock:
+            self._next_chars[keyword] = Counter({char: count for char, count in chars.items() if char in self.alphabet})
+
+    def record(self, keyword: str, found: int, new: int, saturated: bool) -> Dict[str, float]:
+        """Ghi kết quả tìm keyword, trả về các keyword mở rộng kèm điểm (nếu nên mở rộng)"""
+        with self._lock:
+            next_chars = self._next_chars.pop(keyword, None)
+            self._mentions.pop(keyword, None)
+            node = self._path(keyword, create=True)[-1]
+            if not node.searched:
+                self.searched += 1
+            node.searched = True
+            node.found, node.new, node.saturated = found, new, saturated
+            if not saturated or len(keyword) >= self.max_length or self._smoothed(new, found) < self.min_yield:
+                return {}
+            expansions = {
+                keyword + char: count / found
+                for char, count in sorted((next_chars or {}).items())
+                if keyword + char not in self._mentions and not self._searched(keyword + char)
+            }
+            for expansion in expansions:
+                self._remember(expansion)
+            return expansions
+
+    def is_covered(self, keyword: str) -> bool:
+        """Keyword có prefix đã tìm với kết quả đầy đủ (không bị cắt)"""
+        with self._lock:
+            return self._covered(keyword)
+
+    def plan(self, words: Iterable[str]) -> Dict[str, float]:
+        """Đếm số lần nhắc tới theo các từ trong tên profile, trả về keyword cần lưu kèm điểm
+
+        `words` gồm mỗi lần xuất hiện của một từ. Kết quả gồm từ mới (trừ từ
+        đã tìm hoặc có prefix đã lấy đủ kết quả) và các keyword chờ crawl là
+        prefix của một từ (kể cả từ bị bỏ qua), với điểm mới. Keyword đã đạt
+        `mention_cap` chỉ có trong kết quả sau mỗi `mention_refresh` lần được
+        nhắc tới (để cập nhật `mentionedAt`): điểm không đổi nên không cần ghi
+        lại mỗi lần.
+        """
+        planned: Dict[str, float] = {}
+        with self._lock:
+            for word in words:
+                if word not in self._mentions:
+                    if self._searched(word) or self._covered(word):
+                        self.skipped += 1
+                    else:
+                        self._remember(word)
+                for size in range(1, len(word) + 1):
+                    prefix = word[:size]
+                    mentions = self._mentions.get(prefix)
+                    if mentions is None:
+                        continue
+                    mentions += 1
+                    self._remember(prefix, mentions)
+                    if mentions <= self.mention_cap or mentions % self.mention_refresh == 0:
+                        planned[prefix] = float(min(mentions, self.mention_cap))
+        return planned
+
+    def observe(self, results: List[Tuple[str, int, int, bool]]) -> None:
+        """Callback của write buffer: ghi (keyword, found, new, saturated) và lưu keyword mở rộng
+
+        Chạy trong thread ghi của write buffer nên được gọi database trực tiếp.
+        """
+        expansions: Dict[str, float] = {}
+        for keyword, found, new, saturated in results:
+            expansions.update(self.record(keyword, found, new, saturated))
+        if expansions:
+            inserted = save_keywords(expansions, expansions)
+            self.expanded += inserted
+            logger.info(f"Planner keyword: mở rộng thêm {inserted} keyword từ prefix bị cắt kết quả")
+
+
+class FrontierLease(WorkLease):
+    """Claim keyword chưa crawl, `expectedYield` cao trước, cùng điểm thì lâu không được nhắc tới trước
+
+    Keyword lưu từ trước khi có planner (chưa có `expectedYield`) xếp sau cùng
+    theo `_id`.
+    """
+
+    order = [("expectedYield", -1), ("mentionedAt", 1), ("_id", 1)]
+
+
+keyword_planner = KeywordPlanner()
@@ -0,0 +1,335 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.config import Config
+from utils.logger import setup_logger
+
+# Cấu hình logger
+logger = setup_logger(__name__)
+
+# Tên metric theo chuẩn Prometheus
+STAGE_SECONDS = "crawler_stage_seconds"
+STAGE_ERRORS = "crawler_stage_errors_total"
+PROGRESS = "crawler_progress_total"
+
+Labels = Tuple[Tuple[str, str], ...]
+MetricKey = Tuple[str, Labels]
+
+
+class Histogram:
+    """Histogram với bucket cố định: một lần observe chỉ là bisect và vài phép cộng"""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # Phần tử cuối đếm giá trị lớn hơn bucket cuối (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class _Timer:
+    """Đo thời gian một stage, lỗi trong stage được đếm riêng"""
+
+    __slots__ = ("registry", "histogram", "key", "started")
+
+    def __init__(self, registry: "MetricsRegistry", histogram: Histogram, key: MetricKey):
+        self.registry = registry
+        self.histogram = histogram
+        self.key = key
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.histogram.observe(time.perf_counter() - self.started)
+        if exc_type is not None:
+            self.registry.inc(STAGE_ERRORS, _labels=self.key[1])
+
+
+class MetricsRegistry:
+    """Counter và histogram của một process, gom về supervisor qua `snapshot()`
+
+    Metric được tạo lần đầu khi dùng và tra bằng dict theo (tên, label), nên
+    timer đủ rẻ để luôn bật khi chạy thật. Dùng được từ event loop lẫn
+    thread (upload SFTP, ghi MongoDB).
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = Config.METRICS_CONFIG["buckets"]):
+        self.buckets = tuple(buckets)
+        self._histograms: Dict[MetricKey, Histogram] = {}
+        self._counters: Dict[MetricKey, float] = {}
+        # (stage, worker) -> key và histogram, tránh dựng lại label mỗi lần đo
+        self._stages: Dict[Tuple[str, Any], Tuple[MetricKey, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> MetricKey:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def _histogram(self, key: MetricKey) -> Histogram:
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(self.buckets))
+        return histogram
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        return self._histogram(self._key(name, labels))
+
+    def inc(self, name: str, value: float = 1, _labels: Labels = (), **labels) -> None:
+        key = (name, _labels) if _labels else self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def timer(self, stage: str, worker: Any = "-", **labels) -> _Timer:
+        """Context manager đo thời gian `stage` của `worker` (dùng được trong code async)"""
+        if labels:
+            key = self._key(STAGE_SECONDS, dict(labels, stage=stage, worker=worker))
+            return _Timer(self, self._histogram(key), key)
+        cached = self._stages.get((stage, worker))
+        if cached is None:
+            key = self._key(STAGE_SECONDS, {"stage": stage, "worker": worker})
+            cached = self._stages[(stage, worker)] = (key, self._histogram(key))
+        return _Timer(self, cached[1], cached[0])
+
+    def snapshot(self, **extra_labels) -> Dict[str, Dict[MetricKey, Any]]:
+        """Bản sao giá trị hiện tại (pickle được), thêm `extra_labels` vào mọi metric"""
+        extra = tuple(sorted((key, str(value)) for key, value in extra_labels.items()))
+
+        def relabel(key: MetricKey) -> MetricKey:
+            return (key[0], tuple(sorted(key[1] + extra))) if extra else key
+
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+        return {
+            "histograms": {relabel(key): histogram.snapshot() for key, histogram in histograms},
+            "counters": {relabel(key): value for key, value in counters},
+        }
+
+
+# Registry của process hiện tại
+metrics = MetricsRegistry()
+
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Dict[MetricKey, Any]]]) -> Dict[str, Dict[MetricKey, Any]]:
+    """Cộng dồn snapshot của nhiều process"""
+    histograms: Dict[MetricKey, Tuple[List[int], float, int]] = {}
+    counters: Dict[MetricKey, float] = {}
+    for snapshot in snapshots:
+        for key, (counts, total, count) in snapshot.get("histograms", {}).items():
+            if key in histograms:
+                old_counts, old_total, old_count = histograms[key]
+                counts = [a + b for a, b in zip(old_counts, counts)]
+                total, count = old_total + total, old_count + count
+            histograms[key] = (list(counts), total, count)
+        for key, value in snapshot.get("counters", {}).items():
+            counters[key] = counters.get(key, 0) + value
+    return {"histograms": histograms, "counters": counters}
+
+
+def add_progress(snapshot: Dict[str, Dict[MetricKey, Any]], progress: Dict[str, int]) -> Dict[str, Dict[MetricKey, Any]]:
+    """Thêm tiến độ crawl (crawl_stats) vào snapshot dưới dạng counter"""
+    counters = dict(snapshot.get("counters", {}))
+    for kind, value in progress.items():
+        counters[(PROGRESS, (("kind", kind),))] = value
+    return {"histograms": snapshot.get("histograms", {}), "counters": counters}
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (
+        key + '="' + value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') + '"'
+        for key, value in items
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus(snapshot: Dict[str, Dict[MetricKey, Any]],
+                      buckets: Tuple[float, ...] = Config.METRICS_CONFIG["buckets"]) -> str:
+    """Định dạng text exposition của Prometheus"""
+    lines: List[str] = []
+    typed = set()
+    for (name, labels), (counts, total, count) in sorted(snapshot.get("histograms", {}).items()):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(buckets, counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(labels, ('le', repr(float(bound))))} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    for (name, labels), value in sorted(snapshot.get("counters", {}).items()):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def quantile(counts: List[int], q: float, buckets: Tuple[float, ...] = Config.METRICS_CONFIG["buckets"]) -> float:
+    """Ước lượng phân vị từ bucket (nội suy tuyến tính như histogram_quantile)"""
+    total = sum(counts)
+    if not total:
+        return 0.0
+    rank = q * total
+    seen = 0
+    for index, count in enumerate(counts):
+        if seen + count >= rank and count:
+            if index >= len(buckets):
+                return buckets[-1]
+            lower = buckets[index - 1] if index else 0.0
+            return lower + (buckets[index] - lower) * (rank - seen) / count
+        seen += count
+    return buckets[-1]
+
+
+def summarize(snapshot: Dict[str, Dict[MetricKey, Any]],
+              previous: Optional[Dict[str, Dict[MetricKey, Any]]] = None,
+              interval: float = 0.0) -> List[str]:
+    """Tóm tắt theo stage (gộp mọi worker): số lần, tốc độ, p50/p99, số lỗi"""
+    def by_stage(data: Optional[Dict[str, Dict[MetricKey, Any]]]) -> Dict[str, List[int]]:
+        stages: Dict[str, List[int]] = {}
+        for (name, labels), (counts, _, _) in (data or {}).get("histograms", {}).items():
+            if name != STAGE_SECONDS:
+                continue
+            stage = dict(labels).get("stage", "-")
+            merged = stages.setdefault(stage, [0] * len(counts))
+            for i, count in enumerate(counts):
+                merged[i] += count
+        return stages
+
+    errors: Dict[str, float] = {}
+    for (name, labels), value in snapshot.get("counters", {}).items():
+        if name == STAGE_ERRORS:
+            stage = dict(labels).get("stage", "-")
+            errors[stage] = errors.get(stage, 0) + value
+
+    current, before = by_stage(snapshot), by_stage(previous)
+    lines = []
+    for stage, counts in sorted(current.items()):
+        total = sum(counts)
+        recent = total - sum(before.get(stage, []))
+        rate = f", {recent / interval:.1f}/s" if interval > 0 else ""
+        lines.append(
+            f"{stage}: {total} lần{rate}, p50 {quantile(counts, 0.5):.3f}s, "
+            f"p99 {quantile(counts, 0.99):.3f}s, {int(errors.get(stage, 0))} lỗi"
+        )
+    return lines
+
+
+class MetricsExporter:
+    """Phục vụ `/metrics` trên HTTP local và log tóm tắt định kỳ (chạy trong thread)
+
+    `collect` trả về snapshot cần xuất: registry của process hiện tại, hoặc
+    snapshot gộp từ các process con khi chạy với supervisor.
+    """
+
+    def __init__(
+        self,
+        collect: Callable[[], Dict[str, Dict[MetricKey, Any]]],
+        host: str = Config.METRICS_CONFIG["host"],
+        port: int = Config.METRICS_CONFIG["port"],
+        summary_interval: float = Config.METRICS_CONFIG["summary_interval"],
+    ):
+        self.collect = collect
+        self.host = host
+        self.port = port
+        self.summary_interval = summary_interval
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._stopped = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self) -> None:
+        if self.port:
+            try:
+                self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+            except OSError as e:
+                logger.warning(f"Không mở được endpoint metrics {self.host}:{self.port}: {e}")
+            else:
+                self._server.daemon_threads = True
+                self._spawn(self._server.serve_forever, "metrics-http")
+                logger.info(f"Metrics Prometheus tại http://{self.host}:{self._server.server_port}/metrics")
+        if self.summary_interval > 0:
+            self._spawn(self._summarize_forever, "metrics-summary")
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+        self.log_summary()
+
+    def log_summary(self, previous=None, interval: float = 0.0):
+        """Log tóm tắt metric hiện tại, trả về snapshot đã dùng"""
+        try:
+            snapshot = self.collect()
+        except Exception as e:
+            logger.error(f"Lỗi khi lấy metrics: {e}")
+            return previous
+        for line in summarize(snapshot, previous, interval):
+            logger.info(f"Metrics {line}")
+        return snapshot
+
+    def _spawn(self, target: Callable[[], None], name: str) -> None:
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _summarize_forever(self) -> None:
+        previous = None
+        while not self._stopped.wait(self.summary_interval):
+            previous = self.log_summary(previous, self.summary_interval)
+
+    def _handler(self):
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = render_prometheus(exporter.collect()).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
@@ -1,225 +1,147 @@
 import asyncio
 import random
-import requests
-from urllib.parse import urlparse
-from playwright.async_api import async_playwright
-import os
 import json
-from typing import List, Set, Optional, Tuple
-from datetime import datetime
-import paramiko
-from io import BytesIO
-
-from database import *
-from models.username_entity import UsernameEntity
-from models.keyword_entity import KeywordEntity
+from collections import Counter
+from typing import Callable, Dict, List, Set, Optional, Tuple
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from modules.metrics import metrics
 from models.profile_entity import ProfileEntity
+from modules.avatar_pipeline import AvatarPipeline
+from modules.browser_pool import BrowserPool, LazyLease
+from modules.keyword_manager import save_keywords
+from modules.keyword_planner import keyword_planner
+from modules.profile_fetcher import ProfileHttpError, ProfileHttpFetcher
+from modules.rate_control import AdaptiveLimiter
+from modules.scheduler import profile_schedule
+from modules.search_fetcher import SearchHttpError, SearchHttpFetcher
+from modules.write_buffer import WriteBuffer
 from utils.logger import setup_logger
 from utils.config import Config
 
 # Cấu hình logger
 logger = setup_logger(__name__)
 
+# Response XHR chứa kết quả tìm kiếm khi cuộn trang
+SEARCH_RESOURCE_PATH = "/resource/BaseSearchResource/get/"
+# Bookmark Pinterest trả về khi không còn trang tiếp theo
+SEARCH_END_BOOKMARK = "-end-"
+# Trang đầu không có bookmark (chỉ lấy được từ DOM), vẫn cuộn để lấy tiếp
+SEARCH_UNKNOWN_BOOKMARK = "?"
 
-class PinterestCrawler:
-    """Lớp chính để thực hiện các thao tác crawl dữ liệu từ Pinterest"""
+# Loại lỗi khi lấy profile, quyết định số lần thử lại (Config.RETRY_CONFIG)
+FAILURE_TIMEOUT = "timeout"
+FAILURE_NO_PROPS = "no_props"
+FAILURE_PARSE = "parse_error"
+FAILURE_ERROR = "error"
+FAILURE_THROTTLED = "throttled"
 
-    def __init__(self):
-        self.browser = None
-        self.context = None
-        self.playwright = None
 
-    async def __aenter__(self):
-        """Khởi tạo browser và context khi sử dụng with statement"""
-        self.playwright, self.browser, self.context = (
-            await self._create_browser_context()
-        )
-        return self
+class ProfileFetchError(Exception):
+    """Không lấy được profile, kèm loại lỗi"""
 
-    async def __aexit__(self, exc_type, exc_val, exc_tb):
-        """Đóng browser và context khi thoát with statement"""
-        if self.browser:
-            await self.browser.close()
-        if self.playwright:
-            await self.playwright.stop()
+    def __init__(self, category: str, message: str = ""):
+        super().__init__(message or category)
+        self.category = category
 
-    @staticmethod
-    async def _create_browser_context() -> Tuple:
-        """Tạo và trả về browser và context được cấu hình sẵn"""
-        p = await async_playwright().start()
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(
-            user_agent=Config.CRAWLER_CONFIG["user_agent"],
-            viewport=Config.CRAWLER_CONFIG["viewport"],
-            locale=Config.CRAWLER_CONFIG["locale"],
-        )
-        return p, browser, context
-
-    @staticmethod
-    def _get_real_avatar_url(avatar_url: str) -> Optional[str]:
-        """Kiểm tra và lấy URL avatar thực tế"""
-        if not avatar_url:
-            return None
-        try:
-            # Bỏ default avatar
-            # response = requests.get(
-            #     avatar_url, timeout=Config.CRAWLER_CONFIG["timeout"]
-            # )
-            # content_type = response.headers.get("Content-Type", "")
 
-            # if "svg" in content_type or "image/svg+xml" in content_type:
-            #     return None
+# Tiến độ crawl của process hiện tại (supervisor gom từ các process con)
+crawl_stats: Counter = Counter()
 
-            parsed = urlparse(avatar_url)
-            path_parts = parsed.path.split("/")
 
-            if "75x75_RS" in path_parts:
-                image_path = "/".join(path_parts[2:])
-                original_url = f"https://i.pinimg.com/originals/{image_path}"
-                r = requests.get(original_url, timeout=Config.CRAWLER_CONFIG["timeout"])
-                return original_url if r.status_code == 200 else avatar_url
-            return avatar_url
+class PinterestCrawler:
+    """Lớp chính để thực hiện các thao tác crawl dữ liệu từ Pinterest"""
 
-        except Exception as e:
-            logger.error(f"Lỗi kiểm tra avatar: {e}")
-            return None
+    def __init__(
+        self,
+        pool: BrowserPool,
+        writes: WriteBuffer,
+        page_concurrency: int = Config.CRAWLER_CONFIG["default_page_concurrency"],
+        fetcher: Optional[ProfileHttpFetcher] = None,
+        avatars: Optional[AvatarPipeline] = None,
+        search_fetcher: Optional[SearchHttpFetcher] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+        worker_id: str = "-",
+    ):
+        self.pool = pool
+        self.page_concurrency = max(1, page_concurrency)
+        self.fetcher = fetcher
+        self.avatars = avatars
+        self.search_fetcher = search_fetcher
+        # Giới hạn concurrency/tốc độ request tới Pinterest, dùng chung trong process
+        self.limiter = limiter or AdaptiveLimiter()
+        # Write buffer dùng chung giữa các worker, CrawlerManager flush khi kết thúc
+        self.writes = writes
+        # Callback báo có keyword mới cho queue đang chạy
+        self.on_new_keywords: Optional[Callable[[], None]] = None
+        # Label worker của metric thời gian theo stage
+        self.worker_id = worker_id
+        # Username của batch đang crawl chưa được đưa vào write buffer (trả lease khi bị hủy)
+        self.unfinished: Set[str] = set()
 
     @staticmethod
-    def _download_avatar(image_url: str, username: str) -> Optional[str]:
-        """Tải avatar về local hoặc remote server tùy theo môi trường"""
-        try:
-            # Lấy đường dẫn gốc
-            base_path = Config.get_avatar_path(username)
-            base_dir = os.path.dirname(base_path)
-            base_filename = os.path.basename(base_path)
-
-            # Kiểm tra môi trường
-            is_docker = os.path.exists("/.dockerenv")
-
-            if is_docker:
-                # Cấu hình SFTP
-                sftp_host = "192.168.161.230"
-                sftp_username = os.environ.get("SFTP_USERNAME", "htsc")
-                sftp_password = os.environ.get("SFTP_PASSWORD", "Htsc@123")
-                remote_base_path = "/mnt/data/pinterest/avatars"
-
-                # Tạo thư mục theo ngày
-                today = datetime.now().strftime("%Y-%m-%d")
-                remote_dir = f"{remote_base_path}/{today}"
-
-                # Tạo thư mục trên remote server
-                def get_next_remote_folder():
-                    folder = remote_dir
-                    suffix = 1
-                    while True:
-                        try:
-                            with paramiko.SSHClient() as ssh:
-                                ssh.set_missing_host_key_policy(
-                                    paramiko.AutoAddPolicy()
-                                )
-                                ssh.connect(
-                                    sftp_host,
-                                    username=sftp_username,
-                                    password=sftp_password,
-                                )
-                                with ssh.open_sftp() as sftp:
-                                    try:
-                                        sftp.stat(folder)
-                                        # Đếm số file trong thư mục
-                                        file_count = len(sftp.listdir(folder))
-                                        if file_count < 5000:
-                                            return folder
-                                    except FileNotFoundError:
-                                        sftp.mkdir(folder)
-                                        return folder
-
-                                # Tạo thư mục mới với suffix
-                                suffix += 1
-                                folder = f"{remote_dir}_{suffix}"
-                        except Exception as e:
-                            logger.error(f"Lỗi khi tạo thư mục remote: {e}")
-                            return None
-
-                # Lấy thư mục phù hợp
-                target_dir = get_next_remote_folder()
-                if not target_dir:
-                    return None
-
-                remote_path = f"{target_dir}/{base_filename}"
-
-                # Tải ảnh và upload qua SFTP
-                response = requests.get(
-                    image_url, timeout=Config.CRAWLER_CONFIG["timeout"]
-                )
-                if response.status_code == 200:
-                    with paramiko.SSHClient() as ssh:
-                        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                        ssh.connect(
-                            sftp_host, username=sftp_username, password=sftp_password
-                        )
-                        with ssh.open_sftp() as sftp:
-                            with BytesIO(response.content) as file_obj:
-                                sftp.putfo(file_obj, remote_path)
-                    logger.info(f"Ảnh avatar đã lưu remote: {remote_path}")
-                    return remote_path
-                return None
-            else:
-                # Xử lý local như cũ
-                def get_next_folder():
-                    folder = base_dir
-                    suffix = 1
-                    while True:
-                        if not os.path.exists(folder):
-                            os.makedirs(folder)
-                            return folder
-
-                        file_count = len(
-                            [
-                                f
-                                for f in os.listdir(folder)
-                                if os.path.isfile(os.path.join(folder, f))
-                            ]
-                        )
-                        if file_count < 5000:
-                            return folder
-
-                        suffix += 1
-                        folder = f"{base_dir}_{suffix}"
+    def _parse_profile_data(data: dict, username: str) -> Optional[ProfileEntity]:
+        """Lấy thông tin profile từ JSON __PWS_INITIAL_PROPS__"""
+        user_resources = (
+            data.get("initialReduxState", {})
+            .get("resources", {})
+            .get("UserResource", {})
+        )
+        user_resource_key = f'[["field_set_key","unauth_profile"],["is_mobile_fork",true],["username","{username}"]]'
+        user_data = user_resources.get(user_resource_key, {}).get("data") or {}
+        if not user_data:
+            # Key có thể khác nhau giữa bản mobile/desktop, tìm theo username
+            for resource in user_resources.values():
+                resource_data = (resource or {}).get("data") or {}
+                if str(resource_data.get("username", "")).lower() == username.lower():
+                    user_data = resource_data
+                    break
+        if not user_data:
+            return None
 
-                target_dir = get_next_folder()
-                filename = os.path.join(target_dir, base_filename)
+        avatar_url = user_data.get("image_xlarge_url", "")
+        username_real = user_data.get("username", "")
+
+        return ProfileEntity(
+            id_profile=user_data.get("id", ""),
+            username=username_real,
+            avatar_url=avatar_url or None,
+            bio=user_data.get("about", ""),
+            full_name=user_data.get("full_name", ""),
+            following=user_data.get("following_count", ""),
+            follower=user_data.get("follower_count", ""),
+            link=f"https://www.pinterest.com/{username}/",
+        )
 
-                response = requests.get(
-                    image_url, timeout=Config.CRAWLER_CONFIG["timeout"]
+    async def _extract_profile_data(self, page, username: str) -> ProfileEntity:
+        """Trích xuất thông tin profile từ trang Pinterest (ProfileFetchError nếu lỗi)"""
+        try:
+            self.pool.request_filter.track(page)
+            with metrics.timer("page_goto", self.worker_id):
+                await page.goto(
+                    Config.get_profile_url(username),
+                    wait_until="domcontentloaded",
+                    timeout=Config.CRAWLER_CONFIG["timeout"]
+                    * 1000,  # Chuyển đổi sang milliseconds
                 )
-
-                if response.status_code == 200:
-                    with open(filename, "wb") as f:
-                        f.write(response.content)
-                    logger.info(f"Ảnh avatar đã lưu local: {filename}")
-                    return filename
-                return None
-
+        except PlaywrightTimeoutError as e:
+            raise ProfileFetchError(FAILURE_TIMEOUT, f"Hết thời gian tải trang {username}") from e
         except Exception as e:
-            logger.error(f"Lỗi tải avatar cho {username}: {e}")
-            return None
+            raise ProfileFetchError(FAILURE_ERROR, f"Lỗi khi tải trang {username}: {e}") from e
 
-    async def _extract_profile_data(
-        self, page, username: str
-    ) -> Optional[ProfileEntity]:
-        """Trích xuất thông tin profile từ trang Pinterest"""
         try:
-            await page.goto(
-                f"https://www.pinterest.com/{username}/",
-                wait_until="domcontentloaded",
-                timeout=Config.CRAWLER_CONFIG["timeout"]
-                * 1000,  # Chuyển đổi sang milliseconds
-            )
-            await page.wait_for_function(
-                'document.querySelector("script#__PWS_INITIAL_PROPS__") !== null',
-                timeout=10000,
-            )
+            with metrics.timer("props_wait", self.worker_id):
+                await page.wait_for_function(
+                    'document.querySelector("script#__PWS_INITIAL_PROPS__") !== null',
+                    timeout=10000,
+                )
+        except PlaywrightTimeoutError as e:
+            raise ProfileFetchError(FAILURE_NO_PROPS, f"Không có __PWS_INITIAL_PROPS__ cho {username}") from e
 
+        try:
             data_script = await page.query_selector("script#__PWS_INITIAL_PROPS__")
             raw_json = await data_script.inner_text()
             data = json.loads(raw_json)
@@ -230,103 +152,149 @@ class PinterestCrawler:
             # await page.mouse.wheel(0, scroll_distance)
             # await asyncio.sleep(sleep_time)
 
-            user_resource_key = f'[["field_set_key","unauth_profile"],["is_mobile_fork",true],["username","{username}"]]'
-            user_data = (
-                data.get("initialReduxState", {})
-                .get("resources", {})
-                .get("UserResource", {})
-                .get(user_resource_key, {})
-                .get("data", {})
-            )
-
-            avatar_url = user_data.get("image_xlarge_url", "")
-            username_real = user_data.get("username", "")
-
-            return ProfileEntity(
-                id_profile=user_data.get("id", ""),
-                username=username_real,
-                avatar_url=self._get_real_avatar_url(avatar_url),
-                bio=user_data.get("about", ""),
-                full_name=user_data.get("full_name", ""),
-                following=user_data.get("following_count", ""),
-                follower=user_data.get("follower_count", ""),
-                link=f"https://www.pinterest.com/{username}/",
-            )
+            profile = self._parse_profile_data(data, username)
         except Exception as e:
-            logger.error(f"Lỗi khi crawl profile {username}: {e}")
-            return None
-
-    async def crawl_user_profile(self, list_usernames: List[dict]) -> None:
-        """Crawl thông tin profile từ danh sách username"""
-        async with self:
-            list_profile = []
-            avatar_download_queue = []
+            raise ProfileFetchError(FAILURE_PARSE, f"Lỗi đọc JSON profile {username}: {e}") from e
+        self.pool.request_filter.report(page, f"profile {username}")
+        if profile is None:
+            raise ProfileFetchError(FAILURE_PARSE, f"Không tìm thấy dữ liệu UserResource cho {username}")
+        return profile
+
+    async def _crawl_profile_page(
+        self, lease: LazyLease, semaphore: asyncio.Semaphore, username: str
+    ) -> ProfileEntity:
+        """Mở một page và crawl profile, giới hạn bởi semaphore và timeout
+
+        Context được mượn trước khi giữ semaphore và slot của limiter: pool
+        chờ khởi động lại browser (chờ mọi lease được trả) không được giữ
+        slot mà worker đang giữ lease cần để crawl xong batch.
+        """
+        context = await lease.get()
+        async with semaphore, self.limiter.request() as outcome:
+            page = await context.new_page()
+            try:
+                profile = await asyncio.wait_for(
+                    self._extract_profile_data(page, username),
+                    timeout=Config.CRAWLER_CONFIG["page_timeout"],
+                )
+                outcome.ok = True
+                return profile
+            except asyncio.TimeoutError as e:
+                raise ProfileFetchError(FAILURE_TIMEOUT, f"Hết thời gian crawl profile {username}") from e
+            finally:
+                await page.close()
 
-            for username in list_usernames:
-                page = await self.context.new_page()
-                try:
-                    profile = await self._extract_profile_data(
-                        page, username.get("username")
-                    )
-                    if profile:
-                        list_profile.append(profile)
-                        if profile.avatar_url:
-                            avatar_download_queue.append(
-                                {
-                                    "url": profile.avatar_url,
-                                    "username": profile.username
-                                    or username.get("username"),
-                                }
-                            )
-                        logger.info(
-                            f"Đã crawl xong profile: {username.get('username')}"
-                        )
-                finally:
-                    await page.close()
+    async def _fetch_profile(
+        self, lease: LazyLease, semaphore: asyncio.Semaphore, username: str
+    ) -> ProfileEntity:
+        """Lấy profile qua HTTP fast path, chỉ dùng browser khi fast path thất bại
 
-            if list_profile:
-                await self._process_profiles(list_profile, avatar_download_queue)
-
-    async def _process_profiles(
-        self, list_profile: List[ProfileEntity], avatar_download_queue: List[dict]
-    ) -> None:
-        """Xử lý và lưu thông tin profile"""
-        # Tải ảnh avatar
-        logger.info("Bắt đầu tải ảnh avatar...")
-        for item in avatar_download_queue:
+        HTTP 429/5xx (bị chặn tốc độ, server quá tải) không chuyển sang browser
+        mà báo lỗi `throttled` để queue hẹn thử lại với backoff. HTTP 404 là
+        profile không tồn tại: request vẫn tính là thành công với rate control.
+        """
+        if self.fetcher is not None:
             try:
-                relative_path = self._download_avatar(item["url"], item["username"])
-                if relative_path:
-                    for profile in list_profile:
-                        if profile.username == item["username"]:
-                            profile.avatar_url = relative_path
-                            break
+                async with self.limiter.request() as outcome:
+                    try:
+                        with metrics.timer("profile_http", self.worker_id):
+                            data = await self.fetcher.fetch_initial_props(username)
+                    except ProfileHttpError as e:
+                        outcome.ok = e.status == 404
+                        outcome.throttled = e.throttled
+                        raise
+                    profile = self._parse_profile_data(data, username) if data else None
+                    outcome.ok = profile is not None
+                if profile:
+                    return profile
+                logger.warning(
+                    f"Fast path không lấy được dữ liệu {username}, chuyển sang browser"
+                )
+            except ProfileHttpError as e:
+                if e.throttled:
+                    raise ProfileFetchError(FAILURE_THROTTLED, f"Pinterest trả HTTP {e.status} cho {username}") from e
+                if e.status == 404:
+                    raise ProfileFetchError(FAILURE_NO_PROPS, f"Profile {username} không tồn tại (HTTP 404)") from e
+                logger.warning(f"Fast path nhận HTTP {e.status} cho {username}, chuyển sang browser")
             except Exception as e:
-                logger.error(f"Lỗi khi tải ảnh cho {item['username']}: {e}")
-
-        # Lưu profile vào database
-        profile_collection.insert_many([entity.to_dict() for entity in list_profile])
-        logger.info(f"Đã lưu {len(list_profile)} profile vào MongoDB")
-
-        # Cập nhật trạng thái crawl
-        usernames_to_update = [profile.username for profile in list_profile]
-        usernames_collection.update_many(
-            {"username": {"$in": usernames_to_update}}, {"$set": {"isCrawl": True}}
-        )
-        logger.info(
-            f"Đã cập nhật trạng thái crawl cho {len(usernames_to_update)} username"
-        )
+                logger.warning(
+                    f"Fast path lỗi với {username}: {e}, chuyển sang browser"
+                )
+        return await self._crawl_profile_page(lease, semaphore, username)
+
+    async def crawl_user_profile(self, list_usernames: List[dict]) -> Dict[str, str]:
+        """Crawl thông tin profile từ danh sách username
+
+        Mỗi profile được đưa vào write buffer ngay khi lấy xong thay vì chờ cả
+        batch, nên process bị dừng giữa batch không mất các profile đã crawl.
+        Trả về username không crawl được cùng loại lỗi để queue hẹn thử lại.
+        """
+        list_profile = []
+        failures: Dict[str, str] = {}
+        # Document username đã claim (chứa lịch crawl lần trước)
+        claimed = {item.get("username"): item for item in list_usernames}
+        self.unfinished = set(claimed)
+
+        async def fetch(lease: LazyLease, semaphore: asyncio.Semaphore, username: str) -> ProfileEntity:
+            profile = await self._fetch_profile(lease, semaphore, username)
+            list_profile.append(profile)
+            # `_save_profile` đưa profile vào write buffer trước lần await đầu tiên
+            self.unfinished.discard(username)
+            await self._save_profile(username, profile, claimed.get(username))
+            return profile
 
-        # Xử lý và lưu keywords mới
-        self._process_keywords(list_profile)
+        try:
+            # Context chỉ được mượn từ pool khi có username cần fallback sang browser
+            async with LazyLease(self.pool) as lease:
+                # Mở tối đa page_concurrency page song song, kết quả giữ đúng thứ tự
+                semaphore = asyncio.Semaphore(self.page_concurrency)
+                profiles = await asyncio.gather(
+                    *[fetch(lease, semaphore, username.get("username")) for username in list_usernames],
+                    return_exceptions=True,
+                )
+        finally:
+            # Keyword lấy từ các profile đã crawl, kể cả khi batch bị hủy giữa chừng
+            if list_profile:
+                await self._process_keywords(list_profile)
+
+        for username, profile in zip(list_usernames, profiles):
+            if isinstance(profile, ProfileEntity):
+                logger.info(f"Đã crawl xong profile: {username.get('username')}")
+                continue
+            if isinstance(profile, asyncio.CancelledError):
+                raise profile
+            category = profile.category if isinstance(profile, ProfileFetchError) else FAILURE_ERROR
+            failures[username.get("username")] = category
+            logger.error(f"Lỗi khi crawl profile {username.get('username')} ({category}): {profile}")
+        return failures
+
+    async def _save_profile(self, username: str, profile: ProfileEntity, claimed: Optional[dict] = None) -> None:
+        """Ghi một profile qua write buffer và đưa avatar sang stage tải ảnh
+
+        Mọi lệnh ghi theo `username` đã claim, không theo username trong JSON
+        của Pinterest (khớp không phân biệt hoa thường, có thể khác chữ hoa).
+        `claimed` là document username đã claim (chứa lịch crawl lần trước),
+        dùng để phát hiện profile thay đổi và tính lịch crawl lại.
+        """
+        # avatar_url là URL gốc, được cập nhật sau khi tải ảnh
+        now = datetime.now(timezone.utc)
+        data = dict(profile.to_dict(), username=username)
+        self.writes.upsert_profile(dict(data, lastCrawledAt=now))
+        self.writes.mark_username_crawled(username, profile_schedule(data, claimed, now))
+        crawl_stats["profiles"] += 1
+
+        # Không chờ tải xong avatar
+        if self.avatars is not None and profile.avatar_url:
+            await self.avatars.submit(username, profile.avatar_url)
 
     def is_standard_alpha(self, word: str) -> bool:
         """Chỉ cho phép ký tự chữ và số trong bảng mã Latin cơ bản"""
         return all(c.isalnum() and c.isascii() for c in word)
 
-    def _process_keywords(self, list_profile: List[ProfileEntity]) -> None:
-        """Xử lý và lưu keywords từ fullname"""
-        new_keywords = set()
+    async def _process_keywords(self, list_profile: List[ProfileEntity]) -> None:
+        """Xử lý và lưu keywords từ fullname (lệnh ghi database chạy trong thread)"""
+        # Mỗi lần xuất hiện của một từ (planner đếm số lần được nhắc tới)
+        name_keywords = []
         for profile in list_profile:
             if profile.full_name:
                 name_parts = profile.full_name.split()
@@ -334,84 +302,241 @@ class PinterestCrawler:
                     keyword = name_part.lower()
                     if not self.is_standard_alpha(keyword):
                         continue  # Bỏ qua từ chứa ký tự đặc biệt hoặc non-standard
-                    existing_keyword = keywords_collection.find_one({"keyword": keyword})
-                    if not existing_keyword:
-                        new_keywords.add(keyword)
-
-        if new_keywords:
-            keyword_entities = [
-                KeywordEntity(
-                    keyword=keyword,
-                    isCrawl=False,
-                    crawlDate=None,
+                    name_keywords.append(keyword)
+
+        if keyword_planner.enabled:
+            # Bỏ qua keyword đã tìm hoặc có prefix đã lấy đủ kết quả, chỉ lưu keyword có điểm
+            # (số lần được nhắc tới) thay đổi
+            skipped = keyword_planner.skipped
+            planned = keyword_planner.plan(name_keywords)
+            crawl_stats["skipped_keywords"] += keyword_planner.skipped - skipped
+            inserted = await asyncio.to_thread(save_keywords, planned, planned)
+        else:
+            inserted = await asyncio.to_thread(save_keywords, name_keywords)
+        if inserted:
+            logger.info(f"Đã lưu thêm {inserted} keyword mới")
+            crawl_stats["new_keywords"] += inserted
+            if self.on_new_keywords is not None:
+                self.on_new_keywords()
+
+    @staticmethod
+    def _parse_search_resource(resource: dict) -> Tuple[Set[str], Optional[str]]:
+        """Lấy username và bookmark trang tiếp theo từ kết quả BaseSearchResource
+
+        Nhận cả response XHR (`resource_response`) lẫn resource trong
+        `initialReduxState` của trang đầu. Bookmark là None khi hết kết quả.
+        """
+        response = resource.get("resource_response", resource)
+        data = response.get("data") or {}
+        results = data.get("results", []) if isinstance(data, dict) else data
+        usernames = {
+            item["username"]
+            for item in results or []
+            if isinstance(item, dict) and item.get("username") and item.get("type", "user") == "user"
+        }
+
+        bookmark = response.get("bookmark") or response.get("nextBookmark")
+        if not bookmark:
+            bookmarks = (resource.get("resource") or {}).get("options", {}).get("bookmarks") or []
+            bookmark = bookmarks[0] if bookmarks else None
+        if bookmark == SEARCH_END_BOOKMARK:
+            bookmark = None
+        return usernames, bookmark
+
+    async def _initial_search_results(self, page) -> Tuple[Set[str], Optional[str]]:
+        """Username của trang đầu (render sẵn trong HTML, không qua XHR)"""
+        usernames: Set[str] = set()
+        bookmark: Optional[str] = None
+        data_script = await page.query_selector("script#__PWS_INITIAL_PROPS__")
+        if data_script is not None:
+            try:
+                data = json.loads(await data_script.inner_text())
+                search_resources = (
+                    data.get("initialReduxState", {})
+                    .get("resources", {})
+                    .get("BaseSearchResource", {})
                 )
-                for keyword in new_keywords
-            ]
-            keywords_collection.insert_many(
-                [entity.to_dict() for entity in keyword_entities]
-            )
-            logger.info(f"Đã lưu thêm {len(keyword_entities)} keyword mới")
+                for resource in search_resources.values():
+                    resource_usernames, resource_bookmark = self._parse_search_resource(resource or {})
+                    usernames |= resource_usernames
+                    bookmark = bookmark or resource_bookmark
+            except ValueError as e:
+                logger.warning(f"Không đọc được __PWS_INITIAL_PROPS__ của trang tìm kiếm: {e}")
+
+        if not usernames:
+            # Không có dữ liệu search trong props, lấy từ DOM và cuộn tiếp
+            elements = await page.query_selector_all('[data-test-id="user-rep"] a[href]')
+            for el in elements:
+                href = await el.get_attribute("href")
+                if href and href.startswith("/") and len(href.strip("/").split("/")) == 1:
+                    usernames.add(href.strip("/"))
+            bookmark = SEARCH_UNKNOWN_BOOKMARK
+        return usernames, bookmark
 
     async def crawl_usernames(self, keyword: str) -> None:
-        """Crawl danh sách username từ keyword"""
-        async with self:
-            page = await self.context.new_page()
+        """Crawl danh sách username từ keyword
+
+        Dùng search API qua HTTP nếu có `search_fetcher`, chỉ mở browser khi
+        trang đầu của search API lỗi.
+        """
+        if keyword_planner.enabled and keyword_planner.is_covered(keyword):
+            # Keyword lưu trước khi prefix của nó được tìm với kết quả đầy đủ: không cần tìm
+            crawl_stats["skipped_keywords"] += 1
+            self._save_usernames(set(), keyword)
+            logger.info(f"Bỏ qua keyword {keyword}: prefix đã lấy đủ kết quả")
+            return
+
+        result = None
+        if self.search_fetcher is not None:
+            result = await self._search_usernames_http(keyword)
+        if result is None:
+            result = await self._search_usernames_browser(keyword)
+
+        usernames_data, saturated = result
+        self._save_usernames(usernames_data, keyword, saturated)
+
+    async def _search_usernames_http(self, keyword: str) -> Optional[Tuple[Set[str], bool]]:
+        """Đi theo bookmark của search API, dừng khi hết trang hoặc không có username mới
+
+        Trả về (username, kết quả bị cắt: vẫn còn bookmark khi dừng), None nếu
+        trang đầu lỗi để chuyển sang browser. Dừng vì trang sau lỗi, vì
+        `max_scrolls` hay vì một trang không có username mới đều là bị cắt:
+        keyword chỉ được coi là đã lấy đủ kết quả khi Pinterest hết bookmark.
+
+        HTTP 429/5xx ở trang đầu không chuyển sang browser (browser cũng bị
+        chặn) mà báo lỗi: keyword giữ lease và được claim lại khi lease hết hạn.
+        """
+        usernames_data: Set[str] = set()
+        bookmark: Optional[str] = None
+        pages = 0
+        while pages <= Config.CRAWLER_CONFIG["max_scrolls"]:
+            try:
+                async with self.limiter.request() as outcome:
+                    try:
+                        with metrics.timer("search_api", self.worker_id):
+                            payload = await self.search_fetcher.fetch_search_page(keyword, bookmark)
+                    except SearchHttpError as e:
+                        outcome.throttled = e.throttled
+                        raise
+                    outcome.ok = payload is not None
+            except SearchHttpError as e:
+                if e.throttled and pages == 0:
+                    raise
+                payload = None
+            except Exception as e:
+                logger.warning(f"Search API lỗi với keyword {keyword}: {e}")
+                payload = None
+            if payload is None:
+                if pages == 0:
+                    logger.warning(f"Search API không dùng được cho keyword {keyword}, chuyển sang browser")
+                    return None
+                break
+
+            pages += 1
+            usernames, bookmark = self._parse_search_resource(payload)
+            new_usernames = usernames - usernames_data
+            usernames_data |= new_usernames
+            if not new_usernames or not bookmark:
+                break
+
+        logger.info(f"Keyword {keyword}: {len(usernames_data)} username qua search API ({pages} trang)")
+        return usernames_data, bool(bookmark)
+
+    async def _search_usernames_browser(self, keyword: str) -> Tuple[Set[str], bool]:
+        """Tìm username bằng browser, cuộn trang kết quả
+
+        Username được lấy từ response JSON BaseSearchResource mỗi lần cuộn,
+        dừng ngay khi một trang không có username mới, hết bookmark hoặc không
+        có response nào sau `search_response_timeout` giây, thay vì luôn cuộn
+        đủ `max_scrolls` lần. Kết quả bị cắt khi vẫn còn bookmark lúc dừng.
+
+        Lần mở trang và mỗi lần cuộn đều giữ một slot của limiter như các
+        request khác: hết thời gian hoặc không có username là lỗi, HTTP
+        429/5xx (trang hoặc XHR) là bị throttle. Trang đầu bị throttle thì
+        báo lỗi (SearchHttpError) thay vì lưu keyword không có kết quả.
+        """
+        async with self.pool.lease() as context:
+            page = await context.new_page()
+            responses: asyncio.Queue = asyncio.Queue()
+
+            async def on_response(response) -> None:
+                if SEARCH_RESOURCE_PATH not in response.url:
+                    return
+                if response.status != 200:
+                    if ProfileHttpError(response.status).throttled:
+                        # Báo lần cuộn đang chờ là bị throttle
+                        responses.put_nowait(None)
+                    return
+                try:
+                    responses.put_nowait(await response.json())
+                except Exception as e:
+                    logger.warning(f"Không đọc được response tìm kiếm của keyword {keyword}: {e}")
+
+            page.on("response", on_response)
             try:
                 logger.info(f"Tìm người dùng theo từ khóa: {keyword}")
-                usernames_data = set()
-                search_url = f"https://www.pinterest.com/search/users/?q={keyword.replace(' ', '%20')}"
-                await page.goto(search_url)
-                await asyncio.sleep(3)
-
-                scroll_times = 75
-                for i in range(scroll_times):
-                    logger.info(f"Cuộn {i+1}/{scroll_times} keyword {keyword}...")
-                    await page.mouse.wheel(0, random.randint(800, 1200))
-                    await asyncio.sleep(random.uniform(1.5, 2.5))
-
-                elements = await page.query_selector_all(
-                    '[data-test-id="user-rep"] a[href]'
-                )
-                for el in elements:
-                    href = await el.get_attribute("href")
-                    if (
-                        href
-                        and href.startswith("/")
-                        and len(href.strip("/").split("/")) == 1
-                    ):
-                        usernames_data.add(href.strip("/"))
-
-                self._save_usernames(usernames_data, keyword)
-            finally:
-                await page.close()
+                search_url = f"{Config.PINTEREST_BASE_URL}/search/users/?q={quote(keyword)}"
+                self.pool.request_filter.track(page)
+                async with self.limiter.request() as outcome:
+                    with metrics.timer("page_goto", self.worker_id):
+                        response = await page.goto(
+                            search_url,
+                            wait_until="domcontentloaded",
+                            timeout=Config.CRAWLER_CONFIG["timeout"] * 1000,
+                        )
+                    outcome.throttled = response is not None and ProfileHttpError(response.status).throttled
+                    usernames_data, bookmark = await self._initial_search_results(page)
+                    outcome.ok = bool(usernames_data)
+                if outcome.throttled:
+                    # Như search API: keyword giữ lease và được claim lại khi lease hết hạn
+                    raise SearchHttpError(response.status)
+
+                scrolls = 0
+                while bookmark and scrolls < Config.CRAWLER_CONFIG["max_scrolls"]:
+                    scrolls += 1
+                    async with self.limiter.request() as outcome:
+                        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                        try:
+                            payload = await asyncio.wait_for(
+                                responses.get(), Config.CRAWLER_CONFIG["search_response_timeout"]
+                            )
+                        except asyncio.TimeoutError:
+                            payload = None
+                        else:
+                            outcome.throttled = payload is None
+                        if payload is not None:
+                            usernames, bookmark = self._parse_search_resource(payload)
+                            outcome.ok = bool(usernames)
+                    if payload is None:
+                        logger.info(f"Keyword {keyword}: không có kết quả mới sau lần cuộn {scrolls}")
+                        break
+
+                    new_usernames = usernames - usernames_data
+                    usernames_data |= new_usernames
+                    if not new_usernames:
+                        break
+                    await asyncio.sleep(random.uniform(*Config.CRAWLER_CONFIG["scroll_delay"]))
 
-    def _save_usernames(self, usernames_data: Set[str], keyword: str) -> None:
-        """Lưu danh sách username vào database"""
-        existing_usernames_cursor = usernames_collection.find(
-            {"username": {"$in": list(usernames_data)}}, {"username": 1}
-        )
-        existing_usernames = set(user["username"] for user in existing_usernames_cursor)
-        new_usernames = usernames_data - existing_usernames
-
-        if new_usernames:
-            username_entities = [
-                UsernameEntity(username=username, isCrawl=False)
-                for username in new_usernames
-            ]
-            usernames_collection.insert_many(
-                [entity.to_dict() for entity in username_entities]
-            )
-            logger.info(
-                f"Đã lưu {len(username_entities)} username mới với keyword {keyword}"
-            )
-
-            if len(usernames_data) > len(new_usernames):
                 logger.info(
-                    f"Có {len(usernames_data) - len(new_usernames)} username đã tồn tại trong database"
+                    f"Keyword {keyword}: {len(usernames_data)} username sau {scrolls} lần cuộn"
                 )
+                self.pool.request_filter.report(page, f"tìm kiếm {keyword}")
+                return usernames_data, bool(bookmark)
+            finally:
+                page.remove_listener("response", on_response)
+                await page.close()
 
-            keywords_collection.update_one(
-                {"keyword": keyword},
-                {"$set": {"isCrawl": True, "crawlDate": datetime.now()}},
-            )
-            logger.info(f"Đã cập nhật trạng thái crawl cho keyword: {keyword}")
+    def _save_usernames(self, usernames_data: Set[str], keyword: str, saturated: bool = False) -> None:
+        """Đưa username tìm được và trạng thái crawl của keyword vào write buffer
+
+        Username đã có được bỏ qua nhờ upsert `$setOnInsert`. Keyword được
+        đánh dấu đã crawl kể cả khi không có username mới, để không bị claim
+        lại sau khi hết lease.
+        """
+        for username in usernames_data:
+            self.writes.add_username(username, source=keyword)
+        if keyword_planner.enabled:
+            keyword_planner.note_results(keyword, usernames_data)
+        self.writes.mark_keyword_crawled(keyword, found=len(usernames_data), saturated=saturated)
+        logger.info(f"Keyword {keyword}: đưa {len(usernames_data)} username vào write buffer")
+        crawl_stats["keywords"] += 1
@@ -0,0 +1,116 @@
+import codecs
+import json
+from html.parser import HTMLParser
+from typing import Optional
+
+import aiohttp
+
+from utils.config import Config
+from utils.logger import setup_logger
+
+# Cấu hình logger
+logger = setup_logger(__name__)
+
+INITIAL_PROPS_ID = "__PWS_INITIAL_PROPS__"
+
+
+class ProfileHttpError(Exception):
+    """Trang profile trả HTTP khác 200"""
+
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+    @property
+    def throttled(self) -> bool:
+        """Pinterest chặn tốc độ (429) hoặc quá tải (5xx): browser cũng sẽ bị chặn, cần chờ rồi thử lại"""
+        return self.status == 429 or self.status >= 500
+
+
+class _InitialPropsParser(HTMLParser):
+    """Parser dạng streaming, chỉ giữ lại nội dung script#__PWS_INITIAL_PROPS__"""
+
+    def __init__(self):
+        super().__init__()
+        self._capturing = False
+        self._chunks = []
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "script" and dict(attrs).get("id") == INITIAL_PROPS_ID:
+            self._capturing = True
+
+    def handle_data(self, data):
+        if self._capturing:
+            self._chunks.append(data)
+
+    def handle_endtag(self, tag):
+        if self._capturing and tag == "script":
+            self._capturing = False
+            self.done = True
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+
+class ProfileHttpFetcher:
+    """Lấy JSON __PWS_INITIAL_PROPS__ của profile qua HTTP, không cần browser
+
+    Dùng chung một `aiohttp.ClientSession` (keep-alive, giới hạn kết nối)
+    cho mọi worker. HTML được đọc theo từng chunk và dừng ngay khi đọc xong
+    thẻ script cần thiết.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, max_connections: int = Config.HTTP_CONFIG["max_connections"]):
+        self.max_connections = max_connections
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def start(self) -> None:
+        """Tạo HTTP session dùng chung"""
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections, ttl_dns_cache=300
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers={
+                "User-Agent": Config.CRAWLER_CONFIG["user_agent"],
+                "Accept-Language": Config.CRAWLER_CONFIG["locale"],
+            },
+            timeout=aiohttp.ClientTimeout(total=Config.CRAWLER_CONFIG["timeout"]),
+        )
+
+    async def close(self) -> None:
+        """Đóng HTTP session"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def fetch_initial_props(self, username: str) -> Optional[dict]:
+        """Tải trang profile và trả về JSON initial props (None nếu không có)
+
+        HTTP khác 200 báo bằng `ProfileHttpError`.
+        """
+        parser = _InitialPropsParser()
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+        async with self._session.get(Config.get_profile_url(username)) as response:
+            if response.status != 200:
+                raise ProfileHttpError(response.status)
+            async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+                parser.feed(decoder.decode(chunk))
+                if parser.done:
+                    break
+
+        if not parser.done:
+            return None
+        return json.loads(parser.text)
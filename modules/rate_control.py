@@ -0,0 +1,174 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Tuple
+
+from modules.supervisor import process_rss_mb
+from utils.config import Config
+from utils.logger import setup_logger
+
+# Cấu hình logger
+logger = setup_logger(__name__)
+
+
+class TokenBucket:
+    """Giới hạn số request mỗi giây, cho phép dồn tối đa `burst` request"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    async def take(self) -> None:
+        """Chờ tới khi có token (không chờ nếu rate <= 0)"""
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def share_rate(processes: int) -> None:
+    """Chia tốc độ và burst của token bucket (giới hạn của cả container) cho `processes` process
+
+    Gọi trong process con trước khi tạo `AdaptiveLimiter`.
+    """
+    Config.RATE_CONFIG["requests_per_second"] /= processes
+    Config.RATE_CONFIG["burst"] = max(1, Config.RATE_CONFIG["burst"] // processes)
+
+
+class RequestOutcome:
+    """Kết quả một request, người gọi đặt `ok = True` khi lấy được dữ liệu
+
+    `throttled = True` khi Pinterest chặn tốc độ hoặc quá tải (HTTP 429/5xx).
+    """
+
+    __slots__ = ("ok", "throttled")
+
+    def __init__(self):
+        self.ok = False
+        self.throttled = False
+
+
+class AdaptiveLimiter:
+    """Điều chỉnh số request đồng thời tới Pinterest theo kiểu AIMD
+
+    Sau mỗi cửa sổ `window_seconds`, nếu có request bị throttle (HTTP
+    429/5xx), tỉ lệ lỗi (timeout, thiếu `__PWS_INITIAL_PROPS__`), p90
+    latency hoặc RSS của process (gồm Chromium) vượt ngưỡng thì giới hạn bị
+    nhân với `decrease_factor`;
+    nếu ổn định và vẫn có request phải chờ slot thì tăng thêm
+    `increase_step`. Mọi request còn đi qua một token bucket chung, nên tốc
+    độ không vượt `requests_per_second` dù concurrency cao. Bucket chỉ dùng
+    chung trong một process: process con của Supervisor nhận phần tốc độ
+    và burst của mình (`share_rate`).
+    """
+
+    def __init__(
+        self,
+        initial: int = Config.RATE_CONFIG["initial_concurrency"],
+        minimum: int = Config.RATE_CONFIG["min_concurrency"],
+        maximum: int = Config.RATE_CONFIG["max_concurrency"],
+        rate: Optional[float] = None,
+        burst: Optional[int] = None,
+    ):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        # Đọc cấu hình lúc tạo limiter: process con đã chia tốc độ/burst (`share_rate`)
+        self.bucket = TokenBucket(
+            Config.RATE_CONFIG["requests_per_second"] if rate is None else rate,
+            Config.RATE_CONFIG["burst"] if burst is None else burst,
+        )
+        self.in_flight = 0
+        self.decreases = 0
+        self._samples: List[Tuple[float, bool]] = []
+        self._throttled = 0
+        self._saturated = False
+        self._window_start = time.monotonic()
+        self._released: Optional[asyncio.Event] = None
+
+    @asynccontextmanager
+    async def request(self) -> AsyncIterator[RequestOutcome]:
+        """Giữ một slot và một token trong thời gian gửi request"""
+        await self._acquire()
+        outcome = RequestOutcome()
+        started = time.monotonic()
+        try:
+            yield outcome
+        finally:
+            self._release(time.monotonic() - started, outcome.ok, outcome.throttled)
+
+    async def _acquire(self) -> None:
+        if self._released is None:
+            self._released = asyncio.Event()
+        while self.in_flight >= int(self.limit):
+            self._saturated = True
+            self._released.clear()
+            await self._released.wait()
+        self.in_flight += 1
+        try:
+            await self.bucket.take()
+        except BaseException:
+            self.in_flight -= 1
+            self._released.set()
+            raise
+
+    def _release(self, latency: float, ok: bool, throttled: bool = False) -> None:
+        self.in_flight -= 1
+        self._samples.append((latency, ok))
+        self._throttled += throttled
+        self._adjust()
+        self._released.set()
+
+    def _adjust(self) -> None:
+        """Tăng/giảm giới hạn khi đủ một cửa sổ"""
+        config = Config.RATE_CONFIG
+        now = time.monotonic()
+        if now - self._window_start < config["window_seconds"]:
+            return
+        # Bị throttle thì giảm ngay cuối cửa sổ, không chờ đủ mẫu
+        if len(self._samples) < config["min_samples"] and not self._throttled:
+            return
+
+        samples, self._samples = self._samples, []
+        saturated, self._saturated = self._saturated, False
+        throttled, self._throttled = self._throttled, 0
+        self._window_start = now
+
+        latencies = sorted(latency for latency, _ in samples)
+        p90 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))]
+        error_rate = sum(1 for _, ok in samples if not ok) / len(samples)
+        rss_limit = Config.PROCESS_CONFIG["max_process_rss_mb"] * config["rss_soft_limit_ratio"]
+
+        reason = None
+        if throttled:
+            reason = f"{throttled} request bị throttle"
+        elif error_rate > config["max_error_rate"]:
+            reason = f"tỉ lệ lỗi {error_rate:.0%}"
+        elif p90 > config["max_latency"]:
+            reason = f"p90 latency {p90:.1f}s"
+        else:
+            rss = process_rss_mb(os.getpid())
+            if rss > rss_limit:
+                reason = f"RSS {rss:.0f}MB"
+
+        previous = int(self.limit)
+        if reason is not None:
+            self.limit = max(self.minimum, self.limit * config["decrease_factor"])
+            self.decreases += 1
+            logger.warning(f"Giảm concurrency {previous} -> {int(self.limit)} ({reason})")
+        elif saturated and self.limit < self.maximum:
+            self.limit = min(self.maximum, self.limit + config["increase_step"])
+            if int(self.limit) != previous:
+                logger.info(
+                    f"Tăng concurrency {previous} -> {int(self.limit)} "
+                    f"(p90 {p90:.1f}s, lỗi {error_rate:.0%})"
+                )
@@ -0,0 +1,114 @@
+import time
+from collections import Counter
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlparse
+
+from utils.config import Config
+from utils.logger import setup_logger
+
+# Cấu hình logger
+logger = setup_logger(__name__)
+
+
+class PageLoadStats:
+    """Số request bị chặn, số byte đã tải và thời gian tải của một page"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.blocked: Counter = Counter()
+        self.bytes_loaded = 0
+
+    def estimated_bytes_saved(self) -> int:
+        """Ước tính số byte tiết kiệm theo kích thước trung bình của từng loại resource"""
+        sizes = Config.REQUEST_FILTER_CONFIG["estimated_size_kb"]
+        return sum(count * sizes.get(kind, sizes["other"]) * 1024 for kind, count in self.blocked.items())
+
+
+class RequestFilter:
+    """Chặn các request không cần thiết trên browser context
+
+    Crawler chỉ đọc script JSON và href trong HTML nên ảnh, font, CSS,
+    video và tracker đều bị abort trước khi tải. Thống kê được ghi theo
+    page cho các page đăng ký qua `track()`.
+    """
+
+    def __init__(
+        self,
+        resource_types: Optional[Iterable[str]] = None,
+        domains: Optional[Iterable[str]] = None,
+    ):
+        config = Config.REQUEST_FILTER_CONFIG
+        self.resource_types = set(config["blocked_resource_types"] if resource_types is None else resource_types)
+        self.domains = tuple(config["blocked_domains"] if domains is None else domains)
+        self._pages: Dict[object, PageLoadStats] = {}
+        self.total = PageLoadStats()
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        """Request có thuộc loại resource hoặc domain bị chặn không"""
+        if resource_type in self.resource_types:
+            return True
+        host = urlparse(url).hostname or ""
+        return any(host == domain or host.endswith(f".{domain}") for domain in self.domains)
+
+    async def install(self, context) -> None:
+        """Gắn bộ lọc vào toàn bộ page của context"""
+        if self.resource_types or self.domains:
+            await context.route("**/*", self._handle_route)
+
+    async def _handle_route(self, route) -> None:
+        request = route.request
+        if not self.should_block(request.resource_type, request.url):
+            await route.continue_()
+            return
+
+        kind = request.resource_type if request.resource_type in self.resource_types else "tracker"
+        self.total.blocked[kind] += 1
+        stats = self._stats_for(request)
+        if stats is not None:
+            stats.blocked[kind] += 1
+        await route.abort("blockedbyclient")
+
+    def _stats_for(self, request) -> Optional[PageLoadStats]:
+        try:
+            return self._pages.get(request.frame.page)
+        except Exception:
+            # Request của service worker không thuộc page nào
+            return None
+
+    def track(self, page) -> PageLoadStats:
+        """Bắt đầu ghi thống kê cho page (gọi ngay trước `page.goto`)"""
+        stats = PageLoadStats()
+        self._pages[page] = stats
+
+        def on_response(response) -> None:
+            length = response.headers.get("content-length")
+            if length and length.isdigit():
+                stats.bytes_loaded += int(length)
+                self.total.bytes_loaded += int(length)
+
+        page.on("response", on_response)
+        page.once("close", lambda _: self._pages.pop(page, None))
+        return stats
+
+    def report(self, page, label: str) -> None:
+        """Log thời gian tải, số byte đã tải và số byte ước tính tiết kiệm của page"""
+        stats = self._pages.get(page)
+        if stats is None:
+            return
+        elapsed = time.monotonic() - stats.started
+        blocked = sum(stats.blocked.values())
+        logger.info(
+            f"Tải {label}: {elapsed:.2f}s, {stats.bytes_loaded / 1024:.0f}KB, "
+            f"chặn {blocked} request (~{stats.estimated_bytes_saved() / 1024:.0f}KB tiết kiệm)"
+        )
+
+    def log_summary(self) -> None:
+        """Log tổng số request bị chặn từ khi khởi động pool"""
+        if not self.total.blocked:
+            return
+        detail = ", ".join(f"{kind}: {count}" for kind, count in self.total.blocked.most_common())
+        logger.info(
+            f"Đã chặn {sum(self.total.blocked.values())} request ({detail}), "
+            f"~{self.total.estimated_bytes_saved() / (1024 * 1024):.1f}MB tiết kiệm, "
+            f"đã tải {self.total.bytes_loaded / (1024 * 1024):.1f}MB"
+        )
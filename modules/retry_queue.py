@@ -0,0 +1,63 @@
+import heapq
+import itertools
+import random
+import time
+from typing import Any, List, Optional, Tuple
+
+from utils.config import Config
+
+
+def backoff_delay(attempt: int) -> float:
+    """Thời gian chờ trước lần thử lại thứ `attempt` (tính từ 1)
+
+    Exponential backoff có giới hạn `max_delay`, cộng jitter ngẫu nhiên
+    (nửa cố định, nửa ngẫu nhiên) để các username lỗi cùng lúc không dồn
+    lại cùng một thời điểm.
+    """
+    config = Config.RETRY_CONFIG
+    delay = min(config["max_delay"], config["base_delay"] * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def max_retries(category: str) -> int:
+    """Số lần thử lại tối đa theo loại lỗi"""
+    limits = Config.RETRY_CONFIG["max_retries"]
+    return limits.get(category, Config.CRAWLER_CONFIG["max_retries"])
+
+
+class RetryQueue:
+    """Hàng đợi thử lại có hẹn giờ, phần tử đến hạn được lấy theo thứ tự thời gian
+
+    Không có lock: mọi lời gọi phải chạy trên event loop của process, không
+    gọi từ thread (`asyncio.to_thread`). Số lần đã thử được truyền vào từ
+    bên ngoài để có thể tiếp tục sau khi khởi động lại.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Any, str, int]] = []
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, item: Any, category: str, attempts: int) -> bool:
+        """Hẹn thử lại lần thứ `attempts`, False nếu đã vượt số lần cho phép"""
+        if attempts > max_retries(category):
+            return False
+        due = time.monotonic() + backoff_delay(attempts)
+        heapq.heappush(self._heap, (due, next(self._counter), item, category, attempts))
+        return True
+
+    def pop_due(self, limit: int) -> List[Any]:
+        """Lấy tối đa `limit` phần tử đã đến hạn"""
+        now = time.monotonic()
+        items = []
+        while self._heap and len(items) < limit and self._heap[0][0] <= now:
+            items.append(heapq.heappop(self._heap)[2])
+        return items
+
+    def next_delay(self) -> Optional[float]:
+        """Số giây tới phần tử đến hạn sớm nhất (None nếu rỗng)"""
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - time.monotonic())
@@ -0,0 +1,86 @@
+import hashlib
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from modules.work_lease import WorkLease
+from utils.config import Config
+
+# Field của profile dùng làm tín hiệu thay đổi
+SIGNATURE_FIELDS = ("follower", "following", "full_name", "bio")
+
+
+def profile_signature(profile: Dict[str, Any]) -> str:
+    """Hash các field hay thay đổi của profile (số follower, bio, tên)"""
+    raw = "\x1f".join(str(profile.get(field)) for field in SIGNATURE_FIELDS)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _clamp_days(days: float, low: float, high: float) -> timedelta:
+    return timedelta(days=min(high, max(low, days)))
+
+
+def profile_schedule(profile: Dict[str, Any], previous: Optional[Dict[str, Any]],
+                     now: datetime) -> Dict[str, Any]:
+    """Field lịch crawl lại ghi vào username sau mỗi lần crawl profile
+
+    Độ ưu tiên = tần suất thay đổi x log10(follower + 10). Tần suất thay đổi
+    được làm trơn (changes + 1) / (lần so sánh + 2), nên profile mới có
+    tần suất 0.5 và profile nhiều lần không đổi giảm dần về 0. Chu kỳ crawl
+    lại tỉ lệ nghịch với độ ưu tiên, giới hạn trong [min_days, max_days].
+    """
+    config = Config.SCHEDULER_CONFIG
+    previous = previous or {}
+    signature = profile_signature(profile)
+    crawl_count = previous.get("crawlCount", 0) + 1
+    change_count = previous.get("changeCount", 0)
+    if previous.get("signature") and previous["signature"] != signature:
+        change_count += 1
+
+    change_rate = (change_count + 1) / (crawl_count - 1 + 2)
+    priority = change_rate * math.log10((profile.get("follower") or 0) + 10)
+    return {
+        "lastCrawledAt": now,
+        "signature": signature,
+        "crawlCount": crawl_count,
+        "changeCount": change_count,
+        "refreshPriority": round(priority, 4),
+        "refreshAt": now + _clamp_days(
+            config["profile_base_days"] / priority, config["profile_min_days"], config["profile_max_days"]
+        ),
+    }
+
+
+def keyword_schedule(found: int, new: int, now: datetime) -> Dict[str, Any]:
+    """Field lịch crawl lại ghi vào keyword theo số username mới của lần crawl
+
+    Keyword càng mang về nhiều username mới thì `yieldScore` càng cao và
+    càng sớm được crawl lại.
+    """
+    config = Config.SCHEDULER_CONFIG
+    return {
+        "lastFound": found,
+        "yieldScore": new,
+        "refreshAt": now + _clamp_days(
+            config["keyword_base_days"] / math.log2(new + 2), config["keyword_min_days"], config["keyword_max_days"]
+        ),
+    }
+
+
+class RefreshLease(WorkLease):
+    """Claim các item đã crawl đến hạn crawl lại, ưu tiên `priority_field` cao trước
+
+    Item crawl từ trước khi có lịch (chưa có `refreshAt`) cũng được coi là
+    đến hạn và xếp sau cùng. Item được coi là xong khi `refreshAt` đã được
+    dời sang tương lai.
+    """
+
+    def __init__(self, collection, key_field: str, priority_field: str, **kwargs):
+        super().__init__(collection, key_field, **kwargs)
+        self.order = [(priority_field, -1), ("_id", 1)]
+
+    def _pending(self, now: datetime) -> dict:
+        return {"isCrawl": True, "$or": [{"refreshAt": None}, {"refreshAt": {"$lte": now}}]}
+
+    def _finished(self, now: datetime) -> dict:
+        return {"refreshAt": {"$gt": now}}
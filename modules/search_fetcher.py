@@ -0,0 +1,51 @@
+import json
+from typing import Optional
+
+from modules.profile_fetcher import ProfileHttpError, ProfileHttpFetcher
+from utils.config import Config
+from utils.logger import setup_logger
+
+# Cấu hình logger
+logger = setup_logger(__name__)
+
+SEARCH_RESOURCE_URL = "/resource/BaseSearchResource/get/"
+
+
+class SearchHttpError(ProfileHttpError):
+    """Search API trả HTTP khác 200"""
+
+
+class SearchHttpFetcher(ProfileHttpFetcher):
+    """Gọi thẳng resource tìm kiếm user của Pinterest qua HTTP, không cần browser
+
+    Dùng lại session aiohttp (keep-alive, giới hạn kết nối) của
+    `ProfileHttpFetcher`, nên nhiều keyword có thể chạy song song trên
+    cùng một pool kết nối. Mỗi lần gọi trả về một trang kết quả, trang tiếp
+    theo lấy bằng bookmark của trang trước.
+    """
+
+    async def fetch_search_page(self, query: str, bookmark: Optional[str] = None) -> Optional[dict]:
+        """Lấy một trang kết quả tìm user (SearchHttpError nếu HTTP khác 200)"""
+        source_url = f"/search/users/?q={query}"
+        data = {
+            "options": {
+                "query": query,
+                "scope": "users",
+                "bookmarks": [bookmark] if bookmark else [],
+            },
+            "context": {},
+        }
+        params = {"source_url": source_url, "data": json.dumps(data, separators=(",", ":"))}
+        headers = {
+            "Accept": "application/json",
+            "X-Requested-With": "XMLHttpRequest",
+            "X-Pinterest-Source-Url": source_url,
+        }
+
+        async with self._session.get(
+            f"{Config.PINTEREST_BASE_URL}{SEARCH_RESOURCE_URL}", params=params, headers=headers
+        ) as response:
+            if response.status != 200:
+                logger.warning(f"Search API nhận HTTP {response.status} cho keyword {query}")
+                raise SearchHttpError(response.status)
+            return await response.json(content_type=None)
@@ -0,0 +1,121 @@
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+import paramiko
+
+from utils.config import Config
+from utils.logger import setup_logger
+
+# Cấu hình logger
+logger = setup_logger(__name__)
+
+
+class SftpSession:
+    """Một phiên SSH + SFTP được giữ mở lâu dài"""
+
+    def __init__(self, ssh: paramiko.SSHClient, sftp: paramiko.SFTPClient):
+        self.ssh = ssh
+        self.sftp = sftp
+
+    @classmethod
+    def connect(cls) -> "SftpSession":
+        """Mở kết nối SSH tới server lưu avatar theo Config.SFTP_CONFIG"""
+        sftp_config = Config.SFTP_CONFIG
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect(
+            sftp_config["host"],
+            username=sftp_config["username"],
+            password=sftp_config["password"],
+        )
+        return cls(ssh, ssh.open_sftp())
+
+    def is_alive(self) -> bool:
+        """Kiểm tra transport SSH còn hoạt động"""
+        transport = self.ssh.get_transport()
+        return transport is not None and transport.is_active()
+
+    def close(self) -> None:
+        try:
+            self.sftp.close()
+        finally:
+            self.ssh.close()
+
+
+class SftpPool:
+    """Pool các phiên SFTP dùng chung giữa các thread upload
+
+    Phiên được mở lazy tới tối đa `size`, tái sử dụng cho nhiều lần upload.
+    Phiên bị lỗi hoặc mất kết nối sẽ bị bỏ và mở lại ở lần dùng sau.
+    `connect` cho phép thay bằng server giả lập khi chạy benchmark.
+    """
+
+    def __init__(
+        self,
+        size: int = Config.SFTP_CONFIG["pool_size"],
+        connect: Optional[Callable[[], SftpSession]] = None,
+    ):
+        self.size = max(1, size)
+        self._connect = connect or SftpSession.connect
+        self._idle: "queue.Queue[SftpSession]" = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def session(self):
+        """Mượn một SFTPClient, trả lại pool khi xong (hoặc bỏ đi nếu lỗi)"""
+        session = self._acquire()
+        try:
+            yield session.sftp
+        except Exception:
+            self._discard(session)
+            raise
+        else:
+            self._idle.put(session)
+
+    def close(self) -> None:
+        """Đóng tất cả phiên đang rảnh"""
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(session)
+
+    def _acquire(self) -> SftpSession:
+        try:
+            session = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                return self._open()
+            session = self._idle.get()
+
+        if not session.is_alive():
+            logger.warning("Phiên SFTP đã mất kết nối, kết nối lại")
+            self._discard(session)
+            with self._lock:
+                self._created += 1
+            return self._open()
+        return session
+
+    def _open(self) -> SftpSession:
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _discard(self, session: SftpSession) -> None:
+        with self._lock:
+            self._created -= 1
+        try:
+            session.close()
+        except Exception as e:
+            logger.warning(f"Lỗi khi đóng phiên SFTP: {e}")
@@ -0,0 +1,237 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import psutil
+
+from modules.metrics import add_progress, merge_snapshots, metrics
+from utils.config import Config
+from utils.logger import setup_logger
+
+# Cấu hình logger
+logger = setup_logger(__name__)
+
+
+def process_rss_mb(pid: int) -> float:
+    """RSS của process cùng các process con (Chromium) tính theo MB"""
+    try:
+        process = psutil.Process(pid)
+        rss = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                continue
+    except psutil.Error:
+        return 0.0
+    return rss / (1024 * 1024)
+
+
+async def run_child(main: Callable[[], Any], stats: Counter, progress,
+                    interval: float = Config.PROCESS_CONFIG["progress_interval"]) -> None:
+    """Chạy coroutine chính của một process con và gửi tiến độ, metrics về supervisor
+
+    SIGTERM từ supervisor hủy task chính, nên các khối `finally` (trả lease,
+    đóng browser) vẫn chạy trước khi process thoát.
+    """
+    task = asyncio.ensure_future(main())
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+
+    process_name = multiprocessing.current_process().name
+
+    def send() -> None:
+        progress.put((os.getpid(), dict(stats), metrics.snapshot(process=process_name)))
+
+    async def report() -> None:
+        while True:
+            await asyncio.sleep(interval)
+            send()
+
+    reporter = asyncio.create_task(report())
+    try:
+        await task
+    except asyncio.CancelledError:
+        logger.info(f"Process {os.getpid()} đã dừng theo yêu cầu của supervisor")
+    finally:
+        reporter.cancel()
+        send()
+
+
+class _Slot:
+    """Một vị trí process trong supervisor, được khởi động lại khi cần"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[multiprocessing.Process] = None
+        self.restarts = 0
+        self.finished = False
+
+
+class Supervisor:
+    """Chạy P process con, mỗi process một event loop với W worker async
+
+    Các process chia nhau backlog qua lease trên MongoDB nên không cần chia
+    việc trước. Supervisor theo dõi RSS của từng process (tính cả browser
+    con), khởi động lại process vượt ngưỡng hoặc bị crash, và gom tiến độ,
+    metrics các process gửi về để log định kỳ và xuất qua `metrics_snapshot()`.
+    """
+
+    def __init__(
+        self,
+        target: Callable[..., None],
+        args: Tuple = (),
+        processes: int = 1,
+        max_rss_mb: int = Config.PROCESS_CONFIG["max_process_rss_mb"],
+        max_restarts: int = Config.PROCESS_CONFIG["max_restarts"],
+    ):
+        self.target = target
+        self.args = args
+        self.max_rss_mb = max_rss_mb
+        self.max_restarts = max_restarts
+        # spawn thay vì fork: process con không kế thừa event loop,
+        # kết nối MongoDB hay Playwright của process cha
+        self._ctx = multiprocessing.get_context("spawn")
+        self.progress = self._ctx.Queue()
+        self._slots = [_Slot(i) for i in range(processes)]
+        self._stats: Dict[int, Counter] = {}
+        self._metrics: Dict[int, Dict[str, Any]] = {}
+        self._stopping = False
+
+    def run(self) -> Counter:
+        """Chạy tới khi mọi process hoàn thành, trả về tổng tiến độ"""
+        previous = signal.signal(signal.SIGTERM, self._on_sigterm)
+        try:
+            for slot in self._slots:
+                self._start(slot)
+
+            last_report = time.monotonic()
+            while not all(slot.finished for slot in self._slots):
+                self._wait_progress(Config.PROCESS_CONFIG["check_interval"])
+                if self._stopping:
+                    self._stop_all()
+                    break
+                for slot in self._slots:
+                    self._check(slot)
+                if time.monotonic() - last_report >= Config.PROCESS_CONFIG["progress_interval"]:
+                    self._log_progress()
+                    last_report = time.monotonic()
+        except KeyboardInterrupt:
+            self._stop_all()
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+
+        self._drain_progress()
+        self._log_progress()
+        return self.total()
+
+    def total(self) -> Counter:
+        """Tổng tiến độ của mọi process (kể cả process đã thoát)"""
+        total: Counter = Counter()
+        for stats in list(self._stats.values()):
+            total.update(stats)
+        return total
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        """Metrics gộp của mọi process kèm tổng tiến độ (gọi được từ thread khác)"""
+        return add_progress(merge_snapshots(list(self._metrics.values())), self.total())
+
+    def _on_sigterm(self, signum, frame) -> None:
+        self._stopping = True
+
+    def _start(self, slot: _Slot) -> None:
+        slot.process = self._ctx.Process(
+            target=self.target, args=self.args + (self.progress,),
+            name=f"crawler-{slot.index}",
+        )
+        slot.process.start()
+        logger.info(f"Đã khởi động process {slot.process.name} (pid {slot.process.pid})")
+
+    def _check(self, slot: _Slot) -> None:
+        """Khởi động lại process đã crash hoặc vượt ngưỡng RSS"""
+        if slot.finished:
+            return
+        process = slot.process
+        if not process.is_alive():
+            if process.exitcode == 0:
+                slot.finished = True
+                logger.info(f"Process {process.name} đã hoàn thành")
+                return
+            logger.warning(f"Process {process.name} thoát với mã {process.exitcode}")
+            self._restart(slot)
+            return
+
+        rss_mb = self._rss_mb(process.pid)
+        if rss_mb > self.max_rss_mb:
+            logger.warning(
+                f"Process {process.name} dùng {rss_mb:.0f}MB RSS (ngưỡng {self.max_rss_mb}MB), khởi động lại"
+            )
+            self._terminate(process)
+            self._restart(slot)
+
+    def _restart(self, slot: _Slot) -> None:
+        if slot.restarts >= self.max_restarts:
+            slot.finished = True
+            logger.error(f"Process {slot.process.name} đã khởi động lại {slot.restarts} lần, bỏ qua")
+            return
+        slot.restarts += 1
+        self._start(slot)
+
+    @staticmethod
+    def _terminate(process: multiprocessing.Process) -> None:
+        """Gửi SIGTERM để process tự dọn dẹp, kill nếu quá thời gian chờ"""
+        process.terminate()
+        process.join(Config.PROCESS_CONFIG["shutdown_timeout"])
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+    def _stop_all(self) -> None:
+        logger.info("Đang dừng các process crawler")
+        for slot in self._slots:
+            if slot.process is not None and slot.process.is_alive():
+                slot.process.terminate()
+        deadline = time.monotonic() + Config.PROCESS_CONFIG["shutdown_timeout"]
+        for slot in self._slots:
+            if slot.process is None:
+                continue
+            slot.process.join(max(0.0, deadline - time.monotonic()))
+            if slot.process.is_alive():
+                slot.process.kill()
+                slot.process.join()
+            slot.finished = True
+
+    @staticmethod
+    def _rss_mb(pid: int) -> float:
+        return process_rss_mb(pid)
+
+    def _wait_progress(self, timeout: float) -> None:
+        """Chờ tiến độ từ process con, tối đa `timeout` giây"""
+        try:
+            report = self.progress.get(timeout=timeout)
+        except queue.Empty:
+            return
+        self._store(*report)
+        self._drain_progress()
+
+    def _drain_progress(self) -> None:
+        while True:
+            try:
+                report = self.progress.get_nowait()
+            except queue.Empty:
+                return
+            self._store(*report)
+
+    def _store(self, pid: int, stats: Dict[str, int], snapshot: Dict[str, Any]) -> None:
+        self._stats[pid] = Counter(stats)
+        self._metrics[pid] = snapshot
+
+    def _log_progress(self) -> None:
+        total = self.total()
+        alive = sum(1 for slot in self._slots if slot.process is not None and slot.process.is_alive())
+        summary = ", ".join(f"{key}: {value}" for key, value in sorted(total.items())) or "chưa có"
+        logger.info(f"Tiến độ ({alive}/{len(self._slots)} process đang chạy): {summary}")
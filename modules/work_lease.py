@@ -0,0 +1,186 @@
+import asyncio
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Set
+
+from pymongo import ReturnDocument
+
+from utils.config import Config
+from utils.logger import setup_logger
+
+# Cấu hình logger
+logger = setup_logger(__name__)
+
+
+class WorkLease:
+    """Claim item trên collection theo lease để nhiều container chia nhau backlog
+
+    Item được claim bằng cách ghi `claimedBy`/`leaseUntil` một cách atomic
+    (`find_one_and_update` hoặc `update_many` có điều kiện), chỉ item chưa
+    claim hoặc đã hết lease mới claim được. Item đang giữ được gia hạn định
+    kỳ qua `heartbeat()`; container chết thì lease hết hạn và item được
+    container khác claim lại.
+
+    Lớp con đổi `_pending`/`_finished` và `order` để claim theo điều kiện và
+    thứ tự khác (ví dụ crawl lại theo độ ưu tiên).
+    """
+
+    # Thứ tự claim item
+    order = [("_id", 1)]
+
+    def __init__(
+        self,
+        collection,
+        key_field: str,
+        owner_id: Optional[str] = None,
+        lease_seconds: int = Config.LEASE_CONFIG["lease_seconds"],
+    ):
+        self.collection = collection
+        self.key_field = key_field
+        self.owner_id = owner_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds
+        self._held: Set[str] = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _now() -> datetime:
+        return datetime.now(timezone.utc)
+
+    def _pending(self, now: datetime) -> dict:
+        """Điều kiện item cần xử lý: chưa crawl"""
+        return {"isCrawl": False}
+
+    def _finished(self, now: datetime) -> dict:
+        """Điều kiện item đã xử lý xong"""
+        return {"isCrawl": True}
+
+    def _claimable(self, now: datetime) -> dict:
+        """Điều kiện item có thể claim: cần xử lý và chưa ai giữ lease còn hạn"""
+        condition = dict(self._pending(now))
+        lease = {"$or": [{"leaseUntil": None}, {"leaseUntil": {"$lt": now}}]}
+        if "$or" in condition:
+            condition["$and"] = [{"$or": condition.pop("$or")}, lease]
+        else:
+            condition.update(lease)
+        return condition
+
+    def claim_one(self, projection: Optional[dict] = None) -> Optional[dict]:
+        """Claim atomic một item (dùng cho keyword)"""
+        now = self._now()
+        doc = self.collection.find_one_and_update(
+            self._claimable(now),
+            {
+                "$set": {
+                    "claimedBy": self.owner_id,
+                    "leaseUntil": now + timedelta(seconds=self.lease_seconds),
+                }
+            },
+            projection=projection,
+            sort=self.order,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is not None:
+            with self._lock:
+                self._held.add(doc[self.key_field])
+        return doc
+
+    def claim(self, limit: int, projection: Optional[dict] = None) -> List[dict]:
+        """Claim tối đa `limit` item trong một lượt (dùng cho batch username)"""
+        for _ in range(Config.LEASE_CONFIG["claim_attempts"]):
+            now = self._now()
+            candidates = [
+                doc["_id"]
+                for doc in self.collection.find(self._claimable(now), {"_id": 1})
+                .sort(self.order)
+                .limit(limit)
+            ]
+            if not candidates:
+                return []
+
+            # Mỗi document được cập nhật atomic và kiểm tra lại điều kiện,
+            # nên item bị container khác claim trước sẽ không bị ghi đè
+            lease_until = now + timedelta(seconds=self.lease_seconds)
+            claimed_filter = {"_id": {"$in": candidates}}
+            claimed_filter.update(self._claimable(now))
+            self.collection.update_many(
+                claimed_filter,
+                {"$set": {"claimedBy": self.owner_id, "leaseUntil": lease_until}},
+            )
+            claimed = {
+                doc["_id"]: doc
+                for doc in self.collection.find(
+                    {
+                        "_id": {"$in": candidates},
+                        "claimedBy": self.owner_id,
+                        "leaseUntil": lease_until,
+                    },
+                    projection,
+                )
+            }
+            # Giữ đúng thứ tự claim (theo `order`)
+            docs = [claimed[_id] for _id in candidates if _id in claimed]
+            if docs:
+                with self._lock:
+                    self._held.update(doc[self.key_field] for doc in docs)
+                return docs
+        return []
+
+    def renew(self) -> int:
+        """Gia hạn lease cho mọi item đang giữ"""
+        with self._lock:
+            held = list(self._held)
+        if not held:
+            return 0
+        result = self.collection.update_many(
+            {self.key_field: {"$in": held}, "claimedBy": self.owner_id},
+            {"$set": {"leaseUntil": self._now() + timedelta(seconds=self.lease_seconds)}},
+        )
+        return result.modified_count
+
+    def finish(self, keys: Iterable[str]) -> None:
+        """Ngừng giữ các item đã xử lý xong
+
+        Item đã crawl thành công được xóa thông tin lease. Item lỗi (chưa
+        khớp `_finished`) giữ nguyên lease cho tới khi hết hạn, nên chỉ được
+        claim lại sau `lease_seconds`.
+        """
+        keys = list(keys)
+        with self._lock:
+            self._held.difference_update(keys)
+        if keys:
+            self.collection.update_many(
+                dict(self._finished(self._now()), **{self.key_field: {"$in": keys}, "claimedBy": self.owner_id}),
+                {"$unset": {"claimedBy": "", "leaseUntil": ""}},
+            )
+
+    def release(self, keys: Iterable[str]) -> None:
+        """Trả lại ngay các item chưa xử lý, container khác claim được mà không chờ hết lease"""
+        keys = list(keys)
+        with self._lock:
+            self._held.difference_update(keys)
+        if keys:
+            self.collection.update_many(
+                {self.key_field: {"$in": keys}, "claimedBy": self.owner_id},
+                {"$unset": {"claimedBy": "", "leaseUntil": ""}},
+            )
+
+    def release_all(self) -> None:
+        """Trả lại toàn bộ item đang giữ (khi dừng crawler)"""
+        with self._lock:
+            held = list(self._held)
+        if held:
+            self.release(held)
+            logger.info(f"Đã trả lại {len(held)} {self.key_field} đang giữ")
+
+    async def heartbeat(self) -> None:
+        """Task gia hạn lease định kỳ, chạy tới khi bị cancel"""
+        interval = max(1.0, self.lease_seconds / 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.renew)
+            except Exception as e:
+                logger.error(f"Lỗi khi gia hạn lease: {e}")
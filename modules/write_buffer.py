@@ -0,0 +1,424 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import *
+from models.username_entity import UsernameEntity
+from modules.metrics import metrics
+from modules.scheduler import keyword_schedule
+from modules.write_journal import WriteJournal
+from utils.config import Config
+from utils.logger import setup_logger
+
+# Cấu hình logger
+logger = setup_logger(__name__)
+
+# Mã lỗi duplicate key của MongoDB
+DUPLICATE_KEY_ERROR = 11000
+
+
+class _Entry:
+    """Một lệnh upsert đang chờ theo key (username/keyword)"""
+
+    __slots__ = ("key", "field", "update", "upsert", "requires_profile", "source", "found", "new")
+
+    def __init__(self, key: str, field: str, update: Dict[str, Any], upsert: bool = True,
+                 requires_profile: bool = False, source: Optional[str] = None, found: int = 0,
+                 new: Optional[int] = None):
+        self.key = key
+        self.field = field
+        self.update = update
+        self.upsert = upsert
+        # Chỉ ghi khi profile cùng username đã được ghi thành công
+        self.requires_profile = requires_profile
+        # Keyword đã tìm ra username (để tính số username mới của keyword)
+        self.source = source
+        # Số username keyword tìm được trong lần crawl
+        self.found = found
+        # Số username mới của keyword, tính ở lần ghi đầu tiên (None: chưa ghi lần nào)
+        self.new = new
+
+    @property
+    def operation(self) -> UpdateOne:
+        return UpdateOne({self.field: self.key}, self.update, upsert=self.upsert)
+
+    def to_record(self, bucket: str) -> Dict[str, Any]:
+        """Dòng journal của lệnh, `bucket` là danh sách chờ chứa lệnh"""
+        return {
+            "bucket": bucket, "key": self.key, "field": self.field, "update": self.update, "upsert": self.upsert,
+            "requires_profile": self.requires_profile, "source": self.source, "found": self.found,
+            "new": self.new,
+        }
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "_Entry":
+        fields = dict(record)
+        fields.pop("bucket")
+        return cls(**fields)
+
+
+class WriteBuffer:
+    """Gom các lệnh ghi MongoDB của mọi worker rồi ghi bằng `bulk_write` không thứ tự
+
+    Profile, username mới, trạng thái crawl và đường dẫn avatar đều là upsert
+    theo `username` (keyword theo `keyword`), nên ghi lại sau lỗi không tạo
+    bản ghi trùng. Các field đều được `$set` giá trị tuyệt đối, trừ bộ đếm
+    `crawlCount`/`totalNew` của keyword (`$inc`): ghi lại từ journal hoặc sau
+    lỗi một phần có thể đếm hai lần, nên hai bộ đếm này là at-least-once và
+    không được dùng để lập lịch. Buffer được flush khi đủ `max_ops` lệnh hoặc
+    sau `flush_interval` giây. Profile được ghi trước, username có profile ghi lỗi
+    không được đánh dấu đã crawl để lần sau crawl lại. Username quá số lần
+    thử lại được ghi vào `dead_letters` sau cùng.
+
+    Với `journal`, mọi lệnh được ghi kèm vào journal trên đĩa cho tới khi
+    vào MongoDB (lệnh ghi lỗi được giữ lại trong journal), và các lệnh còn
+    lại từ lần chạy bị kill trước được ghi lại ngay khi `start()`. Không có
+    journal thì lệnh ghi lỗi được giữ trong buffer và ghi lại ở lượt flush sau.
+    """
+
+    def __init__(
+        self,
+        max_ops: int = Config.WRITE_BUFFER_CONFIG["max_ops"],
+        flush_interval: float = Config.WRITE_BUFFER_CONFIG["flush_interval"],
+        journal: Optional[WriteJournal] = None,
+    ):
+        self.max_ops = max_ops
+        self.flush_interval = flush_interval
+        self.journal = journal
+        # Callback nhận số bản ghi mới theo collection sau mỗi lần flush
+        self.on_flush: List[Callable[[Counter], None]] = []
+        # Callback nhận (keyword, found, new, saturated) của các keyword vừa ghi, chạy trong thread ghi
+        self.on_keywords: List[Callable[[List[Tuple[str, int, int, bool]]], None]] = []
+        self.written: Counter = Counter()
+        self.failed = 0
+
+        self._profiles: List[_Entry] = []
+        self._usernames: List[_Entry] = []
+        self._keywords: List[_Entry] = []
+        self._dead_letters: List[_Entry] = []
+        self._flushing = 0
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._flush_tasks: Set[asyncio.Task] = set()
+        # Task flush đã tạo nhưng chưa lấy batch: lệnh thêm vào trước đó sẽ nằm trong batch của nó
+        self._scheduled: Optional[asyncio.Task] = None
+        self._ticker: Optional[asyncio.Task] = None
+        self._syncer: Optional[asyncio.Task] = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def start(self) -> None:
+        """Ghi lại các lệnh còn trong journal và khởi động task flush định kỳ"""
+        if self.journal is not None:
+            records = self.journal.recover()
+            for record in records:
+                getattr(self, f"_{record['bucket']}").append(_Entry.from_record(record))
+            if records:
+                # Ghi xong trước khi claim việc, để username/keyword đã crawl không bị claim lại
+                await self.flush()
+        self._ticker = asyncio.create_task(self._tick())
+        if self.journal is not None:
+            self._syncer = asyncio.create_task(self._sync_journal())
+
+    async def close(self) -> None:
+        """Dừng flush định kỳ và ghi nốt các lệnh còn lại"""
+        if self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+        if self._syncer is not None:
+            self._syncer.cancel()
+            self._syncer = None
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        await self.flush()
+        if self.journal is not None:
+            self.journal.close()
+        elif self.pending:
+            logger.error(f"Write buffer: bỏ {self.pending} lệnh ghi lỗi khi dừng (journal đang tắt)")
+        logger.info(
+            f"Write buffer: đã ghi {sum(self.written.values())} lệnh, {self.failed} lệnh lỗi"
+        )
+
+    @property
+    def pending(self) -> int:
+        return len(self._profiles) + len(self._usernames) + len(self._keywords) + len(self._dead_letters)
+
+    def is_empty(self) -> bool:
+        """Không còn lệnh chờ ghi hoặc đang ghi"""
+        return self.pending == 0 and self._flushing == 0
+
+    # --- thêm lệnh ghi ---
+    def _add(self, bucket: str, entry: _Entry) -> None:
+        getattr(self, f"_{bucket}").append(entry)
+        if self.journal is not None:
+            self.journal.append(entry.to_record(bucket))
+
+    def upsert_profile(self, profile: dict) -> None:
+        """Ghi profile, không ghi đè `avatar_url` đã được cập nhật sau khi tải ảnh"""
+        fields = dict(profile)
+        username = fields.pop("username")
+        avatar_url = fields.pop("avatar_url", None)
+        update = {"$set": fields}
+        if avatar_url:
+            update["$setOnInsert"] = {"avatar_url": avatar_url}
+        self._add("profiles", _Entry(username, "username", update))
+        self._check_size()
+
+    def set_avatar(self, username: str, path: str, digest: Optional[str] = None,
+                   thumb_path: Optional[str] = None) -> None:
+        """Cập nhật đường dẫn, hash nội dung và thumbnail avatar đã lưu của profile
+
+        Chỉ cập nhật profile đã có (không upsert), ghi sau các upsert profile
+        cùng lượt flush, nên avatar không tạo document profile chỉ có field avatar.
+        """
+        fields = {"avatar_url": path}
+        if digest:
+            fields["avatar_hash"] = digest
+        if thumb_path:
+            fields["avatar_thumb_url"] = thumb_path
+        self._add("profiles", _Entry(username, "username", {"$set": fields}, upsert=False, requires_profile=True))
+        self._check_size()
+
+    def add_username(self, username: str, source: Optional[str] = None) -> None:
+        """Thêm username mới (bỏ qua nếu đã có), `source` là keyword tìm ra username"""
+        self._add("usernames", _Entry(
+            username, "username", {"$setOnInsert": UsernameEntity(isCrawl=False).to_dict()}, source=source,
+        ))
+        self._check_size()
+
+    def mark_username_crawled(self, username: str, schedule: Optional[Dict[str, Any]] = None) -> None:
+        """Đánh dấu username đã crawl profile, ghi lịch crawl lại và trả lease
+
+        Chỉ cập nhật document đã claim (không upsert), nên username ghi sai
+        không tạo document username mới.
+        """
+        self._add("usernames", _Entry(
+            username, "username",
+            {
+                "$set": dict(schedule or {}, isCrawl=True),
+                "$unset": {
+                    "claimedBy": "", "leaseUntil": "", "retryCount": "", "lastError": "", "deadLetter": "",
+                },
+            },
+            upsert=False, requires_profile=True,
+        ))
+        self._check_size()
+
+    def record_failure(self, username: str, category: str, attempts: int) -> None:
+        """Ghi số lần thử lại và loại lỗi gần nhất của username (vẫn giữ lease)"""
+        self._add("usernames", _Entry(
+            username, "username", {"$set": {"retryCount": attempts, "lastError": category}}, upsert=False,
+        ))
+        self._check_size()
+
+    def dead_letter(self, username: str, category: str, attempts: int) -> None:
+        """Chuyển username lỗi quá số lần thử lại vào `dead_letters` và trả lease
+
+        Username được đánh dấu đã crawl với `refreshAt` xa nhất, nên chỉ được
+        thử lại ở chế độ crawl lại (--refresh).
+        """
+        now = datetime.now(timezone.utc)
+        refresh_at = now + timedelta(days=Config.SCHEDULER_CONFIG["profile_max_days"])
+        self._add("usernames", _Entry(
+            username, "username",
+            {
+                "$set": {"isCrawl": True, "deadLetter": category, "refreshAt": refresh_at},
+                "$unset": {"claimedBy": "", "leaseUntil": "", "retryCount": "", "lastError": ""},
+            },
+            upsert=False,
+        ))
+        self._add("dead_letters", _Entry(
+            username, "username",
+            {"$set": {"category": category, "attempts": attempts, "failedAt": now}},
+        ))
+        self._check_size()
+
+    def mark_keyword_crawled(self, keyword: str, found: int = 0, saturated: bool = False) -> None:
+        """Đánh dấu keyword đã crawl username và trả lease
+
+        Số username mới và lịch crawl lại của keyword được tính khi flush,
+        sau khi biết username nào thực sự được thêm mới. `saturated` là kết
+        quả tìm bị cắt (vẫn còn trang sau khi dừng tìm).
+        """
+        self._add("keywords", _Entry(
+            keyword, "keyword",
+            {"$set": {"isCrawl": True, "saturated": saturated}, "$unset": {"claimedBy": "", "leaseUntil": ""}},
+            upsert=False, found=found,
+        ))
+        self._check_size()
+
+    # --- flush ---
+    def _check_size(self) -> None:
+        if self.pending >= self.max_ops:
+            self._start_flush()
+
+    def _start_flush(self) -> asyncio.Task:
+        """Flush trong task riêng, `close()` chờ các task này ghi xong
+
+        Chỉ tạo task mới khi chưa có task nào đang chờ lấy batch, nên thêm
+        nhiều lệnh liên tiếp khi buffer đã đầy không tạo thêm lượt flush.
+        """
+        if self._scheduled is None or self._scheduled.done():
+            task = asyncio.get_running_loop().create_task(self.flush())
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+            self._scheduled = task
+        return self._scheduled
+
+    async def _tick(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                # Hủy ticker khi đang ghi không được bỏ dở lượt ghi (batch đã lấy khỏi buffer)
+                await asyncio.shield(self._start_flush())
+            except Exception as e:
+                logger.error(f"Lỗi khi flush write buffer: {e}")
+
+    async def _sync_journal(self) -> None:
+        """Định kỳ ghi các lệnh mới vào journal trong thread (không ghi file trên event loop)"""
+        while True:
+            await asyncio.sleep(self.journal.sync_interval)
+            try:
+                await asyncio.to_thread(self.journal.sync)
+            except OSError as e:
+                logger.error(f"Lỗi khi ghi journal: {e}")
+
+    async def flush(self) -> Counter:
+        """Ghi toàn bộ lệnh đang chờ, trả về số bản ghi mới theo collection"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if asyncio.current_task() is self._scheduled:
+                # Lệnh thêm sau lúc này cần một lượt flush mới
+                self._scheduled = None
+            batch = (self._profiles, self._usernames, self._keywords, self._dead_letters)
+            self._profiles, self._usernames, self._keywords, self._dead_letters = [], [], [], []
+            if not any(batch):
+                return Counter()
+            # Segment đóng cùng lúc lấy batch nên chứa đúng các lệnh của batch
+            segment = self.journal.rotate() if self.journal is not None else None
+
+            self._flushing += 1
+            try:
+                upserted, failed = await asyncio.to_thread(self._write, *batch)
+            finally:
+                self._flushing -= 1
+            if self.journal is not None:
+                # Lệnh ghi lỗi được ghi vào segment riêng trước khi xóa segment của batch
+                self.journal.keep([entry.to_record(bucket) for bucket, entry in failed])
+                self.journal.commit(segment)
+            else:
+                # Không có journal: lệnh ghi lỗi được ghi lại ở lượt flush sau
+                for bucket in ("profiles", "usernames", "keywords", "dead_letters"):
+                    retry = [entry for name, entry in failed if name == bucket]
+                    if retry:
+                        setattr(self, f"_{bucket}", retry + getattr(self, f"_{bucket}"))
+
+        if upserted["usernames"]:
+            logger.info(f"Đã lưu {upserted['usernames']} username mới")
+        for callback in self.on_flush:
+            callback(upserted)
+        return upserted
+
+    def _write(self, profiles: List[_Entry], usernames: List[_Entry], keywords: List[_Entry],
+               dead_letters: List[_Entry]) -> Tuple[Counter, List[Tuple[str, _Entry]]]:
+        """Ghi lần lượt profiles, avatar, usernames, keywords, dead_letters (chạy trong thread)
+
+        Trả về số bản ghi mới theo collection và các lệnh (kèm tên danh sách
+        chờ) chưa được ghi: lệnh lỗi, avatar và username chờ profile ghi lỗi.
+        """
+        upserted: Counter = Counter()
+        # Cập nhật avatar ghi sau upsert profile (bulk không thứ tự không giữ thứ tự lệnh)
+        avatars = [entry for entry in profiles if entry.requires_profile]
+        profiles = [entry for entry in profiles if not entry.requires_profile]
+        failed_profiles, new_profiles = self._bulk_write(profile_collection, profiles)
+        waiting_avatars = [entry for entry in avatars if entry.key in failed_profiles]
+        avatars = [entry for entry in avatars if entry.key not in failed_profiles]
+        failed_avatars, _ = self._bulk_write(profile_collection, avatars)
+        waiting = [entry for entry in usernames if entry.requires_profile and entry.key in failed_profiles]
+        usernames = [
+            entry for entry in usernames
+            if not (entry.requires_profile and entry.key in failed_profiles)
+        ]
+        failed_usernames, new_usernames = self._bulk_write(usernames_collection, usernames)
+
+        # Số username mới theo keyword, dùng cho độ ưu tiên crawl lại keyword
+        yields = Counter(usernames[i].source for i in new_usernames if usernames[i].source)
+        now = datetime.now(timezone.utc)
+        for entry in keywords:
+            if entry.new is not None:
+                # Ghi lại sau lỗi: username mới đã vào database ở lần ghi đầu, không tính lại
+                continue
+            entry.new = yields[entry.key]
+            entry.update = dict(
+                entry.update,
+                **{"$set": dict(entry.update["$set"], **keyword_schedule(entry.found, entry.new, now), crawlDate=now),
+                   "$inc": {"crawlCount": 1, "totalNew": entry.new}},
+            )
+        failed_keywords, new_keywords = self._bulk_write(keywords_collection, keywords)
+        results = [
+            (entry.key, entry.found, entry.new, entry.update["$set"].get("saturated", False))
+            for entry in keywords if entry.key not in failed_keywords
+        ]
+        for callback in self.on_keywords if results else []:
+            try:
+                callback(results)
+            except Exception as e:
+                # Keyword đã ghi xong, lỗi của callback không làm flush bị ghi lại
+                logger.warning(f"Callback keyword lỗi: {e}")
+        failed_dead_letters, new_dead_letters = self._bulk_write(dead_letters_collection, dead_letters)
+
+        upserted.update(
+            profiles=len(new_profiles), usernames=len(new_usernames), keywords=len(new_keywords),
+            dead_letters=len(new_dead_letters),
+        )
+        failed = [("profiles", entry) for entry in profiles if entry.key in failed_profiles]
+        failed += [("profiles", entry) for entry in waiting_avatars]
+        failed += [("profiles", entry) for entry in avatars if entry.key in failed_avatars]
+        failed += [("usernames", entry) for entry in waiting]
+        failed += [("usernames", entry) for entry in usernames if entry.key in failed_usernames]
+        failed += [("keywords", entry) for entry in keywords if entry.key in failed_keywords]
+        failed += [("dead_letters", entry) for entry in dead_letters if entry.key in failed_dead_letters]
+        return upserted, failed
+
+    def _bulk_write(self, collection, entries: List[_Entry], retry: bool = True) -> Tuple[Set[str], Set[int]]:
+        """Một lệnh bulk_write không thứ tự, trả về (key ghi lỗi, vị trí các lệnh tạo bản ghi mới)"""
+        if not entries:
+            return set(), set()
+        try:
+            with metrics.timer("mongo_write", collection=collection.name):
+                result = collection.bulk_write([entry.operation for entry in entries], ordered=False)
+            self.written[collection.name] += len(entries)
+            return set(), set(result.upserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            upserted = {item["index"] for item in e.details.get("upserted", [])}
+            self.written[collection.name] += len(entries) - len(errors)
+            # Hai upsert cùng username chạy song song có thể trả duplicate key,
+            # chạy lại lần nữa sẽ thành update
+            duplicates = [error["index"] for error in errors if error.get("code") == DUPLICATE_KEY_ERROR]
+            failed = {entries[error["index"]].key for error in errors if error.get("code") != DUPLICATE_KEY_ERROR}
+            if duplicates and retry:
+                retry_failed, retry_upserted = self._bulk_write(
+                    collection, [entries[i] for i in duplicates], retry=False
+                )
+                failed |= retry_failed
+                upserted |= {duplicates[i] for i in retry_upserted}
+            elif duplicates:
+                failed |= {entries[i].key for i in duplicates}
+            if failed:
+                self.failed += len(failed)
+                logger.error(f"Ghi {collection.name} lỗi với {len(failed)} bản ghi: {errors[0].get('errmsg')}")
+            return failed, upserted
+        except Exception as e:
+            self.failed += len(entries)
+            logger.error(f"Lỗi khi ghi {len(entries)} lệnh vào {collection.name}: {e}")
+            return {entry.key for entry in entries}, set()
@@ -0,0 +1,217 @@
+import glob
+import os
+import socket
+import threading
+from datetime import timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from bson import json_util
+
+from utils.config import Config
+from utils.logger import setup_logger
+from utils.process import is_dead_on_host, process_tag
+
+# Cấu hình logger
+logger = setup_logger(__name__)
+
+# Đọc lại datetime có múi giờ như khi được ghi (lịch crawl lại so sánh với thời gian UTC)
+JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS.with_options(tz_aware=True, tzinfo=timezone.utc)
+
+
+class WriteJournal:
+    """Journal append-only trên đĩa của các lệnh ghi chưa vào MongoDB
+
+    Mỗi lệnh được thêm vào write buffer cũng được ghi thành một dòng JSON vào
+    segment hiện tại: dòng được gom trong bộ nhớ và ghi xuống đĩa (`sync`)
+    trong thread mỗi `sync_interval` giây, nên event loop không ghi file mỗi
+    lệnh và process bị kill chỉ mất các lệnh của lượt sync cuối. Khi buffer flush, segment được đóng và một segment mới
+    được mở, segment cũ bị xóa sau khi các lệnh đã vào MongoDB. Process bị kill
+    (OOM, crash, container restart) để lại các segment chưa ghi xong, lần
+    chạy sau đọc lại chúng bằng `recover()` và ghi lại vào MongoDB trước khi
+    claim việc, nên username/keyword đã crawl không bị crawl lại. Các lệnh ghi
+    là upsert theo key nên ghi lại một segment đã ghi một phần không tạo bản
+    ghi trùng. Lệnh ghi lỗi (MongoDB không kết nối được...) được giữ lại
+    trong một segment riêng (`keep`) để lần chạy sau ghi lại.
+    """
+
+    SUFFIX = ".jsonl"
+
+    def __init__(self, directory: str, fsync: bool = Config.JOURNAL_CONFIG["fsync"], host: Optional[str] = None,
+                 sync_interval: float = Config.JOURNAL_CONFIG["sync_interval"]):
+        self.directory = directory
+        self.fsync = fsync
+        self.sync_interval = sync_interval
+        os.makedirs(directory, exist_ok=True)
+        if host is not None:
+            self._adopt(host)
+        own = glob.glob(os.path.join(directory, f"*{self.SUFFIX}"))
+        self._next = max((self._sequence(path) for path in own), default=0) + 1
+        # Segment còn lại từ lần chạy trước, theo thứ tự ghi
+        self._leftover = self._segments(directory)
+        self._path: Optional[str] = None
+        self._file = None
+        # Dòng chưa ghi xuống segment hiện tại
+        self._lines: List[str] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_process(cls) -> "WriteJournal":
+        """Journal riêng của process hiện tại
+
+        Thư mục con theo host, tên process và pid, nên các container dùng
+        chung thư mục journal (bind mount) và các process con không ghi vào
+        segment của nhau. Journal của các process đã chết trên cùng host (bị
+        kill, container/process con được khởi động lại) được chuyển vào thư
+        mục của process này để `recover()` ghi lại.
+        """
+        return cls(os.path.join(Config.JOURNAL_CONFIG["dir"], process_tag()), host=socket.gethostname())
+
+    def _adopt(self, host: str) -> None:
+        """Chuyển thư mục journal của các process đã chết trên `host` vào thư mục này
+
+        `rename` là atomic nên khi nhiều process cùng khởi động, mỗi journal
+        chỉ được một process nhận.
+        """
+        root = os.path.dirname(self.directory)
+        for entry in os.scandir(root):
+            if not entry.is_dir() or entry.path == self.directory or not is_dead_on_host(entry.name, host):
+                continue
+            try:
+                os.rename(entry.path, os.path.join(self.directory, entry.name))
+            except OSError:
+                # Process khác đã nhận journal này
+                continue
+            logger.info(f"Nhận journal của process đã dừng: {entry.name}")
+
+    @classmethod
+    def _segments(cls, directory: str) -> List[str]:
+        """Segment trong thư mục theo thứ tự ghi, segment của các journal đã nhận (thư mục con) trước"""
+        paths: List[str] = []
+        for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+            if entry.is_dir():
+                paths += cls._segments(entry.path)
+        return paths + sorted(glob.glob(os.path.join(directory, f"*{cls.SUFFIX}")), key=cls._sequence)
+
+    @classmethod
+    def _sequence(cls, path: str) -> int:
+        return int(os.path.basename(path)[: -len(cls.SUFFIX)])
+
+    def _new_path(self) -> str:
+        path = os.path.join(self.directory, f"{self._next:08d}{self.SUFFIX}")
+        self._next += 1
+        return path
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """Thêm một lệnh vào segment hiện tại, ghi xuống đĩa ở lượt `sync` sau"""
+        line = json_util.dumps(record, json_options=JSON_OPTIONS) + "\n"
+        with self._lock:
+            self._lines.append(line)
+
+    def _write_lines(self) -> None:
+        if not self._lines:
+            return
+        if self._file is None:
+            self._path = self._new_path()
+            self._file = open(self._path, "a", encoding="utf-8")
+        self._file.writelines(self._lines)
+        self._file.flush()
+        self._lines = []
+
+    def sync(self) -> None:
+        """Ghi các dòng đang chờ vào segment hiện tại
+
+        Dòng được đẩy xuống OS nên vẫn còn khi process bị kill; chỉ fsync khi
+        đóng segment (nếu bật). Hàm chạy blocking, cần gọi qua `asyncio.to_thread`.
+        """
+        with self._lock:
+            self._write_lines()
+
+    def rotate(self) -> Optional[str]:
+        """Đóng segment hiện tại (chứa đúng các lệnh vừa lấy khỏi buffer) và trả về đường dẫn
+
+        Các dòng chưa sync (tối đa `sync_interval` giây) được ghi trước khi đóng.
+        """
+        with self._lock:
+            self._write_lines()
+            if self._file is None:
+                return None
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._file.close()
+            path, self._path, self._file = self._path, None, None
+        return path
+
+    def keep(self, records: List[Dict[str, Any]]) -> None:
+        """Ghi các lệnh chưa vào được MongoDB vào một segment riêng đã đóng
+
+        Segment này không bị xóa trong lần chạy hiện tại, lần chạy sau
+        `recover()` ghi lại các lệnh trong đó.
+        """
+        if not records:
+            return
+        path = self._new_path()
+        with open(path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json_util.dumps(record, json_options=JSON_OPTIONS) + "\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        logger.warning(f"Giữ {len(records)} lệnh ghi lỗi trong journal: {path}")
+
+    def commit(self, path: Optional[str]) -> None:
+        """Xóa segment sau khi các lệnh trong đó đã được ghi vào MongoDB"""
+        if path is None:
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def recover(self) -> List[Dict[str, Any]]:
+        """Đọc các lệnh còn lại từ lần chạy trước và chuyển sang segment hiện tại
+
+        Segment cũ chỉ bị xóa sau khi các lệnh đã được ghi lại vào segment
+        mới, nên process bị kill giữa chừng vẫn không mất lệnh nào.
+        """
+        records = list(self._read(self._leftover))
+        for record in records:
+            self.append(record)
+        self.sync()
+        for path in self._leftover:
+            self.commit(path)
+        self._remove_empty(self.directory, keep=True)
+        if records:
+            logger.info(f"Đọc lại {len(records)} lệnh ghi từ {len(self._leftover)} segment journal")
+        self._leftover = []
+        return records
+
+    @staticmethod
+    def _read(paths: List[str]) -> Iterator[Dict[str, Any]]:
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json_util.loads(line, json_options=JSON_OPTIONS)
+                    except ValueError:
+                        # Dòng cuối bị cắt dở khi process bị kill lúc đang ghi
+                        logger.warning(f"Bỏ qua dòng journal hỏng trong {path}")
+
+    @classmethod
+    def _remove_empty(cls, directory: str, keep: bool = False) -> None:
+        """Xóa các thư mục rỗng (journal đã nhận và đã ghi lại), giữ `directory` nếu `keep`"""
+        for entry in os.scandir(directory):
+            if entry.is_dir():
+                cls._remove_empty(entry.path)
+        if not keep:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                # Còn segment chưa ghi vào MongoDB
+                pass
+
+    def close(self) -> None:
+        """Đóng journal, không để lại file hay thư mục nếu mọi lệnh đã vào MongoDB"""
+        path = self.rotate()
+        if path is not None:
+            logger.warning(f"Journal còn lệnh chưa ghi vào MongoDB: {path}")
+        self._remove_empty(self.directory)
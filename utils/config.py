@@ -11,16 +11,209 @@ class Config:
     # Cấu hình database
     DATABASE_NAME = os.getenv("DATABASE_NAME")
     MONGO_URL = os.getenv("MONGO_URL")
+
+    # Địa chỉ Pinterest (có thể trỏ tới server giả lập khi kiểm thử)
+    PINTEREST_BASE_URL = os.getenv("PINTEREST_BASE_URL", "https://www.pinterest.com")
+    PINIMG_BASE_URL = os.getenv("PINIMG_BASE_URL", "https://i.pinimg.com")
     
     # Cấu hình crawler
     CRAWLER_CONFIG: Dict[str, Any] = {
         "default_workers": 1,
         "default_batch_size": 50,
+        "default_page_concurrency": 4,  # Số page mở song song trong một worker
+        "queue_max_batches": 4,  # Số batch username đọc sẵn trong queue
+        "keyword_queue_size": 2,  # Số keyword claim sẵn trong queue
+        "queue_poll_interval": 30,  # Giây chờ việc mới ở chế độ follow
         "max_retries": 3,
         "timeout": 60,
+        "page_timeout": 90,  # Timeout tổng cho một profile (giây)
+        "max_scrolls": 75,  # Số lần cuộn tối đa khi tìm username theo keyword
+        "search_response_timeout": 8,  # Giây chờ response tìm kiếm sau mỗi lần cuộn
+        "scroll_delay": (0.5, 1.2),  # Khoảng nghỉ ngẫu nhiên giữa các lần cuộn (giây)
         "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
         "viewport": {"width": 1280, "height": 800},
-        "locale": "en-US"
+        "locale": "en-US",
+        "profile_engine": os.getenv("PROFILE_ENGINE", "http"),  # "http" (fast path) hoặc "browser"
+        "search_engine": os.getenv("SEARCH_ENGINE", "http"),  # "http" (search API) hoặc "browser"
+        "search_concurrency": 16,  # Số keyword chạy song song với search API
+    }
+
+    # Cấu hình thử lại username crawl profile lỗi
+    RETRY_CONFIG: Dict[str, Any] = {
+        "base_delay": 5,  # Giây chờ trước lần thử lại đầu, nhân đôi sau mỗi lần
+        "max_delay": 300,
+        # Số lần thử lại theo loại lỗi, quá số lần thì chuyển vào dead_letters
+        "max_retries": {
+            "timeout": CRAWLER_CONFIG["max_retries"],
+            "error": CRAWLER_CONFIG["max_retries"],
+            "no_props": 2,  # Profile không tồn tại/bị khóa hoặc bị chặn
+            "parse_error": 1,  # Cấu trúc JSON lạ, thử lại ít khi có ích
+            "throttled": CRAWLER_CONFIG["max_retries"],  # HTTP 429/5xx, thử lại sau backoff
+        },
+        "retry_share": 0.5,  # Tỉ lệ tối đa của một batch dành cho username thử lại
+    }
+
+    # Cấu hình lease để nhiều container chia nhau backlog
+    LEASE_CONFIG: Dict[str, Any] = {
+        "lease_seconds": 600,  # Thời hạn lease, gia hạn mỗi 1/3 thời hạn
+        "claim_attempts": 3,  # Số lần thử claim khi bị container khác tranh
+    }
+
+    # Cấu hình write buffer (gom lệnh ghi MongoDB thành bulk_write)
+    WRITE_BUFFER_CONFIG: Dict[str, Any] = {
+        "max_ops": 500,  # Flush khi số lệnh chờ đạt ngưỡng
+        "flush_interval": 2.0,  # Giây giữa các lần flush định kỳ
+    }
+
+    # Cấu hình journal trên đĩa của các lệnh ghi chưa vào MongoDB (đọc lại sau khi process bị kill)
+    JOURNAL_CONFIG: Dict[str, Any] = {
+        "enabled": os.getenv("JOURNAL_ENABLED", "1") == "1",
+        "dir": os.getenv("JOURNAL_DIR", "journal"),  # Mỗi process một thư mục con theo host, tên process và pid
+        "fsync": False,  # fsync khi đóng segment, cần nếu muốn an toàn cả khi mất điện
+        "sync_interval": 0.2,  # Giây giữa hai lần ghi các lệnh mới xuống segment (process bị kill mất tối đa chừng này)
+    }
+
+    # Cấu hình lịch crawl lại (--refresh)
+    SCHEDULER_CONFIG: Dict[str, Any] = {
+        "profile_base_days": 30,  # Chu kỳ crawl lại profile có độ ưu tiên 1
+        "profile_min_days": 3,
+        "profile_max_days": 90,
+        "keyword_base_days": 60,  # Chu kỳ crawl lại keyword không có username mới
+        "keyword_min_days": 7,
+        "keyword_max_days": 180,
+    }
+
+    # Cấu hình keyword
+    KEYWORD_CONFIG: Dict[str, Any] = {
+        "cache_size": 200_000,  # Số keyword đã biết giữ trong cache LRU
+        # Lập kế hoạch keyword theo trie các keyword đã tìm và tỉ lệ username mới
+        "planner": {
+            "enabled": os.getenv("KEYWORD_PLANNER", "1") == "1",
+            "alphabet": "abcdefghijklmnopqrstuvwxyz0123456789",  # Ký tự nối thêm khi mở rộng prefix
+            "max_length": 12,  # Chỉ mở rộng keyword ngắn hơn độ dài này
+            "min_yield": 0.05,  # Tỉ lệ username mới dưới mức này thì không mở rộng
+            "prior_yield": 1.0,  # Tỉ lệ username mới khi chưa có dữ liệu (làm mượt khi quyết định mở rộng)
+            "prior_weight": 10,  # Số kết quả "ảo" theo prior_yield khi làm mượt tỉ lệ
+            "mention_cap": 8,  # Điểm tối đa theo số lần keyword được nhắc tới trong tên profile
+            "mention_refresh": 8,  # Keyword đã đạt mention_cap chỉ ghi lại `mentionedAt` sau mỗi chừng này lần nhắc tới
+            "pending_size": 200000,  # Số keyword chờ crawl được đếm số lần nhắc tới trong bộ nhớ
+        },
+    }
+
+    # Cấu hình HTTP client dùng chung
+    HTTP_CONFIG: Dict[str, Any] = {
+        "max_connections": 50,
+    }
+
+    # Cấu hình tải avatar
+    AVATAR_CONFIG: Dict[str, Any] = {
+        "downloaders": 8,  # Số downloader chạy song song
+        "queue_size": 500,  # Giới hạn số avatar chờ tải
+        "max_retries": 3,
+        "backoff_base": 1.0,  # Giây, nhân đôi sau mỗi lần thử lại
+        "files_per_folder": 5000,  # Số file tối đa trong một thư mục theo ngày
+        "write_batch_size": 50,  # Số avatar ghi/upload trong một lượt
+        "write_flush_interval": 2.0,  # Giây chờ gom đủ batch trước khi ghi
+        # Nơi lưu avatar: "auto" (SFTP khi chạy trong Docker), "local" hoặc "sftp"
+        "storage": os.getenv("AVATAR_STORAGE", "auto"),
+        # Index SQLite URL -> hash nội dung (mặc định trong thư mục avatars, mỗi nơi lưu một file)
+        "index_path": os.getenv("AVATAR_INDEX_PATH"),
+        "revalidate_days": 30,  # Sau số ngày này URL đã biết được kiểm tra lại bằng request có điều kiện
+        # Encode lại avatar và tạo thumbnail trong process pool (cần Pillow)
+        "transcode": {
+            "enabled": os.getenv("AVATAR_TRANSCODE", "0") == "1",
+            "format": os.getenv("AVATAR_FORMAT", "WEBP"),  # WEBP, JPEG hoặc PNG
+            "quality": 80,
+            "max_size": 400,  # Cạnh dài tối đa (px) của ảnh lưu
+            "thumb_size": 96,
+            "workers": None,  # Số process encode, None: một nửa số CPU
+        },
+    }
+
+    # Cấu hình SFTP lưu avatar khi chạy trong Docker
+    SFTP_CONFIG: Dict[str, Any] = {
+        "host": os.getenv("SFTP_HOST", "192.168.161.230"),
+        "username": os.getenv("SFTP_USERNAME", "htsc"),
+        "password": os.getenv("SFTP_PASSWORD", "Htsc@123"),
+        "remote_base_path": "/mnt/data/pinterest/avatars",
+        "pool_size": 2,  # Số phiên SFTP giữ mở đồng thời
+    }
+
+    # Cấu hình chạy nhiều process (mỗi process một event loop)
+    PROCESS_CONFIG: Dict[str, Any] = {
+        "worker_memory_mb": 250,  # RAM ước tính cho mỗi worker (browser context)
+        "max_workers_per_process": 8,  # Số worker async tối đa trong một event loop
+        "max_process_rss_mb": 4096,  # Khởi động lại process khi RSS (gồm browser) vượt ngưỡng
+        "max_restarts": 5,  # Số lần khởi động lại tối đa cho mỗi process
+        "check_interval": 10,  # Giây giữa các lần kiểm tra RSS
+        "progress_interval": 30,  # Giây giữa các lần báo tiến độ
+        "shutdown_timeout": 60,  # Giây chờ process tự dừng trước khi kill
+    }
+
+    # Cấu hình điều chỉnh concurrency (AIMD) và giới hạn tốc độ request tới Pinterest
+    RATE_CONFIG: Dict[str, Any] = {
+        "initial_concurrency": 16,  # Số request đồng thời ban đầu trong một process
+        "min_concurrency": 1,
+        "max_concurrency": 128,
+        "increase_step": 1,  # Tăng thêm sau mỗi cửa sổ ổn định và còn việc chờ
+        "decrease_factor": 0.5,  # Nhân khi bị throttle, lỗi nhiều hoặc thiếu RAM
+        "window_seconds": 5,  # Giây giữa các lần điều chỉnh
+        "min_samples": 10,  # Số request tối thiểu trong cửa sổ để điều chỉnh
+        "max_error_rate": 0.2,  # Tỉ lệ lỗi tối đa trong cửa sổ
+        "max_latency": 15,  # Giây, p90 latency tối đa trong cửa sổ
+        "rss_soft_limit_ratio": 0.8,  # Giảm concurrency khi RSS vượt tỉ lệ này của max_process_rss_mb
+        # Token bucket của cả container (0: không giới hạn, mặc định để không đổi tốc độ
+        # của các deployment đang chạy), chia đều cho các process khi chạy --processes;
+        # nhiều container thì tốc độ tổng là số container x giá trị này
+        "requests_per_second": float(os.getenv("RATE_LIMIT_RPS", "0")),
+        "burst": 40,
+    }
+
+    # Cấu hình metrics (endpoint Prometheus local và log tóm tắt)
+    METRICS_CONFIG: Dict[str, Any] = {
+        "host": os.getenv("METRICS_HOST", "127.0.0.1"),
+        "port": int(os.getenv("METRICS_PORT", "9464")),  # 0: không mở endpoint /metrics
+        "summary_interval": 60,  # Giây giữa các lần log tóm tắt, 0: tắt
+        # Bucket (giây) của histogram thời gian theo stage
+        "buckets": (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+    }
+
+    # Cấu hình browser pool
+    BROWSER_POOL_CONFIG: Dict[str, Any] = {
+        "headless": True,
+        "max_pages_per_context": 200,  # Tạo lại context sau số page này
+        "max_rss_mb": 2048,  # Khởi động lại browser khi RSS vượt ngưỡng (MB)
+        # Chế độ nhẹ: tắt GPU/extension, viewport nhỏ
+        "minimal_profile": os.getenv("BROWSER_MINIMAL_PROFILE", "1") == "1",
+        "minimal_launch_args": [
+            "--disable-gpu",
+            "--disable-extensions",
+            "--disable-dev-shm-usage",
+            "--disable-background-networking",
+            "--disable-component-update",
+            "--disable-default-apps",
+            "--disable-sync",
+            "--mute-audio",
+            "--no-first-run",
+        ],
+        "minimal_viewport": {"width": 800, "height": 600},
+    }
+
+    # Cấu hình chặn request không cần thiết trên browser
+    REQUEST_FILTER_CONFIG: Dict[str, Any] = {
+        "blocked_resource_types": [
+            t for t in os.getenv("BLOCKED_RESOURCE_TYPES", "image,media,font,stylesheet").split(",") if t
+        ],
+        "blocked_domains": [
+            "google-analytics.com",
+            "googletagmanager.com",
+            "doubleclick.net",
+            "googlesyndication.com",
+            "facebook.net",
+            "ct.pinterest.com",
+        ],
+        # Kích thước trung bình (KB) để ước tính số byte tiết kiệm
+        "estimated_size_kb": {"image": 40, "media": 500, "font": 40, "stylesheet": 60, "tracker": 20, "other": 10},
     }
     
     # Cấu hình thư mục
@@ -36,18 +229,6 @@ class Config:
                 os.makedirs(directory)
     
     @classmethod
-    def get_avatar_path(cls, username: str) -> str:
-        """Lấy đường dẫn lưu avatar cho username
-        
-        Args:
-            username (str): Tên người dùng
-            
-        Returns:
-            str: Đường dẫn đầy đủ để lưu avatar
-        """
-        from datetime import datetime
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        folder_path = os.path.join(cls.DIRECTORIES["avatars"], current_date)
-        if not os.path.exists(folder_path):
-            os.makedirs(folder_path)
-        return os.path.join(folder_path, f"{username}.jpg") 
\ No newline at end of file
+    def get_profile_url(cls, username: str) -> str:
+        """Lấy URL trang profile của username"""
+        return f"{cls.PINTEREST_BASE_URL}/{username}/"
@@ -0,0 +1,30 @@
+import multiprocessing
+import os
+import socket
+
+
+def process_tag() -> str:
+    """Định danh process hiện tại: `<host>_<tên process>_<pid>`"""
+    return f"{socket.gethostname()}_{multiprocessing.current_process().name}_{os.getpid()}"
+
+
+def is_dead_on_host(tag: str, host: str) -> bool:
+    """Process có định danh `tag` (theo `process_tag`) chạy trên `host` và đã dừng
+
+    Chỉ kiểm tra được process trên cùng host: process của host khác luôn
+    được coi là còn chạy.
+    """
+    parts = tag.split("_")
+    return len(parts) >= 3 and parts[0] == host and parts[-1].isdigit() and not _is_alive(int(parts[-1]))
+
+
+def _is_alive(pid: int) -> bool:
+    """Process `pid` còn chạy trên host này"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Process của user khác
+        return True
+    return True